@@ -1,12 +1,33 @@
 """Configuration loader for Reddit Sync.
 """
 import os
+import re
 from pathlib import Path
 from dotenv import load_dotenv
 
 REPO_ROOT = Path(__file__).resolve().parent.parent
 DEFAULT_DB_PATH = './news.db'
 DEFAULT_MEDIA_DIR = './media'
+DEFAULT_RENDITIONS_MAX_BYTES = 256 * 1024 * 1024
+
+# Pragmas applied to every SQLite connection, per SQLITE_PROFILE. "performance"
+# lets the web UI read while the sync engine writes (WAL), trades the fsync per
+# commit for one per checkpoint (synchronous=NORMAL is still crash-safe under
+# WAL) and waits on a busy lock instead of failing with "database is locked".
+# "default" leaves SQLite's own settings alone.
+SQLITE_PROFILES = {
+    'performance': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': '-65536',  # negative = KiB, i.e. 64 MiB
+        'mmap_size': '268435456',  # 256 MiB
+        'temp_store': 'MEMORY',
+        'busy_timeout': '5000',  # milliseconds
+    },
+    'default': {},
+}
+DEFAULT_SQLITE_PROFILE = 'performance'
+PRAGMA_VALUE_RE = re.compile(r'^-?[A-Za-z0-9_]+$')
 
 
 def resolve_repo_path(value: str) -> Path:
@@ -33,6 +54,44 @@ def media_dir_path() -> Path:
     return resolve_repo_path(os.getenv('MEDIA_DIR', DEFAULT_MEDIA_DIR))
 
 
+def renditions_dir_path() -> Path:
+    """Cache directory for web UI previews and thumbnails.
+
+    Defaults to a sibling of MEDIA_DIR (media/ -> media-renditions/), so the
+    sync engine never mistakes a rendition for downloaded media.
+    """
+    load_dotenv()
+    value = os.getenv('RENDITIONS_DIR')
+    if value:
+        return resolve_repo_path(value)
+    media_dir = media_dir_path()
+    return media_dir.with_name(f'{media_dir.name}-renditions')
+
+
+def sqlite_pragmas() -> dict[str, str]:
+    """Env-driven SQLite pragmas: SQLITE_PROFILE plus SQLITE_<PRAGMA> overrides.
+
+    e.g. SQLITE_PROFILE=performance SQLITE_CACHE_SIZE=-131072. Values are
+    interpolated into PRAGMA statements, so anything but a plain word or
+    integer is rejected.
+    """
+    load_dotenv()
+    profile = os.getenv('SQLITE_PROFILE', DEFAULT_SQLITE_PROFILE).strip().lower()
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(
+            f"Unknown SQLITE_PROFILE {profile!r}; expected one of {', '.join(SQLITE_PROFILES)}"
+        )
+    pragmas = dict(SQLITE_PROFILES[profile])
+    for name in SQLITE_PROFILES['performance']:
+        override = os.getenv(f'SQLITE_{name.upper()}', '').strip()
+        if override:
+            pragmas[name] = override
+    for name, value in pragmas.items():
+        if not PRAGMA_VALUE_RE.match(value):
+            raise ValueError(f"Invalid value for SQLite pragma {name}: {value!r}")
+    return pragmas
+
+
 class Config:
     """Configuration class for Reddit Sync."""
     
@@ -62,6 +121,12 @@ class Config:
         self.media_dir = media_dir_path()
         self.max_media_size = int(os.getenv('MAX_MEDIA_SIZE', 50 * 1024 * 1024))  # 50MB
         self.max_concurrent_downloads = int(os.getenv('MAX_CONCURRENT_DOWNLOADS', 5))
+        self.reddit_fetch_threads = int(os.getenv('REDDIT_FETCH_THREADS', 4))
+        self.reddit_rate_limit = int(os.getenv('REDDIT_RATE_LIMIT', 600))  # per 10 minutes
+        self.sync_workers = int(os.getenv('SYNC_WORKERS', 4))
+        self.metrics_refresh_batches = int(os.getenv('METRICS_REFRESH_BATCHES', 10))
+        self.metrics_raw_days = int(os.getenv('METRICS_RAW_DAYS', 2))
+        self.metrics_retention_days = int(os.getenv('METRICS_RETENTION_DAYS', 30))
 
         # Create database URL for SQLAlchemy
         self.database_url = f"sqlite+aiosqlite:///{self.db_path}"
@@ -81,5 +146,11 @@ def load_config():
         'DB_PATH': config.db_path,
         'MEDIA_DIR': str(config.media_dir),
         'MAX_MEDIA_SIZE': config.max_media_size,
-        'MAX_CONCURRENT_DOWNLOADS': config.max_concurrent_downloads
+        'MAX_CONCURRENT_DOWNLOADS': config.max_concurrent_downloads,
+        'REDDIT_FETCH_THREADS': config.reddit_fetch_threads,
+        'REDDIT_RATE_LIMIT': config.reddit_rate_limit,
+        'SYNC_WORKERS': config.sync_workers,
+        'METRICS_REFRESH_BATCHES': config.metrics_refresh_batches,
+        'METRICS_RAW_DAYS': config.metrics_raw_days,
+        'METRICS_RETENTION_DAYS': config.metrics_retention_days
     }
\ No newline at end of file
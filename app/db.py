@@ -6,10 +6,13 @@ operations for the Reddit Sync application.
 """
 import logging
 import os
+import time
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, delete, event, func, or_, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import (
     create_async_engine,
     async_sessionmaker,
@@ -19,11 +22,15 @@ from sqlalchemy.ext.asyncio import (
 from sqlalchemy.exc import IntegrityError
 
 try:
-    from .config import database_path
-    from .models import Base, Subscription, News, Media
+    from .config import database_path, sqlite_pragmas
+    from .migrations import run_migrations
+    from .models import Base, Subscription, News, Media, MediaJob, NewsMetric
+    from .utils import next_metrics_refresh
 except ImportError:
-    from config import database_path
-    from models import Base, Subscription, News, Media
+    from config import database_path, sqlite_pragmas
+    from migrations import run_migrations
+    from models import Base, Subscription, News, Media, MediaJob, NewsMetric
+    from utils import next_metrics_refresh
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +45,31 @@ def get_database_url(db_path: str) -> str:
     return f"sqlite+aiosqlite:///{db_file}"
 
 
+def install_pragmas(async_engine: AsyncEngine, pragmas: Dict[str, str]) -> None:
+    """Apply the SQLite pragmas to every connection the engine opens.
+
+    Most pragmas are per connection, so they are set from the pool's
+    connect event rather than once at startup.
+    """
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+async def effective_pragmas(names) -> Dict[str, Any]:
+    """Read back the pragma values a pooled connection actually runs with."""
+    async with engine.connect() as conn:
+        return {
+            name: (await conn.exec_driver_sql(f"PRAGMA {name}")).scalar()
+            for name in names
+        }
+
+
 async def init_db(db_path: Optional[str] = None) -> None:
     """Initialize database with schema and default data.
 
@@ -53,11 +85,15 @@ async def init_db(db_path: Optional[str] = None) -> None:
 
     database_url = get_database_url(db_path)
     engine = create_async_engine(database_url, echo=False)
+    pragmas = sqlite_pragmas()
+    install_pragmas(engine, pragmas)
     session_factory = async_sessionmaker(engine, expire_on_commit=False)
 
-    # Create all tables
+    # Create missing tables, then bring older database files up to date
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        version = await conn.run_sync(run_migrations)
+    logger.info(f"Database schema at version {version}")
     
     # Seed subscriptions from DEFAULT_SUBSCRIPTIONS (comma-separated
     # subreddit names, optional) — empty by default, no hardcoded seed
@@ -72,6 +108,15 @@ async def init_db(db_path: Optional[str] = None) -> None:
                     session.add(Subscription(thread_id=thread_id, title=f"r/{thread_id}"))
             await session.commit()
 
+    # Some pragmas fall back silently (e.g. WAL on a network filesystem),
+    # so log what is really in effect rather than what was requested
+    if pragmas:
+        applied = await effective_pragmas(pragmas)
+        logger.info(
+            "SQLite pragmas in effect: "
+            + ", ".join(f"{name}={value}" for name, value in applied.items())
+        )
+
     logger.info("Database initialized successfully")
 
 
@@ -121,6 +166,60 @@ async def add_subscription(thread_id: str, title: str = None) -> None:
             logger.debug(f"Subscription already exists: {thread_id}")
 
 
+async def get_sync_cursor(thread_id: str) -> Optional[Dict[str, Any]]:
+    """Get the newest stored post of a subscription, None before its first full sync.
+
+    gap_after is the fullname an unfinished walk stopped at, or None.
+    """
+    async with get_session() as session:
+        stmt = select(
+            Subscription.last_fullname, Subscription.last_created_utc, Subscription.gap_fullname
+        ).where(Subscription.thread_id == thread_id)
+        row = (await session.execute(stmt)).one_or_none()
+        if row is None or row.last_fullname is None or row.last_created_utc is None:
+            return None
+        return {"fullname": row.last_fullname, "created_utc": row.last_created_utc,
+                "gap_after": row.gap_fullname}
+
+
+async def update_sync_cursor(thread_id: str, fullname: str, created_utc: int) -> None:
+    """Advance a subscription's sync cursor to its newest stored post, closing any gap."""
+    async with get_session() as session:
+        stmt = (
+            update(Subscription)
+            .where(Subscription.thread_id == thread_id)
+            .values(last_fullname=fullname, last_created_utc=created_utc, gap_fullname=None)
+        )
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def set_sync_gap(thread_id: str, fullname: str) -> None:
+    """Record where a walk stopped short of the sync cursor; the cursor stays put."""
+    async with get_session() as session:
+        stmt = (
+            update(Subscription)
+            .where(Subscription.thread_id == thread_id)
+            .values(gap_fullname=fullname)
+        )
+        await session.execute(stmt)
+        await session.commit()
+
+
+async def get_newest_thread_post(thread_id: str) -> Optional[Dict[str, Any]]:
+    """external_id and created_utc of a subscription's newest stored post."""
+    async with get_session() as session:
+        stmt = (
+            select(News.external_id, News.created_utc)
+            .where(News.thread_id == thread_id, News.created_utc.is_not(None))
+            .order_by(News.created_utc.desc(), News.id.desc())
+            .limit(1)
+        )
+        row = (await session.execute(stmt)).one_or_none()
+        return None if row is None else {"external_id": row.external_id,
+                                         "created_utc": row.created_utc}
+
+
 async def news_exists(external_id: str) -> bool:
     """Check if news item already exists."""
     async with get_session() as session:
@@ -129,21 +228,27 @@ async def news_exists(external_id: str) -> bool:
         return result.scalar_one_or_none() is not None
 
 
+def news_values(news_item: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a post dict from reddit_client onto News column values."""
+    return {
+        "external_id": news_item["external_id"],
+        "thread_id": news_item.get("thread_id"),
+        "author": news_item.get("author"),
+        "created_utc": news_item.get("created_utc"),
+        "title": news_item.get("title"),
+        "body": news_item.get("body"),
+        "media_url": news_item.get("media_url"),
+        "score": news_item.get("score", 0),
+        "comment_count": news_item.get("comment_count", 0),
+        "raw_json": news_item.get("raw_json"),
+        "metrics_due_at": next_metrics_refresh(news_item.get("created_utc")),
+    }
+
+
 async def add_news(news_item: Dict[str, Any]) -> None:
     """Add new news item."""
     async with get_session() as session:
-        news = News(
-            external_id=news_item["external_id"],
-            thread_id=news_item.get("thread_id"),
-            author=news_item.get("author"),
-            created_utc=news_item.get("created_utc"),
-            title=news_item.get("title"),
-            body=news_item.get("body"),
-            media_url=news_item.get("media_url"),
-            score=news_item.get("score", 0),
-            comment_count=news_item.get("comment_count", 0),
-            raw_json=news_item.get("raw_json"),
-        )
+        news = News(**news_values(news_item))
         session.add(news)
         try:
             await session.commit()
@@ -153,6 +258,70 @@ async def add_news(news_item: Dict[str, Any]) -> None:
             logger.debug(f"News item already exists: {news_item['external_id']}")
 
 
+async def upsert_news_batch(posts: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """Store a page of posts in one transaction.
+
+    A single IN (...) lookup splits the page into new and already stored ids,
+    then one INSERT ... ON CONFLICT(external_id) DO UPDATE writes every row:
+    new posts are inserted, known ones get their score and comment count
+    refreshed. A metrics snapshot per post goes to news_metrics in the same
+    transaction, and the session commits once for the whole page.
+
+    Args:
+        posts: Post dicts as produced by reddit_client.submission_to_dict
+
+    Returns:
+        (inserted, updated) row counts
+    """
+    # The listing can shift while it is paged, so a post may show up twice;
+    # keep the latest copy, ON CONFLICT cannot touch one row twice per statement
+    rows = {post["external_id"]: news_values(post) for post in posts}
+    if not rows:
+        return 0, 0
+    observed_at = int(time.time())
+
+    async with get_session() as session:
+        stmt = select(News.external_id).where(News.external_id.in_(list(rows)))
+        result = await session.execute(stmt)
+        existing = set(result.scalars().all())
+
+        insert_stmt = sqlite_insert(News).values(list(rows.values()))
+        insert_stmt = insert_stmt.on_conflict_do_update(
+            index_elements=[News.external_id],
+            set_={
+                "score": insert_stmt.excluded.score,
+                "comment_count": insert_stmt.excluded.comment_count,
+                "metrics_due_at": insert_stmt.excluded.metrics_due_at,
+            },
+        ).returning(News.id, News.external_id)
+        stored = (await session.execute(insert_stmt)).all()
+        await add_metric_snapshots(session, [
+            {
+                "news_id": news_id,
+                "observed_at": observed_at,
+                "score": rows[external_id]["score"] or 0,
+                "comment_count": rows[external_id]["comment_count"] or 0,
+            }
+            for news_id, external_id in stored
+        ])
+        await session.commit()
+
+    inserted = len(rows) - len(existing)
+    logger.debug(f"Upserted {len(rows)} news items ({inserted} new, {len(existing)} updated)")
+    return inserted, len(existing)
+
+
+async def add_metric_snapshots(session: AsyncSession, snapshots: List[Dict[str, Any]]) -> None:
+    """Append news_metrics rows in one executemany INSERT (caller commits).
+
+    A second snapshot of the same post within the same second is dropped.
+    """
+    if not snapshots:
+        return
+    stmt = sqlite_insert(NewsMetric).on_conflict_do_nothing()
+    await session.execute(stmt, snapshots)
+
+
 async def update_news_media(external_id: str, media_uid: str) -> None:
     """Update news item with downloaded media UID."""
     async with get_session() as session:
@@ -178,33 +347,271 @@ async def update_news_metrics(external_id: str, score: int = None, comment_count
                 news.score = score
             if comment_count is not None:
                 news.comment_count = comment_count
+            await add_metric_snapshots(session, [{
+                "news_id": news.id,
+                "observed_at": int(time.time()),
+                "score": news.score or 0,
+                "comment_count": news.comment_count or 0,
+            }])
             await session.commit()
             logger.debug(f"Updated metrics for news: {external_id} (score={score}, comments={comment_count})")
 
 
+async def get_news_due_for_refresh(now: int, limit: int = 100) -> List[Dict[str, Any]]:
+    """Get the posts whose metrics refresh is due, most overdue first."""
+    async with get_session() as session:
+        stmt = (
+            select(News.id, News.external_id, News.created_utc, News.score, News.comment_count)
+            .where(News.metrics_due_at <= now)
+            .order_by(News.metrics_due_at)
+            .limit(limit)
+        )
+        result = await session.execute(stmt)
+        return [dict(row._mapping) for row in result]
+
+
+async def update_news_metrics_batch(rows: List[Dict[str, Any]]) -> None:
+    """Write refreshed metrics for many posts with one executemany UPDATE.
+
+    Args:
+        rows: Dicts with id, score, comment_count and metrics_due_at
+    """
+    if not rows:
+        return
+    observed_at = int(time.time())
+    async with get_session() as session:
+        await session.execute(update(News), rows)
+        await add_metric_snapshots(session, [
+            {
+                "news_id": row["id"],
+                "observed_at": observed_at,
+                "score": row["score"] or 0,
+                "comment_count": row["comment_count"] or 0,
+            }
+            for row in rows
+        ])
+        await session.commit()
+    logger.debug(f"Refreshed metrics for {len(rows)} news items")
+
+
+async def compact_news_metrics(
+    now: Optional[int] = None,
+    raw_seconds: int = 2 * 86400,
+    retention_seconds: int = 30 * 86400,
+) -> int:
+    """Downsample and expire news_metrics so it cannot grow without bound.
+
+    Snapshots younger than raw_seconds are kept as written; older ones are
+    thinned to the first snapshot per post and hour, and anything older than
+    retention_seconds is deleted.
+
+    Returns:
+        Number of deleted rows
+    """
+    now = int(time.time()) if now is None else now
+    raw_cutoff = now - raw_seconds
+    hour = NewsMetric.observed_at // 3600
+    kept = (
+        select(NewsMetric.news_id, func.min(NewsMetric.observed_at))
+        .where(NewsMetric.observed_at < raw_cutoff)
+        .group_by(NewsMetric.news_id, hour)
+    )
+    async with get_session() as session:
+        expired = await session.execute(
+            delete(NewsMetric).where(NewsMetric.observed_at < now - retention_seconds)
+        )
+        thinned = await session.execute(
+            delete(NewsMetric).where(
+                NewsMetric.observed_at < raw_cutoff,
+                tuple_(NewsMetric.news_id, NewsMetric.observed_at).not_in(kept),
+            )
+        )
+        await session.commit()
+    deleted = expired.rowcount + thinned.rowcount
+    logger.info(f"Compacted news_metrics: {deleted} snapshots removed")
+    return deleted
+
+
+def news_velocity_query(since: int, limit: int = 50):
+    """SELECT behind get_news_velocity, separate so its plan can be checked."""
+    # Materialized first: left to inline it, SQLite walks the whole primary
+    # key to spare the window functions a sort, although a window is only a
+    # small slice of the history
+    recent = (
+        select(NewsMetric.news_id, NewsMetric.observed_at,
+               NewsMetric.score, NewsMetric.comment_count)
+        .where(NewsMetric.observed_at >= since)
+        .cte("recent_metrics")
+        .prefix_with("MATERIALIZED")
+    )
+    whole_partition = {
+        "partition_by": recent.c.news_id,
+        "order_by": recent.c.observed_at,
+        "range_": (None, None),
+    }
+    window = (
+        select(
+            recent.c.news_id,
+            func.first_value(recent.c.observed_at).over(**whole_partition).label("first_at"),
+            func.last_value(recent.c.observed_at).over(**whole_partition).label("last_at"),
+            func.first_value(recent.c.score).over(**whole_partition).label("first_score"),
+            func.last_value(recent.c.score).over(**whole_partition).label("last_score"),
+            func.first_value(recent.c.comment_count)
+            .over(**whole_partition).label("first_comments"),
+            func.last_value(recent.c.comment_count)
+            .over(**whole_partition).label("last_comments"),
+        )
+        .distinct()
+        .subquery()
+    )
+    hours = (window.c.last_at - window.c.first_at) / 3600.0
+    score_per_hour = ((window.c.last_score - window.c.first_score) / hours).label("score_per_hour")
+    stmt = (
+        select(
+            window.c.news_id,
+            News.external_id,
+            (window.c.last_score - window.c.first_score).label("score_delta"),
+            (window.c.last_comments - window.c.first_comments).label("comment_delta"),
+            hours.label("hours"),
+            score_per_hour,
+        )
+        .join(News, News.id == window.c.news_id)
+        .where(window.c.last_at > window.c.first_at)
+        .order_by(score_per_hour.desc())
+        .limit(limit)
+    )
+    return stmt
+
+
+async def get_news_velocity(since: int, limit: int = 50) -> List[Dict[str, Any]]:
+    """Get the fastest rising posts by score gained per hour since a time.
+
+    The ix_news_metrics_observed_at range scan reads only the snapshots in
+    the window; window functions then compare each post's first and last
+    of them. Posts with fewer than two snapshots in the window are left out.
+
+    Returns:
+        Dicts with news_id, external_id, score_delta, comment_delta, hours and
+        score_per_hour, fastest first
+    """
+    async with get_session() as session:
+        result = await session.execute(news_velocity_query(since, limit))
+        return [dict(row._mapping) for row in result]
+
+
 async def add_media(
     uid_filename: str,
     original_url: str,
     content_type: str,
     size_bytes: int,
     news_external_id: str = None,
-) -> None:
-    """Add new media record."""
+    kind: Optional[str] = None,
+    sha256: Optional[str] = None,
+) -> str:
+    """Record a downloaded file and point the news item at it.
+
+    Files are content-addressed: when a row with the same sha256 already
+    exists (a crosspost or repost of the same bytes), its refcount goes up
+    instead of a second row being added. Returns the stored uid_filename.
+    """
     async with get_session() as session:
-        media = Media(
+        stmt = sqlite_insert(Media).values(
             uid_filename=uid_filename,
             original_url=original_url,
             content_type=content_type,
+            kind=kind,
             size_bytes=size_bytes,
+            sha256=sha256,
+            refcount=1 if news_external_id else 0,
             news_external_id=news_external_id,
         )
-        session.add(media)
+        if sha256 is not None:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Media.sha256],
+                set_={"refcount": Media.refcount + (1 if news_external_id else 0)},
+            )
         try:
-            await session.commit()
-            logger.debug(f"Added media record: {uid_filename}")
+            stored = (await session.execute(stmt.returning(Media.uid_filename))).scalar_one()
         except IntegrityError:
+            # uid_filename or news_external_id already recorded: point the
+            # post at that row, or it stays pending and is downloaded again
             await session.rollback()
             logger.debug(f"Media record already exists: {uid_filename}")
+            return await link_existing_media(session, uid_filename, news_external_id)
+        if news_external_id:
+            await session.execute(
+                update(News)
+                .where(News.external_id == news_external_id)
+                .values(media_uid=stored)
+            )
+        await session.commit()
+        logger.debug(f"Added media record: {stored}")
+        return stored
+
+
+async def link_existing_media(
+    session: AsyncSession,
+    uid_filename: str,
+    news_external_id: Optional[str],
+) -> str:
+    """Point a news item at the media row that blocked add_media's insert.
+
+    The row with the same uid_filename wins; failing that, the one already
+    recorded for the post. Returns its uid_filename, which differs from the
+    argument when the freshly downloaded file is a duplicate nothing uses.
+    """
+    existing = (await session.execute(
+        select(Media.uid_filename)
+        .where(or_(Media.uid_filename == uid_filename,
+                   Media.news_external_id == news_external_id))
+        .order_by((Media.uid_filename == uid_filename).desc())
+        .limit(1)
+    )).scalar_one_or_none()
+    if existing is None:
+        return uid_filename
+    if news_external_id:
+        linked = await session.execute(
+            update(News)
+            .where(News.external_id == news_external_id)
+            .where(func.coalesce(News.media_uid, "") != existing)
+            .values(media_uid=existing)
+        )
+        if linked.rowcount:
+            await session.execute(
+                update(Media)
+                .where(Media.uid_filename == existing)
+                .values(refcount=func.coalesce(Media.refcount, 0) + 1)
+            )
+        await session.commit()
+    return existing
+
+
+async def reuse_media(news_external_id: str, uid_filename: str) -> None:
+    """Point a news item at an already stored file and count the reference."""
+    async with get_session() as session:
+        await session.execute(
+            update(Media)
+            .where(Media.uid_filename == uid_filename)
+            .values(refcount=func.coalesce(Media.refcount, 0) + 1)
+        )
+        await session.execute(
+            update(News)
+            .where(News.external_id == news_external_id)
+            .values(media_uid=uid_filename)
+        )
+        await session.commit()
+
+
+async def get_media_by_url(original_url: str) -> Optional[Dict[str, Any]]:
+    """Return the stored file an earlier download of this URL produced, if any."""
+    async with get_session() as session:
+        stmt = (
+            select(Media.uid_filename, Media.sha256, Media.refcount)
+            .where(Media.original_url == original_url)
+            .limit(1)
+        )
+        row = (await session.execute(stmt)).first()
+        return dict(row._mapping) if row else None
 
 
 async def get_pending_media() -> List[Dict[str, Any]]:
@@ -228,15 +635,101 @@ async def get_pending_media() -> List[Dict[str, Any]]:
         ]
 
 
-async def get_news_by_thread(thread_id: str, limit: int = 100) -> List[Dict[str, Any]]:
-    """Get news items for a specific thread."""
+async def enqueue_media_jobs() -> int:
+    """Queue a download job for every post still waiting for its media.
+
+    One INSERT ... SELECT over the pending-media index; posts that already
+    have a job (pending or failed for good) are left alone. Returns the
+    number of jobs added.
+    """
+    async with get_session() as session:
+        pending = select(News.external_id, News.media_url).where(
+            News.media_url.isnot(None),
+            News.media_uid.is_(None),
+        )
+        stmt = (
+            sqlite_insert(MediaJob)
+            .from_select([MediaJob.news_external_id, MediaJob.url], pending)
+            .on_conflict_do_nothing()
+        )
+        result = await session.execute(stmt)
+        await session.commit()
+        return result.rowcount
+
+
+async def claim_media_jobs(
+    limit: int = 100,
+    lease_seconds: int = 600,
+    now: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Claim up to limit due jobs, oldest due first, and count the attempt.
+
+    Claimed jobs are leased for lease_seconds: they are not due again before
+    that unless finish_media_job or fail_media_job runs first.
+    """
+    now = int(time.time()) if now is None else now
+    async with get_session() as session:
+        stmt = (
+            select(MediaJob.id, MediaJob.news_external_id, MediaJob.url, MediaJob.attempts)
+            .where(MediaJob.status == "pending", MediaJob.next_attempt_at <= now)
+            .order_by(MediaJob.next_attempt_at, MediaJob.id)
+            .limit(limit)
+        )
+        jobs = [dict(row._mapping) for row in await session.execute(stmt)]
+        if not jobs:
+            return []
+        await session.execute(
+            update(MediaJob)
+            .where(MediaJob.id.in_([job["id"] for job in jobs]))
+            .values(attempts=MediaJob.attempts + 1, next_attempt_at=now + lease_seconds)
+        )
+        await session.commit()
+    for job in jobs:
+        job["attempts"] += 1
+    return jobs
+
+
+async def finish_media_job(job_id: int) -> None:
+    """Drop a job whose post now has its media."""
+    async with get_session() as session:
+        await session.execute(delete(MediaJob).where(MediaJob.id == job_id))
+        await session.commit()
+
+
+async def fail_media_job(job_id: int, error: str, retry_at: Optional[int]) -> None:
+    """Record a failed attempt: retry at retry_at, or give up when it is None."""
+    values = {"last_error": error[:1000]}
+    if retry_at is None:
+        values["status"] = "failed"
+    else:
+        values["next_attempt_at"] = retry_at
+    async with get_session() as session:
+        await session.execute(update(MediaJob).where(MediaJob.id == job_id).values(**values))
+        await session.commit()
+
+
+async def get_news_by_thread(
+    thread_id: str,
+    limit: int = 100,
+    before: Optional[Tuple[int, int]] = None,
+) -> List[Dict[str, Any]]:
+    """Get news items for a specific thread, newest first.
+
+    Args:
+        thread_id: Subreddit the news belong to
+        limit: Maximum items to return
+        before: (created_utc, id) of the last item already seen; only older
+            items are returned (keyset pagination)
+    """
     async with get_session() as session:
         stmt = (
             select(News)
             .where(News.thread_id == thread_id)
-            .order_by(News.created_utc.desc())
+            .order_by(News.created_utc.desc(), News.id.desc())
             .limit(limit)
         )
+        if before is not None:
+            stmt = stmt.where(tuple_(News.created_utc, News.id) < before)
         result = await session.execute(stmt)
         news_items = result.scalars().all()
         
@@ -259,6 +752,104 @@ async def get_news_by_thread(thread_id: str, limit: int = 100) -> List[Dict[str,
         ]
 
 
+# Columns the news listings render; body and raw_json are never loaded for them
+NEWS_LIST_COLUMNS = (
+    News.id,
+    News.external_id,
+    News.thread_id,
+    News.title,
+    News.author,
+    News.media_uid,
+    News.score,
+    News.comment_count,
+    News.created_utc,
+    News.added_at,
+)
+
+
+async def fetch_keyset_page(
+    stmt, limit: int, key, ranges: Tuple = (None,)
+) -> Tuple[List[Dict[str, Any]], Optional[Tuple]]:
+    """Run a keyset-ordered listing query and compute the next page's cursor.
+
+    ranges are WHERE clauses (None for none) that continue the listing one
+    after another (see keyset_ranges); each runs only while the page is
+    still short. One extra row is fetched to tell whether another page
+    follows.
+    """
+    items: List[Dict[str, Any]] = []
+    async with get_session() as session:
+        for clause in ranges:
+            page = stmt if clause is None else stmt.where(clause)
+            result = await session.execute(page.limit(limit + 1 - len(items)))
+            items.extend(dict(row._mapping) for row in result)
+            if len(items) > limit:
+                break
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, key(items[-1])
+
+
+def keyset_ranges(sort_column, before: Optional[Tuple[Any, int]]) -> Tuple:
+    """Index ranges following a (sort key, id) cursor in (key DESC, id DESC) order.
+
+    SQLite sorts NULL keys after every other key in descending order, and a
+    row-value comparison against NULL is never true, so the NULL tail is a
+    range of its own: after a real key it follows in full, after a NULL key
+    only its lower ids do. Kept as separate queries, each stays one index
+    range instead of an OR the planner can only filter.
+    """
+    if before is None:
+        return (None,)
+    key, news_id = before
+    if key is None:
+        return (and_(sort_column.is_(None), News.id < news_id),)
+    return (tuple_(sort_column, News.id) < before, sort_column.is_(None))
+
+
+async def get_news_page(
+    before: Optional[Tuple[datetime, int]] = None,
+    limit: int = 50,
+) -> Tuple[List[Dict[str, Any]], Optional[Tuple[datetime, int]]]:
+    """Get one page of news, most recently added first.
+
+    Pages are cut by the (added_at, id) of the previous page's last item,
+    which the added_at index answers directly, so a page deep into the
+    archive costs the same as the first one.
+
+    Returns:
+        (items, cursor for the next page or None on the last page)
+    """
+    stmt = select(*NEWS_LIST_COLUMNS).order_by(News.added_at.desc(), News.id.desc())
+    return await fetch_keyset_page(
+        stmt, limit, lambda item: (item["added_at"], item["id"]),
+        keyset_ranges(News.added_at, before))
+
+
+async def get_thread_news_page(
+    thread_id: str,
+    before: Optional[Tuple[int, int]] = None,
+    limit: int = 50,
+) -> Tuple[List[Dict[str, Any]], Optional[Tuple[int, int]]]:
+    """Get one page of a subscription's news, newest post first.
+
+    Same keyset scheme as get_news_page on (created_utc, id), served by the
+    (thread_id, created_utc) index.
+
+    Returns:
+        (items, cursor for the next page or None on the last page)
+    """
+    stmt = (
+        select(*NEWS_LIST_COLUMNS)
+        .where(News.thread_id == thread_id)
+        .order_by(News.created_utc.desc(), News.id.desc())
+    )
+    return await fetch_keyset_page(
+        stmt, limit, lambda item: (item["created_utc"], item["id"]),
+        keyset_ranges(News.created_utc, before))
+
+
 async def get_media_info(uid_filename: str) -> Optional[Dict[str, Any]]:
     """Get media information by UID filename."""
     async with get_session() as session:
@@ -272,7 +863,21 @@ async def get_media_info(uid_filename: str) -> Optional[Dict[str, Any]]:
                 "uid_filename": media.uid_filename,
                 "original_url": media.original_url,
                 "content_type": media.content_type,
+                "kind": media.kind,
                 "size_bytes": media.size_bytes,
+                "sha256": media.sha256,
+                "refcount": media.refcount,
                 "saved_at": media.saved_at,
             }
-        return None
\ No newline at end of file
+        return None
+
+
+async def set_media_type(uid_filename: str, content_type: str, kind: str) -> None:
+    """Store the sniffed type of a media file downloaded before kinds existed."""
+    async with get_session() as session:
+        await session.execute(
+            update(Media)
+            .where(Media.uid_filename == uid_filename)
+            .values(content_type=content_type, kind=kind)
+        )
+        await session.commit()
\ No newline at end of file
@@ -6,6 +6,7 @@ import time
 import sys
 from pathlib import Path
 from datetime import datetime, timedelta
+from typing import Optional
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
@@ -16,7 +17,7 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 from config import Config
 import db
-from reddit_client import reddit_client
+from reddit_client import reddit_client, RateBudget
 import sync_worker as sync
 
 # Configure logging
@@ -30,11 +31,12 @@ logger = logging.getLogger(__name__)
 TIMEZONE = ZoneInfo("UTC")
 
 
-async def sync_news_task(max_posts: int = 5):
+async def sync_news_task(max_posts: int = 5, budget: Optional[RateBudget] = None):
     """Async task to sync and collect news posts with comments and scores.
 
     Args:
         max_posts: Maximum number of posts to process in this run
+        budget: Reddit request budget shared with the other Reddit jobs
     """
     logger.info(f"Starting news sync task (max_posts={max_posts})")
 
@@ -47,13 +49,18 @@ async def sync_news_task(max_posts: int = 5):
             client_id=config.reddit_client_id,
             client_secret=config.reddit_client_secret,
             user_agent=config.reddit_user_agent,
-            refresh_token=config.reddit_refresh_token
-        ) as reddit:
+            refresh_token=config.reddit_refresh_token,
+            fetch_threads=config.reddit_fetch_threads
+        ) as client:
             await sync.sync_all(
-                reddit=reddit,
+                reddit=client.reddit,
                 media_dir=config.media_dir,
                 max_concurrent=config.max_concurrent_downloads,
-                max_posts=max_posts
+                max_posts=max_posts,
+                workers=config.sync_workers,
+                budget=budget or RateBudget(config.reddit_rate_limit),
+                executor=client.executor,
+                connect=client.connect
             )
             logger.info(f"Successfully completed news sync task ({max_posts} posts)")
             
@@ -62,6 +69,49 @@ async def sync_news_task(max_posts: int = 5):
         raise
 
 
+async def refresh_metrics_task(budget: Optional[RateBudget] = None):
+    """Async task refreshing score and comment count of recent posts.
+
+    Args:
+        budget: Reddit request budget shared with the other Reddit jobs
+    """
+    logger.info("Starting metrics refresh task")
+
+    try:
+        config = Config()
+
+        async with reddit_client(
+            client_id=config.reddit_client_id,
+            client_secret=config.reddit_client_secret,
+            user_agent=config.reddit_user_agent,
+            refresh_token=config.reddit_refresh_token,
+            fetch_threads=1
+        ) as client:
+            await sync.refresh_metrics(
+                reddit=client.reddit,
+                max_batches=config.metrics_refresh_batches,
+                budget=budget or RateBudget(config.reddit_rate_limit),
+                executor=client.executor
+            )
+
+    except Exception:
+        logger.exception("Metrics refresh task failed")
+        raise
+
+
+async def compact_metrics_task():
+    """Async task downsampling and expiring old metrics snapshots."""
+    try:
+        config = Config()
+        await db.compact_news_metrics(
+            raw_seconds=config.metrics_raw_days * 86400,
+            retention_seconds=config.metrics_retention_days * 86400
+        )
+    except Exception:
+        logger.exception("Metrics compaction task failed")
+        raise
+
+
 def run_async_task(async_func, *args, **kwargs):
     """Helper function to run async tasks in scheduler."""
     try:
@@ -96,11 +146,15 @@ def main():
         raise
     
     scheduler = BackgroundScheduler(timezone=TIMEZONE)
+
+    # The sync and metrics jobs run in separate scheduler threads but spend
+    # one OAuth allowance, so they take their tokens from one bucket
+    reddit_budget = RateBudget(config.reddit_rate_limit)
     
     # Schedule the tasks
     scheduler.add_job(
         run_async_task,
-        args=[sync_news_task, 5],
+        args=[sync_news_task, 5, reddit_budget],
         trigger=DateTrigger(run_date=datetime.now(TIMEZONE) + timedelta(seconds=10)),
         max_instances=1,
         coalesce=True,
@@ -110,7 +164,7 @@ def main():
     
     scheduler.add_job(
         run_async_task,
-        args=[sync_news_task, 5],
+        args=[sync_news_task, 5, reddit_budget],
         trigger=IntervalTrigger(minutes=2),
         max_instances=1,
         coalesce=True,
@@ -118,6 +172,26 @@ def main():
         replace_existing=True,
     )
     
+    scheduler.add_job(
+        run_async_task,
+        args=[refresh_metrics_task, reddit_budget],
+        trigger=IntervalTrigger(minutes=10),
+        max_instances=1,
+        coalesce=True,
+        id="refresh_metrics",
+        replace_existing=True,
+    )
+    
+    scheduler.add_job(
+        run_async_task,
+        args=[compact_metrics_task],
+        trigger=IntervalTrigger(hours=24),
+        max_instances=1,
+        coalesce=True,
+        id="compact_metrics",
+        replace_existing=True,
+    )
+    
     scheduler.start()
     logging.info("Scheduler started. Press Ctrl+C to exit.")
     
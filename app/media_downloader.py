@@ -6,22 +6,29 @@ and error handling. Uses httpx for async HTTP requests and implements
 retry logic for resilience.
 """
 import asyncio
+import hashlib
+import importlib.util
 import logging
 import os
 import re
+import time
 from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, Any, Optional, AsyncGenerator
+from typing import Dict, Any, Optional, AsyncGenerator, Tuple
 from urllib.parse import urlparse
 
 import aiofiles
 import httpx
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
 
 try:
-    from .utils import generate_uid, extract_file_extension, normalize_media_url
+    from .utils import (
+        SNIFF_BYTES, extension_for_type, media_kind, normalize_media_url, sniff_media_type,
+    )
 except ImportError:
-    from utils import generate_uid, extract_file_extension, normalize_media_url
+    from utils import (
+        SNIFF_BYTES, extension_for_type, media_kind, normalize_media_url, sniff_media_type,
+    )
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +44,69 @@ ALLOWED_MEDIA_HOSTS = (
 
 MAX_REDIRECTS = 5
 
+# Connection pool of the shared download client. Idle keep-alive connections
+# to i.redd.it and friends are reused for the next file instead of paying
+# DNS, TCP and TLS again; HTTP/2 multiplexes downloads over one connection
+# when the optional h2 package is installed (pip install 'httpx[http2]').
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY = 30.0  # seconds
+DOWNLOAD_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+# Concurrent downloads per media host, matched on the host or a parent
+# domain. v.redd.it videos are large and throttled harder than images.
+HOST_CONCURRENCY = {
+    'i.redd.it': 6,
+    'v.redd.it': 2,
+    'imgur.com': 2,
+}
+DEFAULT_HOST_CONCURRENCY = 3
+
+# HTTP statuses worth retrying later; any other 4xx will not get better
+RETRYABLE_STATUSES = {408, 425, 429}
+
+# Read size when re-hashing the prefix of a resumed partial download
+HASH_CHUNK_SIZE = 1024 * 1024
+# Partial downloads untouched this long are abandoned (remove_stale_parts)
+PART_MAX_AGE = 24 * 3600
+
+class PermanentDownloadError(ValueError):
+    """A download that retrying cannot fix: blocked, oversized, not media."""
+
+
+def is_permanent_error(error: BaseException) -> bool:
+    """True when a failed download should not be attempted again."""
+    if isinstance(error, (PermanentDownloadError, httpx.TooManyRedirects)):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return 400 <= status < 500 and status not in RETRYABLE_STATUSES
+    return False
+
+
+def host_key(url: str) -> str:
+    """The HOST_CONCURRENCY entry a URL counts against (else its host)."""
+    host = (urlparse(url).hostname or '').lower()
+    for limited in HOST_CONCURRENCY:
+        if host == limited or host.endswith('.' + limited):
+            return limited
+    return host
+
+
+class HostSlots:
+    """Per-host semaphores sized from HOST_CONCURRENCY."""
+
+    def __init__(self):
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def for_url(self, url: str) -> asyncio.Semaphore:
+        key = host_key(url)
+        if key not in self.semaphores:
+            self.semaphores[key] = asyncio.Semaphore(
+                HOST_CONCURRENCY.get(key, DEFAULT_HOST_CONCURRENCY))
+        return self.semaphores[key]
+
+
 def allowed_media_url(url: str) -> bool:
     """Return True when url is http(s) and points at an allowlisted host."""
     parsed = urlparse(url)
@@ -49,18 +119,70 @@ def allowed_media_url(url: str) -> bool:
 async def reject_disallowed_url(request: httpx.Request) -> None:
     """httpx request hook: runs for every request including redirect hops."""
     if not allowed_media_url(str(request.url)):
-        raise ValueError(f"Blocked URL outside the media host allowlist: {request.url}")
+        raise PermanentDownloadError(
+            f"Blocked URL outside the media host allowlist: {request.url}")
+
+class PoolStats:
+    """Connection reuse counters of a download client, from httpcore trace events.
+
+    Every request (redirect hops included) counts once; only requests that had
+    to open a new connection count towards connections, so reused tells how
+    often the pool was hit.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections = 0
+        self.tls_handshakes = 0
+
+    @property
+    def reused(self) -> int:
+        return self.requests - self.connections
+
+    async def trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        if event_name.endswith('send_request_headers.started'):
+            self.requests += 1
+        elif event_name == 'connection.connect_tcp.complete':
+            self.connections += 1
+        elif event_name == 'connection.start_tls.complete':
+            self.tls_handshakes += 1
+
+    async def attach(self, request: httpx.Request) -> None:
+        """httpx request hook: have httpcore report this request's events."""
+        request.extensions['trace'] = self.trace
+
+    def __str__(self) -> str:
+        return (f"{self.requests} requests over {self.connections} connections "
+                f"({self.reused} reused, {self.tls_handshakes} TLS handshakes)")
+
 
 @asynccontextmanager
-async def http_client():
-    """Context manager for HTTP client."""
+async def http_client(
+    max_connections: int = 20,
+    transport: Optional[httpx.AsyncBaseTransport] = None
+) -> AsyncGenerator[tuple[httpx.AsyncClient, PoolStats], None]:
+    """Context manager for the pooled HTTP client downloads share.
+
+    Yields (client, stats): open it once per batch and pass the client to
+    download_media(); stats counts the batch's connection reuse. A custom
+    transport (tests) replaces the pool.
+    """
+    stats = PoolStats()
     client = httpx.AsyncClient(
         follow_redirects=True,
         max_redirects=MAX_REDIRECTS,
-        event_hooks={'request': [reject_disallowed_url]},
+        http2=HTTP2_AVAILABLE,
+        timeout=DOWNLOAD_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(MAX_KEEPALIVE_CONNECTIONS, max_connections),
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        event_hooks={'request': [reject_disallowed_url, stats.attach]},
+        transport=transport,
     )
     try:
-        yield client
+        yield client, stats
     finally:
         await client.aclose()
 
@@ -73,47 +195,149 @@ def ensure_media_dir(media_dir: str) -> Path:
 async def write_stream_to_file(
     response: httpx.Response,
     file_path: Path,
-    max_size: int
-) -> None:
-    """Stream a response body to disk, aborting once it exceeds max_size."""
-    bytes_written = 0
+    max_size: int,
+    offset: int = 0
+) -> Tuple[bytes, str]:
+    """Stream a response body to disk, aborting once it exceeds max_size.
+
+    With an offset the body continues a partial file of that many bytes and
+    is appended to it. Returns the first SNIFF_BYTES of the file for type
+    detection and the hex SHA-256 of the whole file, hashed while it streams
+    (after re-reading the partial prefix). An interrupted transfer leaves
+    the partial file in place for the next attempt to resume; an oversized
+    one is deleted.
+    """
+    head = b''
+    digest = hashlib.sha256()
+    if offset:
+        async with aiofiles.open(file_path, 'rb') as f:
+            while chunk := await f.read(HASH_CHUNK_SIZE):
+                if len(head) < SNIFF_BYTES:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+                digest.update(chunk)
+
+    bytes_written = offset
     try:
-        async with aiofiles.open(file_path, 'wb') as f:
+        async with aiofiles.open(file_path, 'ab' if offset else 'wb') as f:
             async for chunk in response.aiter_bytes():
                 bytes_written += len(chunk)
                 if bytes_written > max_size:
-                    raise ValueError(
+                    raise PermanentDownloadError(
                         f"File too large: exceeded {max_size} bytes while downloading"
                     )
+                if len(head) < SNIFF_BYTES:
+                    head += chunk[:SNIFF_BYTES - len(head)]
+                digest.update(chunk)
                 await f.write(chunk)
-    except BaseException:
+    except ValueError:
         file_path.unlink(missing_ok=True)
         raise
+    return head, digest.hexdigest()
+
+def parse_content_range(value: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """(first byte, complete length) of a 'bytes 100-199/1000' Content-Range."""
+    match = re.fullmatch(r'bytes (\d+)-\d+/(\d+|\*)', (value or '').strip())
+    if not match:
+        return None, None
+    total = match.group(2)
+    return int(match.group(1)), None if total == '*' else int(total)
+
+def expected_length(response: httpx.Response, offset: int) -> Tuple[int, Optional[int]]:
+    """Where the body starts in the file and the file's complete length.
+
+    A 206 that starts at offset continues the partial file; anything else
+    (a server ignoring Range) restarts it from byte zero. The length is
+    unknown when the body is content-encoded, since httpx decodes it.
+    """
+    first_byte, total = parse_content_range(response.headers.get('content-range'))
+    if offset and response.status_code == 206 and first_byte == offset:
+        start = offset
+    else:
+        start, total = 0, response.headers.get('content-length')
+        total = int(total) if total and total.isdigit() else None
+    if response.headers.get('content-encoding', 'identity') != 'identity':
+        total = None
+    return start, total
+
+def resume_validator(response: httpx.Response) -> Optional[str]:
+    """The strong ETag or Last-Modified a resume can send as If-Range.
+
+    None for a weak ETag, which If-Range does not accept, and for a
+    content-encoded body, whose decoded bytes on disk do not line up with
+    the server's byte ranges.
+    """
+    if response.headers.get('content-encoding', 'identity') != 'identity':
+        return None
+    etag = response.headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('last-modified')
+
+def start_part(response: httpx.Response, validator_path: Path) -> None:
+    """Record what a fresh partial file was downloaded from, for a later resume."""
+    validator = resume_validator(response)
+    if validator:
+        validator_path.write_text(validator)
+    else:
+        validator_path.unlink(missing_ok=True)
+
+def discard_part(part_path: Path) -> None:
+    """Delete a partial download and its resume validator."""
+    part_path.unlink(missing_ok=True)
+    part_path.with_suffix('.validator').unlink(missing_ok=True)
 
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
-       reraise=True)
+       retry=retry_if_not_exception_type(PermanentDownloadError), reraise=True)
 async def download_file(
     client: httpx.AsyncClient,
     url: str,
     media_dir: Path,
     max_size: int
 ) -> Dict[str, Any]:
-    """Download a single file with retry on failure."""
+    """Download a single file with retry on failure.
+
+    The body goes to <media_dir>/<sha256 of url>.part, which survives failed
+    attempts: a retry (or the next sync cycle) asks for the rest with a
+    Range request. The first response's strong ETag or Last-Modified is kept
+    next to it (.validator) and sent as If-Range, so a file that changed in
+    the meantime comes back whole instead of being spliced; a part without
+    one is downloaded again from the start. Once its size matches the
+    announced length the file is renamed to its content-addressed name.
+    """
     if not allowed_media_url(url):
-        raise ValueError(f"Blocked URL outside the media host allowlist: {url}")
+        raise PermanentDownloadError(f"Blocked URL outside the media host allowlist: {url}")
+
+    part_path = media_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.part"
+    validator_path = part_path.with_suffix('.validator')
+    offset = part_path.stat().st_size if part_path.exists() else 0
+    validator = validator_path.read_text() if offset and validator_path.exists() else None
+    headers = None
+    if offset and validator:
+        # Ranges count encoded bytes: ask for the body as stored on disk
+        headers = {'Range': f'bytes={offset}-', 'If-Range': validator,
+                   'Accept-Encoding': 'identity'}
+    else:
+        offset = 0
 
     reopen_for_body = False
-    async with client.stream('GET', url) as response:
+    async with client.stream('GET', url, headers=headers) as response:
+        if response.status_code == 416:
+            # The partial file no longer fits what the server has
+            discard_part(part_path)
+            raise ValueError(f"Discarded stale partial download of {url}")
         response.raise_for_status()
 
         content_type = response.headers.get('content-type', '')
-        size = int(response.headers.get('content-length', 0))
+        offset, total = expected_length(response, offset)
 
-        if size > max_size:
-            raise ValueError(f"File too large: {size} bytes")
+        if total and total > max_size:
+            discard_part(part_path)
+            raise PermanentDownloadError(f"File too large: {total} bytes")
+        if not offset:
+            start_part(response, validator_path)
 
         # Check if this is an HTML page with loader
-        if content_type.startswith('text/html'):
+        if not offset and content_type.startswith('text/html'):
             # Check first bytes to determine content type
             content_preview = bytearray()
             async for chunk in response.aiter_bytes():
@@ -131,49 +355,112 @@ async def download_file(
                         # check at the top vets the scraped URL too
                         decoded_url = direct_url.group(1).decode()
                         return await download_file(client, decoded_url, media_dir, max_size)
-                raise ValueError("Received HTML loading page instead of media content")
+                raise PermanentDownloadError(
+                    "Received HTML loading page instead of media content")
             # text/html content-type without HTML markers: still worth
             # saving, but the stream is partially consumed — re-request below
             reopen_for_body = True
 
-        extension = extract_file_extension(url, content_type)
-        uid_filename = f"{generate_uid()}.{extension}"
-        file_path = media_dir / uid_filename
-
         if not reopen_for_body:
-            await write_stream_to_file(response, file_path, max_size)
+            head, sha256 = await write_stream_to_file(response, part_path, max_size, offset)
 
     if reopen_for_body:
         async with client.stream('GET', url) as response:
             response.raise_for_status()
-            await write_stream_to_file(response, file_path, max_size)
+            _, total = expected_length(response, 0)
+            start_part(response, validator_path)
+            head, sha256 = await write_stream_to_file(response, part_path, max_size)
+
+    size_bytes = part_path.stat().st_size
+    if total is not None and size_bytes != total:
+        # Keep the part: the retry resumes from here
+        raise ValueError(f"Incomplete download of {url}: {size_bytes} of {total} bytes")
 
+    # Trust the bytes over the header: hosts label webp as jpeg, gifv as html
+    sniffed_type = sniff_media_type(head, content_type)
+    # Content-addressed: identical bytes always land on the same file name
+    uid_filename = f"{sha256}.{extension_for_type(sniffed_type)}"
+    file_path = media_dir / uid_filename
+    if file_path.exists():
+        part_path.unlink()  # a repost of a file we already have
+    else:
+        os.replace(part_path, file_path)
+    validator_path.unlink(missing_ok=True)
     return {
         'uid_filename': uid_filename,
         'original_url': url,
-        'content_type': content_type,
-        'size_bytes': os.path.getsize(file_path)
+        'content_type': sniffed_type,
+        'kind': media_kind(sniffed_type),
+        'size_bytes': size_bytes,
+        'sha256': sha256,
     }
 
-async def download_media(
+def remove_stale_parts(media_dir: str, max_age: float = PART_MAX_AGE) -> int:
+    """Delete partial downloads nobody resumed within max_age seconds."""
+    removed = 0
+    cutoff = time.time() - max_age
+    for part_path in Path(media_dir).glob('*.part'):
+        try:
+            if part_path.stat().st_mtime < cutoff:
+                discard_part(part_path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    for validator_path in Path(media_dir).glob('*.validator'):
+        # left behind by a download that failed before its part was written
+        try:
+            if (not validator_path.with_suffix('.part').exists()
+                    and validator_path.stat().st_mtime < cutoff):
+                validator_path.unlink()
+        except FileNotFoundError:
+            continue
+    if removed:
+        logger.info(f"Removed {removed} stale partial downloads")
+    return removed
+
+async def fetch_media(
     url: str,
     media_dir: str = 'media',
     max_size: int = 50 * 1024 * 1024,
-    semaphore: asyncio.Semaphore = None
-) -> Optional[Dict[str, Any]]:
-    """Download media file and return metadata."""
+    client: Optional[httpx.AsyncClient] = None
+) -> Dict[str, Any]:
+    """Download a post's media file and return its metadata; raises on failure.
+
+    Pass the client of an open http_client() to reuse its connections;
+    without one, a client is opened just for this download.
+    """
     url = normalize_media_url(url)
     if not url:
+        raise PermanentDownloadError("No downloadable media URL")
+
+    media_path = ensure_media_dir(media_dir)
+    if client is not None:
+        info = await download_file(client, url, media_path, max_size)
+    else:
+        async with http_client() as (own_client, _):
+            info = await download_file(own_client, url, media_path, max_size)
+    # Record the URL the post links to, not the og:image a loading page
+    # may have redirected the download to, so db.get_media_by_url finds
+    # it the next time a post links there
+    return {**info, 'original_url': url}
+
+async def download_media(
+    url: str,
+    media_dir: str = 'media',
+    max_size: int = 50 * 1024 * 1024,
+    semaphore: asyncio.Semaphore = None,
+    client: Optional[httpx.AsyncClient] = None
+) -> Optional[Dict[str, Any]]:
+    """Download media file and return metadata, or None when it failed."""
+    if not normalize_media_url(url):
         return None
 
     if semaphore is None:
         semaphore = asyncio.Semaphore(5)
 
-    media_path = ensure_media_dir(media_dir)
-    
     try:
-        async with semaphore, http_client() as client:
-            return await download_file(client, url, media_path, max_size)
+        async with semaphore:
+            return await fetch_media(url, media_dir, max_size, client)
     except (httpx.HTTPError, ValueError, OSError) as error:
         # Expected failure modes: network/HTTP errors, blocked or oversized
         # downloads (ValueError), filesystem errors. Callers treat None as
@@ -187,13 +474,19 @@ async def download_many(
     max_size: int = 50 * 1024 * 1024,
     max_concurrent: int = 5
 ) -> AsyncGenerator[tuple[str, Optional[Dict[str, Any]]], None]:
-    """Download multiple media files concurrently."""
+    """Download multiple media files concurrently over one pooled client.
+
+    Duplicate URLs are downloaded (and yielded) once: two transfers of one
+    URL would write the same partial file.
+    """
     semaphore = asyncio.Semaphore(max_concurrent)
-    
-    async def download_one(url: str):
-        result = await download_media(url, media_dir, max_size, semaphore)
-        return url, result
-    
-    tasks = [download_one(url) for url in urls]
-    for task in asyncio.as_completed(tasks):
-        yield await task
\ No newline at end of file
+
+    async with http_client(max_connections=max_concurrent) as (client, stats):
+        async def download_one(url: str):
+            result = await download_media(url, media_dir, max_size, semaphore, client)
+            return url, result
+
+        tasks = [download_one(url) for url in dict.fromkeys(urls)]
+        for task in asyncio.as_completed(tasks):
+            yield await task
+        logger.info(f"Media downloads: {stats}")
\ No newline at end of file
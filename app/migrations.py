@@ -0,0 +1,104 @@
+"""Versioned schema migrations for existing Reddit Sync databases.
+
+Base.metadata.create_all() creates missing tables (with their indexes) but
+never alters a table that already exists, so a news.db created by an older
+release would miss newer columns and indexes. Each migration below upgrades
+such a file by one step; PRAGMA user_version records the last step applied.
+
+Migrations run after create_all() on every start and must be idempotent: a
+fresh database already has everything they add, they only fill it in for old
+files. Idempotence is also what makes them safe to interrupt: pysqlite runs
+DDL and PRAGMA user_version outside any transaction, so a crash can leave a
+step half applied, and the next start simply runs that step again. Every
+statement therefore checks first (add_column, IF [NOT] EXISTS, checkfirst
+indexes, UPDATE ... WHERE not yet filled). To change the schema, update
+models.py and append a migration.
+"""
+import logging
+from typing import Callable, List, Tuple
+
+from sqlalchemy import Connection, inspect, text
+
+try:
+    from .models import Base
+except ImportError:
+    from models import Base
+
+logger = logging.getLogger(__name__)
+
+
+def add_column(connection: Connection, table_name: str, column_name: str) -> None:
+    """Add a model column to an existing table unless it is already there."""
+    existing = {column["name"] for column in inspect(connection).get_columns(table_name)}
+    if column_name in existing:
+        return
+    column = Base.metadata.tables[table_name].columns[column_name]
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+    logger.info(f"Added column {table_name}.{column_name}")
+
+
+def create_indexes(connection: Connection, table_name: str) -> None:
+    """Create every index models.py declares for a table, skipping existing ones."""
+    for index in Base.metadata.tables[table_name].indexes:
+        index.create(connection, checkfirst=True)
+
+
+def sync_cursor_and_refresh_columns(connection: Connection) -> None:
+    add_column(connection, "subscriptions", "last_fullname")
+    add_column(connection, "subscriptions", "last_created_utc")
+    add_column(connection, "subscriptions", "gap_fullname")
+    add_column(connection, "news", "metrics_due_at")
+
+
+def news_read_path_indexes(connection: Connection) -> None:
+    create_indexes(connection, "news")
+
+
+def media_kind_column(connection: Connection) -> None:
+    # Rows downloaded before this version keep kind NULL; the web UI sniffs
+    # and fills them in on first view (db.set_media_type)
+    add_column(connection, "media", "kind")
+
+
+def content_addressed_media(connection: Connection) -> None:
+    # Files saved before this version keep their uid names and a NULL hash
+    add_column(connection, "media", "sha256")
+    add_column(connection, "media", "refcount")
+    connection.execute(text(
+        "UPDATE media SET refcount = "
+        "(SELECT count(*) FROM news WHERE news.media_uid = media.uid_filename) "
+        "WHERE refcount IS NULL"))
+    create_indexes(connection, "media")
+
+
+# (version, description, upgrade step), in order; never renumber or remove.
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "sync cursor and metrics refresh columns", sync_cursor_and_refresh_columns),
+    (2, "news read path indexes", news_read_path_indexes),
+    (3, "sniffed media kind", media_kind_column),
+    (4, "content-addressed media with refcounts", content_addressed_media),
+]
+
+
+def schema_version(connection: Connection) -> int:
+    """Return the last migration applied to the database file."""
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def run_migrations(connection: Connection) -> int:
+    """Apply pending migrations in order and return the resulting version.
+
+    Not atomic: user_version is bumped after each step, and a step that
+    fails part way is re-run whole on the next start (see the module
+    docstring for why every step must tolerate that).
+    """
+    current = schema_version(connection)
+    for version, description, upgrade in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Applying schema migration {version}: {description}")
+        upgrade(connection)
+        connection.exec_driver_sql(f"PRAGMA user_version = {version}")
+        current = version
+    return current
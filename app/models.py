@@ -13,6 +13,8 @@ from sqlalchemy import (
     Text,
     DateTime,
     ForeignKey,
+    Index,
+    and_,
 )
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
@@ -32,6 +34,12 @@ class Subscription(Base):
     thread_id: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
     title: Mapped[Optional[str]] = mapped_column(String(512))
     added_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # Sync cursor: newest post already stored with no gap behind it
+    last_fullname: Mapped[Optional[str]] = mapped_column(String(32))
+    last_created_utc: Mapped[Optional[int]] = mapped_column(Integer)
+    # Oldest post of a walk the limit cut short of the cursor: the next walk
+    # resumes the listing after it, so the posts in between are not skipped
+    gap_fullname: Mapped[Optional[str]] = mapped_column(String(32))
     
     # Relationship to news items
     news_items: Mapped[list["News"]] = relationship(
@@ -61,6 +69,8 @@ class News(Base):
     raw_json: Mapped[Optional[str]] = mapped_column(Text)
     score: Mapped[Optional[int]] = mapped_column(Integer, default=0)
     comment_count: Mapped[Optional[int]] = mapped_column(Integer, default=0)
+    # Epoch seconds of the next metrics refresh; NULL once the post is too old
+    metrics_due_at: Mapped[Optional[int]] = mapped_column(Integer)
     added_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -75,6 +85,24 @@ class News(Base):
         return f"<News(id={self.id}, external_id='{self.external_id}')>"
 
 
+# Secondary indexes for the hot read paths; migrations.py adds them to
+# databases created before they existed. Listings page by (key DESC, id DESC):
+# an ascending index scanned backwards yields exactly that order, because
+# SQLite appends the rowid (= id) to every index entry
+Index("ix_news_thread_created", News.thread_id, News.created_utc)
+Index("ix_news_added_at", News.added_at)
+Index(
+    "ix_news_pending_media",
+    News.id,
+    sqlite_where=and_(News.media_url.isnot(None), News.media_uid.is_(None)),
+)
+Index(
+    "ix_news_metrics_due",
+    News.metrics_due_at,
+    sqlite_where=News.metrics_due_at.isnot(None),
+)
+
+
 class Media(Base):
     """Downloaded media file model."""
     
@@ -84,7 +112,15 @@ class Media(Base):
     uid_filename: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
     original_url: Mapped[Optional[str]] = mapped_column(Text)
     content_type: Mapped[Optional[str]] = mapped_column(String(255))
+    # utils.media_kind() of content_type: image, video, html, pdf or other
+    kind: Mapped[Optional[str]] = mapped_column(String(16))
     size_bytes: Mapped[Optional[int]] = mapped_column(Integer)
+    # Hex SHA-256 of the file, which is also its name (<sha256>.<ext>), so a
+    # repost of the same bytes maps to the same row; NULL for files saved
+    # before content addressing
+    sha256: Mapped[Optional[str]] = mapped_column(String(64))
+    # News rows whose media_uid points at this file
+    refcount: Mapped[int] = mapped_column(Integer, default=1)
     saved_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     
     # Optional relationship to news item (if we want to track which news item this media belongs to)
@@ -96,4 +132,66 @@ class Media(Base):
     )
     
     def __repr__(self) -> str:
-        return f"<Media(id={self.id}, uid_filename='{self.uid_filename}')>"
\ No newline at end of file
+        return f"<Media(id={self.id}, uid_filename='{self.uid_filename}')>"
+
+
+# Deduplication lookups: by content once downloaded, by URL before fetching
+Index("ix_media_sha256", Media.sha256, unique=True)
+Index("ix_media_original_url", Media.original_url)
+
+
+class MediaJob(Base):
+    """Durable media download queue entry, one per post awaiting its media.
+
+    A claimed job is leased by pushing next_attempt_at into the future, so a
+    crashed run's jobs simply come due again. Done jobs are deleted; jobs
+    that failed for good stay behind with status 'failed' and last_error.
+    """
+    
+    __tablename__ = "media_jobs"
+    
+    id: Mapped[int] = mapped_column(primary_key=True)
+    news_external_id: Mapped[str] = mapped_column(
+        String(255), ForeignKey("news.external_id"), unique=True, nullable=False
+    )
+    url: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), default="pending")  # pending | failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[Optional[str]] = mapped_column(Text)
+    next_attempt_at: Mapped[int] = mapped_column(Integer, default=0)  # epoch seconds
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self) -> str:
+        return f"<MediaJob(id={self.id}, news_external_id='{self.news_external_id}')>"
+
+
+Index(
+    "ix_media_jobs_due",
+    MediaJob.next_attempt_at,
+    sqlite_where=MediaJob.status == "pending",
+)
+
+
+class NewsMetric(Base):
+    """Append-only snapshot of a post's score and comment count.
+
+    Keyed by (news_id, observed_at) in a WITHOUT ROWID table, so the rows of
+    one post sit together in primary key order and each row is just four
+    integers.
+    """
+    
+    __tablename__ = "news_metrics"
+    __table_args__ = {"sqlite_with_rowid": False}
+    
+    news_id: Mapped[int] = mapped_column(ForeignKey("news.id"), primary_key=True)
+    observed_at: Mapped[int] = mapped_column(Integer, primary_key=True)  # epoch seconds
+    score: Mapped[int] = mapped_column(Integer, nullable=False)
+    comment_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    
+    def __repr__(self) -> str:
+        return f"<NewsMetric(news_id={self.news_id}, observed_at={self.observed_at})>"
+
+
+# Lets a time-window query (db.get_news_velocity) read only the snapshots
+# inside its window instead of every post's whole history
+Index("ix_news_metrics_observed_at", NewsMetric.observed_at)
@@ -7,9 +7,11 @@ import argparse
 import logging
 import os
 import sys
-import time
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+import requests
 from dotenv import load_dotenv
 
 sys.path.insert(0, str(Path(__file__).parent))
@@ -22,7 +24,9 @@ logger = logging.getLogger("trend_publisher")
 DEFAULT_SUBREDDITS = "ProgrammerHumor"
 DEFAULT_MIN_SCORE = 500
 DEFAULT_LISTINGS = "rising,top:week"
-RATE_LIMIT_PAUSE = 30
+DEFAULT_PUBLISH_WORKERS = 4
+# A listing that fails to download or parse is skipped for the next one
+FETCH_ERRORS = (requests.RequestException, ElementTree.ParseError)
 
 
 def tracked_subreddits():
@@ -34,6 +38,11 @@ def min_score():
     return int(os.getenv("MIN_SCORE", DEFAULT_MIN_SCORE))
 
 
+def publish_workers():
+    """Subreddits prefetched at once by one publish_once run."""
+    return int(os.getenv("PUBLISH_WORKERS", DEFAULT_PUBLISH_WORKERS))
+
+
 def listing_chain():
     """Listings to try in order until one yields a publishable post.
 
@@ -44,33 +53,51 @@ def listing_chain():
     return [item.strip() for item in raw.split(",") if item.strip()]
 
 
-def pick_unsent(connection, candidates, scores, threshold):
-    for candidate in candidates:
-        if not candidate["reddit_id"] or not candidate["image_url"]:
-            continue
-        if scores.get(candidate["reddit_id"], 0) < threshold:
-            continue
-        if published_store.is_published(connection, candidate["reddit_id"]):
-            continue
-        return candidate
+def pick_unsent(connection, candidates, scores, threshold, published=None):
+    """First candidate with an image, a score >= threshold and not yet published.
+
+    published is a set of known published ids (published_store.published_ids)
+    checked in memory, which lets a lazy feed stop at the first pick. Without
+    it the eligible candidates are looked up in the store in one query.
+    """
+    eligible = (
+        candidate for candidate in candidates
+        if candidate["reddit_id"] and candidate["image_url"]
+        and scores.get(candidate["reddit_id"], 0) >= threshold)
+    if published is None:
+        eligible = list(eligible)
+        published = published_store.published_subset(
+            connection, [candidate["reddit_id"] for candidate in eligible])
+    for candidate in eligible:
+        if candidate["reddit_id"] not in published:
+            return candidate
     return None
 
 
-def select_candidate(connection, subreddit, threshold):
+def select_candidate(connection, subreddit, threshold, published=None):
     """Walk the listing chain until one yields an unsent post.
 
     Returns (candidate, scores); (None, {}) when every listing comes up empty.
+    Reddit's rate limit is paced by trend_watcher's per-host limiter. The
+    connection is only used when no published id set is given.
     """
     for position, listing in enumerate(listing_chain()):
-        if position:
-            time.sleep(RATE_LIMIT_PAUSE)  # respect Reddit's rate limit
         try:
-            candidates = trend_watcher.fetch_listing(subreddit, listing)
-            scores = trend_watcher.listing_scores(subreddit, listing)
-        except Exception as error:
+            candidates, scores = trend_watcher.fetch_listing_with_scores(
+                subreddit, listing, lazy=True)
+        except FETCH_ERRORS as error:
             logger.error("r/%s: could not fetch %s: %s", subreddit, listing, error)
             continue
-        choice = pick_unsent(connection, candidates, scores, threshold)
+        try:
+            # The feed is parsed only up to the first publishable post; store
+            # errors are not fetch errors and propagate to the caller
+            choice = pick_unsent(connection, candidates, scores, threshold, published)
+        except FETCH_ERRORS as error:
+            logger.error("r/%s: could not read %s: %s", subreddit, listing, error)
+            continue
+        finally:
+            if hasattr(candidates, "close"):
+                candidates.close()  # stop parsing; the rest of the body is cached as is
         if choice:
             if position:
                 logger.info("r/%s: picked from fallback listing '%s'",
@@ -81,11 +108,49 @@ def select_candidate(connection, subreddit, threshold):
     return None, {}
 
 
+def prepare_post(subreddit, threshold, known):
+    """Pick a subreddit's post and resolve its images, ready to send; or None.
+
+    Runs in a prefetch worker. Dedup is checked against the known id set,
+    so no store connection is needed here.
+    """
+    choice, scores = select_candidate(None, subreddit, threshold, known)
+    if not choice:
+        return None
+    images = [choice["image_url"]]
+    if choice.get("is_gallery"):
+        gallery = trend_watcher.gallery_image_urls(choice["permalink"], choice["reddit_id"])
+        if len(gallery) > 1:
+            images = gallery
+    return {
+        "subreddit": subreddit,
+        "choice": choice,
+        "score": scores.get(choice["reddit_id"], 0),
+        "images": images,
+        "caption": telegram_publisher.build_caption(
+            choice["title"], subreddit, choice["permalink"]),
+    }
+
+
+def send_post(token, chat_id, post):
+    """Send a prepared post; returns its Telegram message id."""
+    if len(post["images"]) > 1:
+        result = telegram_publisher.send_media_group(
+            token, chat_id, post["images"], post["caption"])
+    else:
+        result = telegram_publisher.send_photo(
+            token, chat_id, post["images"][0], post["caption"])
+    return result["message_id"]
+
+
 def publish_once(dry_run=False, subreddits=None):
     """Publish one post per subreddit; defaults to all tracked subreddits.
 
     The scheduler passes a single-subreddit list so posts spread out over
-    the day instead of going out back-to-back.
+    the day instead of going out back-to-back. With several subreddits,
+    PUBLISH_WORKERS of them are prefetched and ranked at once (old.reddit
+    requests still share trend_watcher's rate limiter), and the posts go
+    out one by one, as they become ready, through Telegram's paced lane.
     """
     load_dotenv()
     token = os.getenv("TELEGRAM_TOKEN")
@@ -96,45 +161,42 @@ def publish_once(dry_run=False, subreddits=None):
     if subreddits is None:
         subreddits = tracked_subreddits()
 
-    connection = published_store.open_store()
+    # The store stays open for the life of the process
+    store = published_store.get_store()
+    # Loaded once: every candidate of every listing is checked in memory
+    known = store.published_ids()
+    threshold = min_score()
     published = []
-    try:
-        for position, subreddit in enumerate(subreddits):
-            if position:
-                time.sleep(RATE_LIMIT_PAUSE)  # respect Reddit's RSS rate limit
-            threshold = min_score()
-            choice, scores = select_candidate(connection, subreddit, threshold)
-            if not choice:
+    workers = max(1, min(publish_workers(), len(subreddits)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="publish") as pool:
+        pending = {pool.submit(prepare_post, subreddit, threshold, known): subreddit
+                   for subreddit in subreddits}
+        for future in as_completed(pending):
+            subreddit = pending[future]
+            try:
+                post = future.result()
+            except Exception:
+                logger.exception("r/%s: could not prepare a post", subreddit)
                 continue
-            score = scores.get(choice["reddit_id"], 0)
-            caption = telegram_publisher.build_caption(
-                choice["title"], subreddit, choice["permalink"])
-            images = [choice["image_url"]]
-            if choice.get("is_gallery"):
-                gallery = trend_watcher.gallery_image_urls(
-                    choice["permalink"], choice["reddit_id"])
-                if len(gallery) > 1:
-                    images = gallery
+            if post is None:
+                continue
+            choice = post["choice"]
             if dry_run:
                 logger.info("r/%s: would publish '%s' (%s), score %d, %d image(s)",
                             subreddit, choice["title"], choice["reddit_id"],
-                            score, len(images))
+                            post["score"], len(post["images"]))
+                continue
+            try:
+                message_id = send_post(token, chat_id, post)
+            except Exception:
+                logger.exception("r/%s: could not send '%s'", subreddit, choice["title"])
                 continue
-            if len(images) > 1:
-                result = telegram_publisher.send_media_group(
-                    token, chat_id, images, caption)
-            else:
-                result = telegram_publisher.send_photo(
-                    token, chat_id, images[0], caption)
-            message_id = result["message_id"]
-            published_store.mark_published(
-                connection, choice["reddit_id"], subreddit,
-                choice["title"], choice["permalink"], message_id)
+            store.mark_published(choice["reddit_id"], subreddit,
+                                 choice["title"], choice["permalink"], message_id)
+            known.add(choice["reddit_id"])
             logger.info("r/%s: published '%s' (score %d) as message_id=%s",
-                        subreddit, choice["title"], score, message_id)
+                        subreddit, choice["title"], post["score"], message_id)
             published.append((subreddit, choice["title"], message_id))
-    finally:
-        connection.close()
     return published
 
 
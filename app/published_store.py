@@ -1,11 +1,48 @@
 """Persistent record of already-published Reddit posts, to avoid reposting."""
 import os
+import queue
 import sqlite3
+import threading
 import time
+from contextlib import contextmanager
 from pathlib import Path
 
 REPO_ROOT = Path(__file__).resolve().parent.parent
 DEFAULT_DB = "data/published.sqlite"
+# Ids per IN (...) lookup, well under SQLite's bound-parameter limit
+LOOKUP_BATCH = 500
+# Connections a PublishedStore keeps for overlapping scheduler jobs
+DEFAULT_POOL_SIZE = 4
+# Milliseconds a writer waits for another connection's write to finish
+BUSY_TIMEOUT_MS = 5000
+
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS published (
+        reddit_id TEXT PRIMARY KEY,
+        subreddit TEXT NOT NULL,
+        title TEXT NOT NULL,
+        permalink TEXT NOT NULL,
+        telegram_message_id INTEGER,
+        published_at INTEGER NOT NULL
+    )
+    """,
+    # History per subreddit, newest first
+    "CREATE INDEX IF NOT EXISTS ix_published_subreddit_time "
+    "ON published (subreddit, published_at)",
+)
+
+MARK_PUBLISHED = """
+    INSERT INTO published
+        (reddit_id, subreddit, title, permalink, telegram_message_id, published_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (reddit_id) DO UPDATE SET
+        subreddit = excluded.subreddit,
+        title = excluded.title,
+        permalink = excluded.permalink,
+        telegram_message_id = excluded.telegram_message_id,
+        published_at = excluded.published_at
+"""
 
 
 def store_path():
@@ -17,26 +54,122 @@ def store_path():
     return path.resolve()
 
 
+def connect(path):
+    """Open a connection in WAL mode: readers never wait for the writer.
+
+    sqlite3 keeps the prepared statement of every query text it runs (per
+    connection), so the fixed queries below are compiled once.
+    """
+    connection = sqlite3.connect(
+        path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def create_schema(connection):
+    with connection:
+        for statement in SCHEMA:
+            connection.execute(statement)
+
+
 def open_store():
+    """One standalone connection with the schema in place (tools, tests)."""
     path = store_path()
     path.parent.mkdir(parents=True, exist_ok=True)
-    connection = sqlite3.connect(path)
-    connection.execute(
-        """
-        CREATE TABLE IF NOT EXISTS published (
-            reddit_id TEXT PRIMARY KEY,
-            subreddit TEXT NOT NULL,
-            title TEXT NOT NULL,
-            permalink TEXT NOT NULL,
-            telegram_message_id INTEGER,
-            published_at INTEGER NOT NULL
-        )
-        """
-    )
-    connection.commit()
+    connection = connect(path)
+    create_schema(connection)
     return connection
 
 
+class PublishedStore:
+    """Long-lived handle on the dedup store, kept open by the scheduler.
+
+    The schema is created once, when the store is opened. Connections are
+    made on demand, up to pool_size, and handed out one job at a time by
+    connection(); in WAL mode overlapping jobs read concurrently and only
+    serialize on the short write of mark_published.
+    """
+
+    def __init__(self, path=None, pool_size=DEFAULT_POOL_SIZE):
+        self.path = Path(path) if path else store_path()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.lock = threading.Lock()
+        self.connections = []
+        with self.connection() as connection:
+            create_schema(connection)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection; blocks while all of them are in use."""
+        self.slots.acquire()
+        try:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                connection = connect(self.path)
+                with self.lock:
+                    self.connections.append(connection)
+            try:
+                yield connection
+            finally:
+                if connection.in_transaction:
+                    connection.rollback()
+                self.idle.put(connection)
+        finally:
+            self.slots.release()
+
+    def is_published(self, reddit_id):
+        with self.connection() as connection:
+            return is_published(connection, reddit_id)
+
+    def published_subset(self, reddit_ids):
+        with self.connection() as connection:
+            return published_subset(connection, reddit_ids)
+
+    def published_ids(self):
+        with self.connection() as connection:
+            return published_ids(connection)
+
+    def mark_published(self, reddit_id, subreddit, title, permalink, telegram_message_id):
+        with self.connection() as connection:
+            mark_published(connection, reddit_id, subreddit, title, permalink,
+                           telegram_message_id)
+
+    def close(self):
+        with self.lock:
+            connections, self.connections = self.connections, []
+        self.idle = queue.LifoQueue()
+        for connection in connections:
+            connection.close()
+
+
+shared_store = None
+shared_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide PublishedStore for store_path(), opened on first use."""
+    global shared_store
+    path = store_path()
+    with shared_store_lock:
+        if shared_store is None or shared_store.path != path:
+            if shared_store is not None:
+                shared_store.close()
+            shared_store = PublishedStore(path)
+        return shared_store
+
+
+def close_store():
+    global shared_store
+    with shared_store_lock:
+        if shared_store is not None:
+            shared_store.close()
+            shared_store = None
+
+
 def is_published(connection, reddit_id):
     row = connection.execute(
         "SELECT 1 FROM published WHERE reddit_id = ?", (reddit_id,)
@@ -44,16 +177,37 @@ def is_published(connection, reddit_id):
     return row is not None
 
 
+def published_subset(connection, reddit_ids):
+    """Return the ids among reddit_ids that are already published.
+
+    One query per LOOKUP_BATCH ids (so one for a whole listing) instead of
+    an is_published round trip per candidate.
+    """
+    reddit_ids = list(dict.fromkeys(reddit_ids))
+    published = set()
+    for start in range(0, len(reddit_ids), LOOKUP_BATCH):
+        batch = reddit_ids[start:start + LOOKUP_BATCH]
+        placeholders = ", ".join("?" * len(batch))
+        published.update(row[0] for row in connection.execute(
+            f"SELECT reddit_id FROM published WHERE reddit_id IN ({placeholders})",
+            batch))
+    return published
+
+
+def published_ids(connection):
+    """Every published id, for checking candidates in memory.
+
+    A few posts a day per subreddit keeps this at tens of thousands of short
+    strings even after years, so a plain set beats a probabilistic filter.
+    """
+    return {row[0] for row in connection.execute("SELECT reddit_id FROM published")}
+
+
 def mark_published(connection, reddit_id, subreddit, title, permalink,
                    telegram_message_id):
-    connection.execute(
-        """
-        INSERT OR REPLACE INTO published
+    with connection:
+        connection.execute(
+            MARK_PUBLISHED,
             (reddit_id, subreddit, title, permalink,
-             telegram_message_id, published_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (reddit_id, subreddit, title, permalink,
-         telegram_message_id, int(time.time())),
-    )
-    connection.commit()
+             telegram_message_id, int(time.time())),
+        )
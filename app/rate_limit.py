@@ -0,0 +1,34 @@
+"""Per-host request pacing shared by the trend publisher's HTTP clients."""
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class HostRateLimiter:
+    """Thread-safe token bucket per host: at most per_minute requests a minute.
+
+    acquire() reserves the next free slot under the lock and sleeps outside
+    it, so concurrent callers queue up in order instead of all waking at once.
+    """
+
+    def __init__(self, per_minute, burst=1):
+        if per_minute <= 0:
+            raise ValueError(f"per_minute must be positive, got {per_minute}")
+        self.interval = 60.0 / per_minute
+        self.burst = burst
+        self.lock = threading.Lock()
+        self.full_at = {}  # host -> monotonic time its bucket is full again
+
+    def acquire(self, url):
+        """Wait for the URL's host to have a token; returns seconds waited."""
+        host = urlparse(url).hostname or ""
+        with self.lock:
+            now = time.monotonic()
+            full_at = max(self.full_at.get(host, now), now)
+            # A request may go once at most burst - 1 tokens are still owed
+            slot = max(now, full_at - self.interval * (self.burst - 1))
+            self.full_at[host] = full_at + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return max(delay, 0.0)
@@ -1,34 +1,138 @@
 """Reddit API client"""
 import asyncio
 import logging
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from typing import Dict, Any, AsyncGenerator, Optional
+from typing import Dict, Any, AsyncGenerator, Callable, List, Optional
 
 import praw
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import before_sleep_log, retry, stop_after_attempt, wait_exponential
 
 logger = logging.getLogger(__name__)
 
+# Reddit serves at most 100 items per listing request
+PAGE_SIZE = 100
+# Pages fetched ahead of the consumer before the fetch thread has to wait
+PAGE_QUEUE_SIZE = 2
+# First request size when a sync cursor exists: a quiet subreddit answers
+# with a handful of already stored posts and the walk stops right there
+PROBE_PAGE_SIZE = 10
+
+class RedditClient:
+    """A PRAW instance plus the thread pool its blocking calls run in.
+
+    Each reddit_client() context owns its own pool, so jobs running side by
+    side in scheduler threads never share or shut down each other's pool.
+    PRAW instances are not thread-safe: callers fetching concurrently take
+    one each from connect().
+    """
+
+    def __init__(self, credentials: Dict[str, Any], executor: Executor):
+        self.credentials = credentials
+        self.executor = executor
+        self.reddit = self.connect()
+
+    def connect(self) -> praw.Reddit:
+        """A new PRAW instance with the client's credentials."""
+        return praw.Reddit(**self.credentials)
+
 @asynccontextmanager
 async def reddit_client(
     client_id: str,
     client_secret: str,
     user_agent: str,
-    refresh_token: Optional[str] = None
-):
-    """Create and manage Reddit client instance."""
-    reddit = praw.Reddit(
-        client_id=client_id,
-        client_secret=client_secret,
-        user_agent=user_agent,
-        refresh_token=refresh_token
-    )
-    logger.info("Reddit client initialized")
+    refresh_token: Optional[str] = None,
+    fetch_threads: int = 4
+) -> AsyncGenerator[RedditClient, None]:
+    """Create and manage Reddit client instance.
+
+    Also starts the thread pool the submission sources use to run PRAW's
+    blocking HTTP calls, so the event loop stays free for media downloads.
+    Pass client.executor on to the sync functions.
+    """
+    credentials = {
+        'client_id': client_id,
+        'client_secret': client_secret,
+        'user_agent': user_agent,
+        'refresh_token': refresh_token,
+    }
+    executor = ThreadPoolExecutor(max_workers=fetch_threads, thread_name_prefix="praw")
     try:
-        yield reddit
+        client = RedditClient(credentials, executor)
+        logger.info("Reddit client initialized")
+        yield client
     finally:
-        # Any cleanup if needed
-        pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def rate_limit_delay(limits: Dict[str, Any], now: Optional[float] = None) -> float:
+    """Seconds to wait so the remaining request budget lasts until its reset.
+
+    Reddit reports the budget in the X-Ratelimit-Remaining/-Reset headers,
+    which PRAW exposes as reddit.auth.limits. Spreading the remaining
+    requests evenly over the window never runs the budget dry; before the
+    first response the limits are unknown and no delay is applied.
+    """
+    remaining = limits.get('remaining')
+    reset_timestamp = limits.get('reset_timestamp')
+    if remaining is None or reset_timestamp is None:
+        return 0.0
+    window = max(reset_timestamp - (time.time() if now is None else now), 0.0)
+    if remaining < 1:
+        return window
+    return window / remaining
+
+class RateBudget:
+    """Token bucket shared by every coroutine talking to Reddit.
+
+    Sized from the OAuth allowance (requests per ten-minute window, Reddit's
+    reset period) with a small burst, so concurrent sync workers together
+    never outrun the client's budget. After each response the refill rate
+    narrows to the pace the X-Ratelimit headers allow, which keeps the bucket
+    honest when other processes share the same credentials.
+
+    Tokens are reserved under a thread lock and the wait happens outside it,
+    so one budget can be shared by jobs running on different event loops.
+    """
+
+    def __init__(self, requests_per_window: int = 600, window: float = 600.0, burst: int = 10):
+        self.allowance_rate = requests_per_window / window
+        self.rate = self.allowance_rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self) -> None:
+        """Credit the tokens accrued since the last call."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take one token, possibly on credit; return the seconds to wait for it."""
+        with self.lock:
+            self.refill()
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    async def acquire(self) -> None:
+        """Wait for and take one request token (waiters are served in order)."""
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def observe(self, limits: Dict[str, Any]) -> None:
+        """Align the bucket with the budget Reddit reported on the last response."""
+        remaining = limits.get('remaining')
+        if remaining is None:
+            return
+        with self.lock:
+            self.refill()
+            delay = rate_limit_delay(limits)
+            self.rate = min(self.allowance_rate, 1 / delay) if delay > 0 else self.allowance_rate
+            self.tokens = min(self.tokens, remaining)
 
 def extract_media_url(submission: praw.models.Submission) -> Optional[str]:
     """Extract media URL from submission."""
@@ -85,28 +189,142 @@ def submission_to_dict(submission: praw.models.Submission, thread_id: str) -> Di
         'raw_json': str(submission)
     }
 
-async def iter_submissions(
+def reached_cursor(post: Dict[str, Any], cursor: Dict[str, Any]) -> bool:
+    """True once the /new walk reaches a post at or behind the sync cursor.
+
+    The creation time comparison also stops the walk when the cursor post
+    itself was deleted and no longer shows up in the listing.
+    """
+    if f"t3_{post['external_id']}" == cursor['fullname']:
+        return True
+    return (post.get('created_utc') or 0) < cursor['created_utc']
+
+def fetch_new_page(
     reddit: praw.Reddit,
     thread_id: str,
-    limit: int = 100
-) -> AsyncGenerator[Dict[str, Any], None]:
-    """Iterate over submissions from a subreddit."""
+    limit: int = PAGE_SIZE,
+    after: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Fetch one page of a subreddit's /new listing (blocking, one request)."""
+    params = {'after': after} if after else None
     subreddit = reddit.subreddit(thread_id)
-    
-    for submission in subreddit.new(limit=limit):
-        yield submission_to_dict(submission, thread_id)
-        await asyncio.sleep(0.1)  # Prevent hitting rate limits
+    return [
+        submission_to_dict(submission, thread_id)
+        for submission in subreddit.new(limit=min(limit, PAGE_SIZE), params=params)
+    ]
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10),
+       before_sleep=before_sleep_log(logger, logging.WARNING), reraise=True)
+async def budgeted_request(
+    reddit: praw.Reddit,
+    budget: RateBudget,
+    executor: Optional[Executor],
+    fetch: Callable[..., Any],
+    *args: Any
+) -> Any:
+    """Run one blocking PRAW request in executor under budget, with retry.
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-async def get_thread_posts(
+    Each attempt takes its own token, and the budget is re-aligned with the
+    rate-limit headers of the response.
+    """
+    await budget.acquire()
+    result = await asyncio.get_running_loop().run_in_executor(executor, fetch, reddit, *args)
+    budget.observe(reddit.auth.limits)
+    return result
+
+async def iter_submission_pages(
     reddit: praw.Reddit,
     thread_id: str,
-    limit: int = 100
-) -> AsyncGenerator[Dict[str, Any], None]:
-    """Get latest posts from a thread/subreddit with retry."""
+    limit: int = 100,
+    budget: Optional[RateBudget] = None,
+    executor: Optional[Executor] = None,
+    cursor: Optional[Dict[str, Any]] = None,
+    start_after: Optional[str] = None
+) -> AsyncGenerator[List[Dict[str, Any]], None]:
+    """Iterate over pages of submissions from a subreddit.
+
+    A producer task runs each page fetch in the PRAW thread pool (retried
+    with back-off, see budgeted_request) and hands
+    the converted page over through a small queue: once PAGE_QUEUE_SIZE
+    pages wait unconsumed the producer stops fetching, so a slow consumer
+    throttles Reddit traffic instead of buffering the whole listing.
+    Every request first takes a token from budget (pass the same budget to
+    concurrent callers so they share one allowance). Fetches run in
+    executor, the loop's default pool if omitted.
+
+    With a cursor ({'fullname', 'created_utc'} of the newest post already
+    stored) the walk starts with a PROBE_PAGE_SIZE request and stops at the
+    first known post, so only unseen posts are fetched and yielded. Fewer
+    than limit posts in total means the walk reached known territory or
+    the end of the listing. start_after (a fullname) resumes the listing
+    after that post instead of at the top, with full pages.
+    """
+    budget = budget or RateBudget()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=PAGE_QUEUE_SIZE)
+
+    async def produce() -> None:
+        after = start_after
+        remaining = limit
+        try:
+            while remaining > 0:
+                page_size = PROBE_PAGE_SIZE if cursor and after is None else PAGE_SIZE
+                page_limit = min(remaining, page_size)
+                page = await budgeted_request(
+                    reddit, budget, executor, fetch_new_page, thread_id, page_limit, after
+                )
+                known = next(
+                    (index for index, post in enumerate(page)
+                     if cursor and reached_cursor(post, cursor)),
+                    None,
+                )
+                if known is not None:
+                    if known:
+                        await queue.put(page[:known])
+                    break
+                if page:
+                    await queue.put(page)
+                if len(page) < page_limit:
+                    break  # listing exhausted
+                remaining -= len(page)
+                after = f"t3_{page[-1]['external_id']}"
+            await queue.put(None)
+        except Exception as error:
+            await queue.put(error)
+
+    producer = asyncio.create_task(produce())
     try:
-        async for post in iter_submissions(reddit, thread_id, limit):
-            yield post
-    except Exception:
-        logger.exception(f"Error fetching posts from {thread_id}")
-        raise
\ No newline at end of file
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        producer.cancel()
+
+def fetch_info_page(reddit: praw.Reddit, fullnames: List[str]) -> Dict[str, Dict[str, int]]:
+    """Fetch current metrics for up to PAGE_SIZE posts (blocking, one request)."""
+    return {
+        submission.id: {'score': submission.score, 'comment_count': submission.num_comments}
+        for submission in reddit.info(fullnames=fullnames[:PAGE_SIZE])
+    }
+
+async def fetch_metrics(
+    reddit: praw.Reddit,
+    fullnames: List[str],
+    budget: Optional[RateBudget] = None,
+    executor: Optional[Executor] = None
+) -> Dict[str, Dict[str, int]]:
+    """Map post id -> current score and comment count via /api/info.
+
+    Ids are sent PAGE_SIZE at a time, one budgeted request per batch; posts
+    Reddit no longer knows about are missing from the result.
+    """
+    budget = budget or RateBudget()
+    metrics = {}
+    for start in range(0, len(fullnames), PAGE_SIZE):
+        metrics.update(await budgeted_request(
+            reddit, budget, executor, fetch_info_page, fullnames[start:start + PAGE_SIZE]
+        ))
+    return metrics
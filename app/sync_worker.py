@@ -7,8 +7,14 @@ sync workflow.
 """
 import asyncio
 import logging
-from typing import Optional, Dict, Any
+import math
+import time
+from collections import defaultdict
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Callable, Optional, Dict, Any
 
+import httpx
 import praw
 from sqlalchemy import select
 
@@ -16,113 +22,243 @@ try:
     from . import db
     from . import reddit_client as rc
     from . import media_downloader as md
-    from .models import News, Subscription
+    from .models import Subscription
+    from .utils import media_retry_at, next_metrics_refresh, normalize_media_url
 except ImportError:
     import db
     import reddit_client as rc
     import media_downloader as md
-    from models import News, Subscription
+    from models import Subscription
+    from utils import media_retry_at, next_metrics_refresh, normalize_media_url
 
 logger = logging.getLogger(__name__)
 
+# Media download queue: jobs claimed per batch, and attempts before a job
+# whose failures all looked transient is given up anyway
+MEDIA_JOB_BATCH = 100
+MEDIA_MAX_ATTEMPTS = 8
+
 async def sync_thread(
     reddit: praw.Reddit,
     thread_id: str,
-    limit: int = 100
+    limit: int = 100,
+    budget: Optional[rc.RateBudget] = None,
+    executor: Optional[Executor] = None
 ) -> int:
     """Sync posts from a specific thread.
 
+    Posts arrive a listing page at a time and are written through
+    db.upsert_news_batch, so a full listing costs one lookup and one commit
+    per page instead of one session per post. The walk stops at the
+    subscription's sync cursor. A thread's first walk seeds the cursor with
+    the newest post; after that the cursor only advances when the walk got
+    back to it (or to the end of the listing). A walk the limit cuts short
+    records its oldest post as the gap instead, and the next run resumes
+    the listing there rather than re-walking the newest posts; once the gap
+    is closed the cursor moves up to the newest stored post.
+
     Args:
         reddit: Reddit API client
         thread_id: Thread/subreddit ID to sync
         limit: Maximum posts to fetch
+        budget: Shared Reddit request budget (a private one if omitted)
+        executor: Thread pool running the blocking PRAW calls
 
     Returns:
         Number of new posts processed
     """
     logger.info(f"Starting synchronization for thread {thread_id}")
-    processed = 0
-
-    async for post in rc.get_thread_posts(reddit, thread_id, limit):
-        async with db.get_session() as session:
-            # Check if news exists
-            stmt = select(News).where(News.external_id == post['external_id'])
-            result = await session.execute(stmt)
-            existing = result.scalar_one_or_none()
-            
-            if not existing:
-                # Add new news
-                news = News(
-                    external_id=post["external_id"],
-                    thread_id=post.get("thread_id"),
-                    author=post.get("author"),
-                    created_utc=post.get("created_utc"),
-                    title=post.get("title"),
-                    body=post.get("body"),
-                    media_url=post.get("media_url"),
-                    score=post.get("score", 0),
-                    comment_count=post.get("comment_count", 0),
-                    raw_json=post.get("raw_json"),
-                )
-                session.add(news)
-                await session.commit()
-                logger.info(f"Successfully saved post {post['external_id']} from thread {thread_id}")
-                processed += 1
-            else:
-                # Update existing news metrics
-                existing.score = post.get('score', 0)
-                existing.comment_count = post.get('comment_count', 0)
-                await session.commit()
-    
-    logger.info(f"Processed {processed} new posts from thread {thread_id}")
-    return processed
-
-async def sync_media_item(
-    media_dir: str,
-    item: Dict[str, Any],
-    semaphore: asyncio.Semaphore
-) -> None:
-    """Download and store a single media item."""
-    try:
-        media_info = await md.download_media(
-            item['media_url'],
-            media_dir=media_dir,
-            semaphore=semaphore
-        )
-        if media_info:
-            await db.add_media(
-                news_external_id=item['external_id'],
-                **media_info
+    inserted = 0
+    updated = 0
+    fetched = 0
+    newest = None
+
+    oldest = None
+
+    cursor = await db.get_sync_cursor(thread_id)
+    gap_after = cursor and cursor["gap_after"]
+    async for page in rc.iter_submission_pages(
+        reddit, thread_id, limit, budget, executor, cursor=cursor, start_after=gap_after
+    ):
+        newest = newest or page[0]
+        oldest = page[-1]
+        fetched += len(page)
+        new, known = await db.upsert_news_batch(page)
+        inserted += new
+        updated += known
+
+    if cursor is None:
+        if newest:
+            await db.update_sync_cursor(
+                thread_id, f"t3_{newest['external_id']}", newest['created_utc']
             )
-            await db.update_news_media(
-                item['external_id'],
-                media_info['uid_filename']
+    elif fetched >= limit:
+        # The walk may have stopped short of the cursor: keep the cursor and
+        # resume below the oldest post fetched next time
+        await db.set_sync_gap(thread_id, f"t3_{oldest['external_id']}")
+    elif gap_after:
+        # Gap closed: everything between the cursor and the newest stored
+        # post is in, so the cursor jumps to that post
+        head = await db.get_newest_thread_post(thread_id)
+        if head:
+            await db.update_sync_cursor(
+                thread_id, f"t3_{head['external_id']}", head['created_utc']
             )
-            logger.info(f"Successfully downloaded media for post {item['external_id']}")
-    except Exception:
+    elif newest:
+        await db.update_sync_cursor(
+            thread_id, f"t3_{newest['external_id']}", newest['created_utc']
+        )
+
+    logger.info(
+        f"Processed thread {thread_id}: {inserted} new posts, {updated} updated"
+    )
+    return inserted
+
+async def refresh_metrics(
+    reddit: praw.Reddit,
+    max_batches: int = 10,
+    budget: Optional[rc.RateBudget] = None,
+    executor: Optional[Executor] = None
+) -> int:
+    """Refresh score and comment count of stored posts that are due.
+
+    Posts fall out of the latest-100 listing within hours, so instead of
+    re-listing, due posts are looked up by id through /api/info, 100 per
+    request, and written back with one UPDATE per batch. Each post's next
+    refresh is scheduled by its age (see utils.next_metrics_refresh).
+
+    Args:
+        reddit: Reddit API client
+        max_batches: Maximum /api/info requests in this run
+        budget: Shared Reddit request budget (a private one if omitted)
+        executor: Thread pool running the blocking PRAW calls
+
+    Returns:
+        Number of posts whose metrics were refreshed
+    """
+    now = int(time.time())
+    refreshed = 0
+
+    for _ in range(max_batches):
+        due = await db.get_news_due_for_refresh(now, rc.PAGE_SIZE)
+        if not due:
+            break
+        fullnames = [f"t3_{row['external_id']}" for row in due]
+        metrics = await rc.fetch_metrics(reddit, fullnames, budget, executor)
+
+        # Posts Reddit no longer returns keep their last metrics but still
+        # move to their next slot, otherwise they would be retried forever
+        rows = [
+            {
+                "id": row["id"],
+                "score": metrics.get(row["external_id"], row)["score"],
+                "comment_count": metrics.get(row["external_id"], row)["comment_count"],
+                "metrics_due_at": next_metrics_refresh(row["created_utc"], now),
+            }
+            for row in due
+        ]
+        await db.update_news_metrics_batch(rows)
+        refreshed += len(metrics)
+
+    logger.info(f"Refreshed metrics for {refreshed} posts")
+    return refreshed
+
+async def sync_media_job(
+    media_dir: str,
+    job: Dict[str, Any],
+    semaphore: asyncio.Semaphore,
+    host_slots: md.HostSlots,
+    client: Optional[httpx.AsyncClient] = None
+) -> bool:
+    """Download and store the media of one queued post; True on success.
+
+    A URL that was already downloaded is not fetched again: the post is
+    pointed at the stored file and its refcount goes up. A failure is
+    recorded on the job with its back-off, or ends it for good when it is
+    permanent or the job ran out of attempts.
+    """
+    url = normalize_media_url(job['url'])
+    try:
+        known = await db.get_media_by_url(url) if url else None
+        if known and (Path(media_dir) / known['uid_filename']).exists():
+            await db.reuse_media(job['news_external_id'], known['uid_filename'])
+            logger.info(f"Reused stored media {known['uid_filename']} "
+                        f"for post {job['news_external_id']}")
+        else:
+            # Host slot first, so a busy host never ties up a global slot
+            async with host_slots.for_url(url), semaphore:
+                media_info = await md.fetch_media(url, media_dir=media_dir, client=client)
+            stored = await db.add_media(news_external_id=job['news_external_id'], **media_info)
+            if stored != media_info['uid_filename']:
+                # the post already had its media recorded under another file
+                (Path(media_dir) / media_info['uid_filename']).unlink(missing_ok=True)
+            logger.info(f"Successfully downloaded media for post {job['news_external_id']}")
+        await db.finish_media_job(job['id'])
+        return True
+    except Exception as error:
         # One failed download must not kill the whole batch
-        logger.exception(f"Media download failed for post {item['external_id']}")
+        permanent = md.is_permanent_error(error) or job['attempts'] >= MEDIA_MAX_ATTEMPTS
+        retry_at = None if permanent else media_retry_at(job['attempts'])
+        await db.fail_media_job(job['id'], f"{type(error).__name__}: {error}", retry_at)
+        outcome = "giving up" if permanent else f"attempt {job['attempts']}, will retry"
+        logger.warning(f"Media download failed for post {job['news_external_id']} "
+                       f"({outcome}): {error}")
+        return False
 
 async def sync_pending_media(
     media_dir: str = 'media',
-    max_concurrent: int = 5
+    max_concurrent: int = 5,
+    batch_size: int = MEDIA_JOB_BATCH
 ) -> None:
-    """Process and download all pending media files."""
-    pending = await db.get_pending_media()
+    """Work through the durable media download queue.
+
+    Posts waiting for media are queued first (db.enqueue_media_jobs), then
+    due jobs are claimed batch_size at a time, so memory stays flat however
+    large the backlog. Downloads run under max_concurrent overall and the
+    HOST_CONCURRENCY cap of each media host.
+    """
+    md.remove_stale_parts(media_dir)
+    queued = await db.enqueue_media_jobs()
+    if queued:
+        logger.info(f"Queued {queued} media downloads")
+
+    jobs = await db.claim_media_jobs(limit=batch_size)
+    if not jobs:
+        return
     semaphore = asyncio.Semaphore(max_concurrent)
-    
-    # Process media downloads concurrently
-    tasks = [
-        sync_media_item(media_dir, item, semaphore)
-        for item in pending
-    ]
-    await asyncio.gather(*tasks)
+    host_slots = md.HostSlots()
+    done = failed = 0
+
+    async def sync_url(url_jobs, client):
+        # Jobs sharing a media URL go one after another: the first downloads
+        # it, the rest reuse the stored file, and no two transfers ever
+        # write the same partial file
+        return [await sync_media_job(media_dir, job, semaphore, host_slots, client)
+                for job in url_jobs]
+
+    # Process media downloads concurrently over one pooled client
+    async with md.http_client(max_connections=max_concurrent) as (client, stats):
+        while jobs:
+            by_url = defaultdict(list)
+            for job in jobs:
+                by_url[normalize_media_url(job['url'])].append(job)
+            results = await asyncio.gather(
+                *(sync_url(url_jobs, client) for url_jobs in by_url.values()))
+            outcomes = [ok for url_results in results for ok in url_results]
+            done += sum(outcomes)
+            failed += len(outcomes) - sum(outcomes)
+            jobs = await db.claim_media_jobs(limit=batch_size)
+        logger.info(f"Media downloads: {done} done, {failed} failed; {stats}")
 
 async def sync_all(
     reddit: praw.Reddit,
     media_dir: str = 'media',
     max_concurrent: int = 5,
-    max_posts: Optional[int] = None
+    max_posts: Optional[int] = None,
+    workers: int = 1,
+    budget: Optional[rc.RateBudget] = None,
+    executor: Optional[Executor] = None,
+    connect: Optional[Callable[[], praw.Reddit]] = None
 ) -> None:
     """Synchronize all subscriptions.
 
@@ -130,32 +266,81 @@ async def sync_all(
         reddit: Reddit API client
         media_dir: Directory for storing media files
         max_concurrent: Maximum concurrent downloads
-        max_posts: Maximum number of posts to process (None for unlimited)
+        max_posts: Maximum number of posts to process (None for unlimited).
+            Each running thread reserves a per-worker share of what is left,
+            so threads still overlap while the workers together never
+            process more than max_posts.
+        workers: Subscriptions synced concurrently
+        budget: Reddit request budget shared by all workers
+        executor: Thread pool running the blocking PRAW calls
+        connect: Makes a PRAW instance for each worker beyond the first
+            (PRAW is not thread-safe); without it one worker runs
     """
     total_processed = 0
+    reserved = 0  # posts the threads in flight may still process
+    headroom = asyncio.Condition()
+    budget = budget or rc.RateBudget()
+    if workers > 1 and connect is None:
+        logger.warning("No PRAW factory given, syncing with one worker")
+        workers = 1
 
     # Get subscriptions
     async with db.get_session() as session:
         stmt = select(Subscription)
         result = await session.execute(stmt)
         subscriptions = result.scalars().all()
-    
-    # Sync threads sequentially to avoid rate limits
-    for sub in subscriptions:
-        if max_posts and total_processed >= max_posts:
-            logger.info(f"Reached maximum posts limit ({max_posts}), stopping sync")
-            break
-            
-        try:
-            # Calculate remaining posts for this thread
-            thread_limit = max_posts - total_processed if max_posts else 100
-            processed = await sync_thread(reddit, sub.thread_id, limit=thread_limit)
+
+    # Workers pull from one shared iterator; the request budget, not the
+    # worker count, is what keeps Reddit's rate limit satisfied
+    pending = iter(subscriptions)
+    workers = max(1, min(workers, len(subscriptions)))
+
+    async def reserve() -> int:
+        """Wait for room under max_posts and claim it; 0 once the limit is hit."""
+        nonlocal reserved
+        if not max_posts:
+            return 100
+        async with headroom:
+            await headroom.wait_for(
+                lambda: total_processed >= max_posts
+                or total_processed + reserved < max_posts
+            )
+            left = max_posts - total_processed
+            thread_limit = max(0, min(math.ceil(left / workers), left - reserved))
+            reserved += thread_limit
+            return thread_limit
+
+    async def settle(thread_limit: int, processed: int) -> None:
+        nonlocal reserved, total_processed
+        async with headroom:
+            reserved -= thread_limit if max_posts else 0
             total_processed += processed
-        except Exception:
-            # One failed subreddit must not stop the others
-            logger.exception(f"Failed to sync {sub.thread_id}")
+            headroom.notify_all()
+
+    async def worker(worker_reddit: praw.Reddit) -> None:
+        for sub in pending:
+            thread_limit = await reserve()
+            if not thread_limit:
+                break
+
+            processed = 0
+            try:
+                processed = await sync_thread(
+                    worker_reddit, sub.thread_id, limit=thread_limit, budget=budget,
+                    executor=executor
+                )
+            except Exception:
+                # One failed subreddit must not stop the others
+                logger.exception(f"Failed to sync {sub.thread_id}")
+            finally:
+                await settle(thread_limit, processed)
+
+    worker_reddits = [reddit] + [connect() for _ in range(workers - 1)]
+    await asyncio.gather(*(worker(worker_reddit) for worker_reddit in worker_reddits))
+    if max_posts and total_processed >= max_posts:
+        logger.info(f"Reached maximum posts limit ({max_posts}), stopped sync")
 
     # Download media concurrently
     await sync_pending_media(media_dir, max_concurrent)
 
-    logger.info(f"Total sync completed: {total_processed} posts processed")
\ No newline at end of file
+    logger.info(f"Total sync completed: {total_processed} posts processed")
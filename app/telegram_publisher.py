@@ -1,15 +1,42 @@
 """Post a Reddit meme (photo or album + caption) to a Telegram channel."""
 import html
 import json
+import os
+import threading
 
 import requests
 
+from rate_limit import HostRateLimiter
+
 TELEGRAM_ALBUM_LIMIT = 10
+# Telegram lets a bot post about 20 messages a minute into one channel.
+# Every API call takes a turn from one limiter, so concurrent publishers
+# form a single paced lane instead of tripping 429s.
+DEFAULT_SENDS_PER_MINUTE = 20
+TELEGRAM_API = "https://api.telegram.org"
 
 USER_AGENT = ("Mozilla/5.0 (X11; Linux x86_64; rv:128.0) "
               "Gecko/20100101 Firefox/128.0")
 
 
+def sends_per_minute():
+    return float(os.getenv("TELEGRAM_SENDS_PER_MINUTE", DEFAULT_SENDS_PER_MINUTE))
+
+
+# Built on the first call rather than at import, so the
+# TELEGRAM_SENDS_PER_MINUTE an entry point loads from .env takes effect
+send_limiter = None
+send_limiter_lock = threading.Lock()
+
+
+def get_send_limiter():
+    global send_limiter
+    with send_limiter_lock:
+        if send_limiter is None:
+            send_limiter = HostRateLimiter(sends_per_minute())
+        return send_limiter
+
+
 def build_caption(title, subreddit, permalink):
     return (
         f"<b>{html.escape(title)}</b>\n"
@@ -18,8 +45,9 @@ def build_caption(title, subreddit, permalink):
 
 
 def call(token, method, payload=None, files=None):
+    get_send_limiter().acquire(TELEGRAM_API)
     response = requests.post(
-        f"https://api.telegram.org/bot{token}/{method}",
+        f"{TELEGRAM_API}/bot{token}/{method}",
         data=payload, files=files, timeout=30,
     )
     return response.json()
@@ -21,6 +21,7 @@ from dotenv import load_dotenv
 sys.path.insert(0, str(Path(__file__).parent))
 
 import publish_trends
+import published_store
 
 logger = logging.getLogger("trend_scheduler")
 DEFAULT_TIMES = "09:00,21:00"
@@ -128,6 +129,7 @@ def main():
     except KeyboardInterrupt:
         logger.info("interrupted, shutting down")
         scheduler.shutdown(wait=False)
+    published_store.close_store()
     logger.info("trend scheduler stopped")
 
 
@@ -4,13 +4,23 @@ Reddit's JSON endpoints reject datacenter IPs, but the RSS/Atom feeds
 (/r/<sub>/rising.rss) stay open. They carry no score, so "best trending"
 means the feed order Reddit itself assigns to rising posts.
 """
+import functools
+import hashlib
 import html
+import json
 import logging
+import os
 import re
+import threading
 import time
 import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limit import HostRateLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -22,10 +32,286 @@ IREDD_RE = re.compile(r"https://i\.redd\.it/[A-Za-z0-9]+\.[A-Za-z0-9]+")
 PREVIEW_RE = re.compile(r"https://preview\.redd\.it/([A-Za-z0-9]+\.[A-Za-z0-9]+)")
 COMMENTS_RE = re.compile(r"/comments/([a-z0-9]+)/")
 GALLERY_RE = re.compile(r"reddit\.com/gallery/[a-z0-9]+")
-MEDIA_TILE_RE = re.compile(r'id="media-tile-([a-z0-9]+)-([A-Za-z0-9]+)"')
-THING_RE = re.compile(r'<div\b([^>]*\bdata-fullname="t3_[a-z0-9]+"[^>]*)>')
-FULLNAME_RE = re.compile(r'data-fullname="t3_([a-z0-9]+)"')
-SCORE_RE = re.compile(r'data-score="(-?\d+)"')
+# One pass over an old.reddit page finds listing things (their tag carries
+# fullname and score), gallery media tiles and the i.redd.it / preview.redd.it
+# URLs that give a tile's file extension
+PAGE_TOKEN_RE = re.compile(
+    rb'<div\b([^>]*?\bdata-fullname="t3_[a-z0-9]+"[^>]*)>'
+    rb'|id="media-tile-([a-z0-9]+)-([A-Za-z0-9]+)"'
+    rb'|\.redd\.it/([A-Za-z0-9]+)\.(jpg|jpeg|png|gif)')
+MEDIA_REF_RE = re.compile(rb'\.redd\.it/([A-Za-z0-9]+)\.(jpg|jpeg|png|gif)')
+FULLNAME_RE = re.compile(rb'data-fullname="t3_([a-z0-9]+)"')
+SCORE_RE = re.compile(rb'data-score="(-?\d+)"')
+# Characters a media URL can end a chunk with, held back until the next one
+TOKEN_BYTES = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789./"
+# Bytes read from the socket per step while scanning a page
+SCAN_CHUNK = 64 * 1024
+
+# old.reddit throttles anonymous clients hard; every request to a host draws
+# from one token bucket instead of callers sleeping fixed pauses. The burst
+# lets a listing's RSS feed and HTML page go out together.
+DEFAULT_REQUESTS_PER_MINUTE = 10
+DEFAULT_REQUEST_BURST = 2
+
+
+def requests_per_minute():
+    return float(os.getenv("TREND_REQUESTS_PER_MINUTE", DEFAULT_REQUESTS_PER_MINUTE))
+
+
+def make_session():
+    """One pooled session: keep-alive connections to old.reddit are reused."""
+    pooled = requests.Session()
+    pooled.headers["User-Agent"] = USER_AGENT
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+    pooled.mount("https://", adapter)
+    pooled.mount("http://", adapter)
+    return pooled
+
+
+# Listing responses and their parsed results are cached on disk per URL.
+# Within the TTL a listing costs no request at all; after it, a conditional
+# GET (If-None-Match / If-Modified-Since) that old.reddit answers with 304
+# reuses the stored result without downloading or parsing the page again.
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_CACHE_DIR = "data/trend-cache"
+DEFAULT_CACHE_TTL = 120  # seconds
+# Bump when parse_feed / parse_scores output changes: older entries are then
+# re-parsed from their stored bytes instead of served as they are
+CACHE_VERSION = 1
+
+
+def cache_dir():
+    # Relative paths resolve against the repo root, like PUBLISHED_DB
+    path = Path(os.getenv("TREND_CACHE_DIR", DEFAULT_CACHE_DIR))
+    if not path.is_absolute():
+        path = REPO_ROOT / path
+    return path
+
+
+def cache_ttl():
+    return float(os.getenv("TREND_CACHE_TTL", DEFAULT_CACHE_TTL))
+
+
+class ListingCache:
+    """On-disk cache of one response per URL: <key>.body plus <key>.json.
+
+    The JSON holds the validators (ETag, Last-Modified), when the entry was
+    stored or last revalidated, and the parsed result. Both files are
+    written to a temporary name and renamed, so readers never see a torn
+    entry.
+    """
+
+    def __init__(self, directory, ttl):
+        self.directory = Path(directory)
+        self.ttl = ttl
+
+    def paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return self.directory / f"{key}.body", self.directory / f"{key}.json"
+
+    def load(self, url):
+        body_path, meta_path = self.paths(url)
+        try:
+            entry = json.loads(meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if entry.get("url") != url:
+            return None
+        entry["body_path"] = body_path
+        return entry
+
+    def is_fresh(self, entry):
+        return (entry.get("version") == CACHE_VERSION
+                and time.time() - entry["checked_at"] < self.ttl)
+
+    def write(self, path, data):
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def open_body(self, url):
+        """Return (tmp path, open file) for a new body, or None if not writable."""
+        body_path, _ = self.paths(url)
+        tmp_path = body_path.with_name(f"{body_path.name}.{threading.get_ident()}.tmp")
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            return tmp_path, open(tmp_path, "wb")
+        except OSError as error:
+            logger.warning("could not cache %s: %s", url, error)
+            return None
+
+    def store(self, url, response, parse):
+        """Parse a 200 response while streaming its body into the cache.
+
+        Returns parse(chunks). If the cache directory is not writable the
+        body is still parsed, just not kept. An empty result is not kept
+        either: a 200 without a single post is most likely a block or
+        interstitial page, and caching it would hide the listing for the
+        whole TTL.
+        """
+        chunks = response.iter_content(SCAN_CHUNK)
+        opened = self.open_body(url)
+        if opened is None:
+            return parse(chunks)
+        tmp_path, sink = opened
+        try:
+            with sink:
+                parsed = parse(copy_chunks(chunks, sink))
+            if not parsed:
+                tmp_path.unlink()
+                return parsed
+            os.replace(tmp_path, self.paths(url)[0])
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        self.save_meta(url, response_validators(response), parsed)
+        return parsed
+
+    def stream(self, url, response, parse_items):
+        """Yield parse_items(chunks) of a 200 response, caching body and items.
+
+        The item list is stored once the body has been parsed to the end. A
+        consumer that stops early leaves the rest unparsed; the remaining
+        bytes are still copied so the validators stay good for a 304, and
+        the entry is stored without items, to be re-parsed from disk.
+        """
+        chunks = response.iter_content(SCAN_CHUNK)
+        opened = self.open_body(url)
+        if opened is None:
+            with response:
+                yield from parse_items(chunks)
+            return
+        tmp_path, sink = opened
+        stored = False
+        try:
+            with response, sink:
+                items = []
+                try:
+                    for item in parse_items(copy_chunks(chunks, sink)):
+                        items.append(item)
+                        yield item
+                except GeneratorExit:
+                    items = None
+                    try:
+                        for chunk in chunks:
+                            sink.write(chunk)
+                    except requests.RequestException as error:
+                        logger.debug("%s not cached, body cut short: %s", url, error)
+                        return
+            if items == []:
+                return  # nothing parsed from the whole body: see store()
+            os.replace(tmp_path, self.paths(url)[0])
+            stored = True
+        finally:
+            if not stored:
+                tmp_path.unlink(missing_ok=True)
+        self.save_meta(url, response_validators(response), items)
+
+    def save_meta(self, url, validators, parsed):
+        _, meta_path = self.paths(url)
+        meta = {"url": url, "version": CACHE_VERSION, "checked_at": time.time(),
+                "parsed": parsed, **validators}
+        self.write(meta_path, json.dumps(meta).encode("utf-8"))
+
+
+class StreamedItems:
+    """Iterator over a streamed response's lazily parsed items.
+
+    close() also releases the response when iteration never started: the
+    parsing generator only reaches its `with response` once it runs.
+    """
+
+    def __init__(self, items, response):
+        self.items = items
+        self.response = response
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.items)
+
+    def close(self):
+        self.items.close()
+        self.response.close()
+
+
+def copy_chunks(chunks, sink):
+    for chunk in chunks:
+        sink.write(chunk)
+        yield chunk
+
+
+def response_validators(response):
+    headers = getattr(response, "headers", None) or {}
+    return {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def cached_get(url, parse, retries=4, pause=35, timeout=20, lazy=False):
+    """GET a listing page through the on-disk cache.
+
+    parse takes the body as an iterable of byte chunks. Returns
+    (response, parsed): parsed comes from parse() for a 200,
+    or from the cache for a fresh entry or a 304 (response is None for a
+    fresh entry: no request was made). For any other outcome parsed is None
+    and response is the failed response (or None).
+
+    With lazy=True parse() yields items and parsed is an iterable of them:
+    the request is still made here, but a 200 body is only read and parsed
+    as far as the caller iterates.
+    """
+    cache = ListingCache(cache_dir(), cache_ttl())
+    entry = cache.load(url)
+    if entry and cache.is_fresh(entry) and entry["parsed"]:
+        return None, entry["parsed"]
+
+    headers = conditional_headers(entry) if entry else {}
+    response = get_with_backoff(url, retries, pause, timeout, headers=headers, stream=True)
+    if response is not None and response.status_code != 200:
+        response.close()  # no body needed: status and headers only
+    if response is not None and response.status_code == 304 and entry:
+        if entry.get("version") == CACHE_VERSION and entry["parsed"] is not None:
+            parsed = stored = entry["parsed"]
+        else:
+            # Changed parser, or a body never parsed to the end: parse the
+            # stored bytes again
+            parsed = parse([entry["body_path"].read_bytes()])
+            stored = None if lazy else parsed
+        cache.save_meta(url, {"etag": entry.get("etag"),
+                              "last_modified": entry.get("last_modified")}, stored)
+        return response, parsed
+    if response is None or response.status_code != 200:
+        return response, None
+    if lazy:
+        return response, StreamedItems(cache.stream(url, response, parse), response)
+    with response:
+        return response, cache.store(url, response, parse)
+
+
+session = make_session()
+# Built on the first request rather than at import, so the
+# TREND_REQUESTS_PER_MINUTE an entry point loads from .env takes effect
+rate_limiter = None
+rate_limiter_lock = threading.Lock()
+# Runs a listing's feed and score page side by side
+fetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="trend-fetch")
+
+
+def get_rate_limiter():
+    global rate_limiter
+    with rate_limiter_lock:
+        if rate_limiter is None:
+            rate_limiter = HostRateLimiter(requests_per_minute(), burst=DEFAULT_REQUEST_BURST)
+        return rate_limiter
 
 
 def listing_urls(subreddit, listing):
@@ -42,24 +328,45 @@ def listing_urls(subreddit, listing):
     return f"{base}.rss{query}", f"{base}/{query}"
 
 
-def get_with_backoff(url, retries=4, pause=35, timeout=20):
-    """GET with old.reddit's rate limit in mind: back off and retry on 429."""
+def get_with_backoff(url, retries=4, pause=35, timeout=20, headers=None, stream=False):
+    """GET with old.reddit's rate limit in mind: back off and retry on 429.
+
+    Every attempt first waits for the host's rate limiter, then goes out
+    over the shared pooled session. With stream=True the body is left on
+    the socket for the caller to read with iter_content().
+    """
     response = None
     for attempt in range(retries):
         if attempt:
             time.sleep(pause * attempt)
-        response = requests.get(
-            url, headers={"User-Agent": USER_AGENT}, timeout=timeout)
+        get_rate_limiter().acquire(url)
+        response = session.get(url, headers=headers, timeout=timeout, stream=stream)
         if response.status_code != 429:
             break
+        response.close()
     return response
 
 
-def fetch_listing(subreddit, listing="rising", retries=4, pause=35):
+def fetch_listing(subreddit, listing="rising", retries=4, pause=35, lazy=False):
+    """Candidates of a listing's Atom feed, in feed order.
+
+    With lazy=True returns an iterable that parses the feed only as far as
+    it is consumed; the request is made (and a failed one raises) before
+    returning either way.
+    """
     rss_url, html_url = listing_urls(subreddit, listing)
-    response = get_with_backoff(rss_url, retries, pause, timeout=15)
-    response.raise_for_status()
-    return parse_feed(subreddit, response.content)
+    if lazy:
+        parse = functools.partial(iter_feed, subreddit)
+    else:
+        parse = functools.partial(parse_feed, subreddit)
+    response, candidates = cached_get(rss_url, parse, retries, pause, timeout=15, lazy=lazy)
+    if candidates is None:
+        if response is not None:
+            response.raise_for_status()
+        raise requests.HTTPError(
+            f"{listing} feed for r/{subreddit} not readable "
+            f"(HTTP {response.status_code if response is not None else 'n/a'})")
+    return candidates
 
 
 def fetch_rising(subreddit, retries=4, pause=35):
@@ -67,42 +374,63 @@ def fetch_rising(subreddit, retries=4, pause=35):
 
 
 def parse_feed(subreddit, raw_xml):
-    root = ElementTree.fromstring(raw_xml)
-    candidates = []
-    for entry in root.iter(f"{ATOM}entry"):
-        title = entry.findtext(f"{ATOM}title", default="(no title)")
-        author = entry.findtext(f"{ATOM}author/{ATOM}name", default="?")
-        content = entry.findtext(f"{ATOM}content", default="")
-        permalink = ""
-        for link in entry.iter(f"{ATOM}link"):
-            permalink = link.get("href", "")
-        permalink = permalink.replace("old.reddit.com", "reddit.com")
-        match = COMMENTS_RE.search(permalink)
-        text = html.unescape(content)
-        candidates.append({
-            "subreddit": subreddit,
-            "reddit_id": match.group(1) if match else None,
-            "title": title,
-            "author": author,
-            "permalink": permalink,
-            "image_url": extract_image(entry, content),
-            "is_gallery": bool(GALLERY_RE.search(text)) or "/gallery/" in permalink,
-        })
-    if not candidates:
+    """All candidates of an Atom feed, given as bytes or an iterable of chunks."""
+    if isinstance(raw_xml, bytes):
+        raw_xml = [raw_xml]
+    return list(iter_feed(subreddit, raw_xml))
+
+
+def iter_feed(subreddit, chunks):
+    """Yield a candidate per Atom entry as soon as the entry has been read.
+
+    Feeds the bytes to an XMLPullParser chunk by chunk and clears every
+    entry once yielded, so the tree never holds more than one entry and a
+    consumer that stops early leaves the rest of the feed unparsed.
+    """
+    parser = ElementTree.XMLPullParser(events=("end",))
+    count = 0
+    for chunk in chunks:
+        parser.feed(chunk)
+        for _, element in parser.read_events():
+            if element.tag == f"{ATOM}entry":
+                yield entry_candidate(subreddit, element)
+                count += 1
+                element.clear()
+    parser.close()
+    if not count:
         logger.warning(
             "rising feed for r/%s yielded no entries — empty feed or markup change?",
             subreddit)
-    return candidates
 
 
-def extract_image(entry, content):
+def entry_candidate(subreddit, entry):
+    title = entry.findtext(f"{ATOM}title", default="(no title)")
+    author = entry.findtext(f"{ATOM}author/{ATOM}name", default="?")
+    text = html.unescape(entry.findtext(f"{ATOM}content", default=""))
+    permalink = ""
+    for link in entry.iter(f"{ATOM}link"):
+        permalink = link.get("href", "")
+    permalink = permalink.replace("old.reddit.com", "reddit.com")
+    match = COMMENTS_RE.search(permalink)
+    return {
+        "subreddit": subreddit,
+        "reddit_id": match.group(1) if match else None,
+        "title": title,
+        "author": author,
+        "permalink": permalink,
+        "image_url": extract_image(entry, text),
+        "is_gallery": "/gallery/" in permalink or bool(GALLERY_RE.search(text)),
+    }
+
+
+def extract_image(entry, text):
     """Return a full-resolution image URL, never a tiny preview thumbnail.
 
-    Reddit's RSS often carries only a 140px preview.redd.it thumbnail (e.g. for
-    gallery posts). preview.redd.it/<id>.<ext> maps to the original at
-    i.redd.it/<id>.<ext>, so we upgrade previews instead of posting a thumbnail.
+    text is the entry's already unescaped HTML content. Reddit's RSS often
+    carries only a 140px preview.redd.it thumbnail (e.g. for gallery posts).
+    preview.redd.it/<id>.<ext> maps to the original at i.redd.it/<id>.<ext>,
+    so we upgrade previews instead of posting a thumbnail.
     """
-    text = html.unescape(content)
     direct = IREDD_RE.search(text)
     if direct:
         return direct.group(0)
@@ -125,19 +453,13 @@ def listing_scores(subreddit, listing="rising", retries=4, pause=35):
     Returns {} if the page can't be read (callers then publish nothing).
     """
     rss_url, html_url = listing_urls(subreddit, listing)
-    response = get_with_backoff(html_url, retries, pause, timeout=20)
-    if response is None or response.status_code != 200:
+    response, scores = cached_get(html_url, parse_scores, retries, pause, timeout=20)
+    if scores is None:
         logger.warning(
             "%s HTML for r/%s not readable (HTTP %s) — publishing nothing",
             listing, subreddit,
             response.status_code if response is not None else "n/a")
         return {}
-    scores = {}
-    for attrs in THING_RE.findall(response.text):
-        fullname = FULLNAME_RE.search(attrs)
-        score = SCORE_RE.search(attrs)
-        if fullname and score:
-            scores[fullname.group(1)] = int(score.group(1))
     if not scores:
         logger.warning(
             "%s HTML for r/%s parsed to zero scores — old.reddit markup change?",
@@ -145,10 +467,103 @@ def listing_scores(subreddit, listing="rising", retries=4, pause=35):
     return scores
 
 
+def parse_scores(chunks):
+    """Map reddit_id -> score from the things of an old.reddit listing page."""
+    return scan_page(chunks).scores
+
+
 def rising_scores(subreddit, retries=4, pause=35):
     return listing_scores(subreddit, "rising", retries, pause)
 
 
+def fetch_listing_with_scores(subreddit, listing="rising", lazy=False):
+    """Fetch a listing's feed and its HTML score page concurrently.
+
+    Returns (candidates, scores). A failing feed raises like fetch_listing;
+    an unreadable score page yields {} like listing_scores. lazy is passed
+    on to fetch_listing, so the scores are known before the feed is parsed.
+    """
+    scores = fetch_pool.submit(listing_scores, subreddit, listing)
+    candidates = None
+    try:
+        candidates = fetch_listing(subreddit, listing, lazy=lazy)
+    finally:
+        # Always wait, so a failed feed never leaves a request in flight
+        try:
+            score_map = scores.result()
+        except BaseException:
+            if hasattr(candidates, "close"):
+                candidates.close()  # nobody will read the open feed response
+            raise
+    return candidates, score_map
+
+
+class PageScanner:
+    """Single-pass, incremental extractor for old.reddit listing and post pages.
+
+    feed() takes the raw body in chunks of any size and matches each byte
+    once against PAGE_TOKEN_RE. Only an unfinished tag or token at the end
+    of a chunk is held back for the next one, so memory stays at one chunk
+    plus the results however long the page is.
+    """
+
+    def __init__(self):
+        self.pending = b""
+        self.scores = {}
+        self.tiles = []  # (post id, media id) in page order, as bytes
+        self.extensions = {}  # media id -> first extension seen on the page
+
+    def feed(self, chunk):
+        data = self.pending + chunk
+        tag_start = data.rfind(b"<")
+        if tag_start > data.rfind(b">"):
+            cut = tag_start  # tag still open
+        else:
+            cut = len(data.rstrip(TOKEN_BYTES))  # maybe a split media URL
+        self.pending = data[cut:]
+        self.scan(data, cut)
+
+    def close(self):
+        self.scan(self.pending, len(self.pending))
+        self.pending = b""
+        return self
+
+    def scan(self, data, end):
+        for match in PAGE_TOKEN_RE.finditer(data, 0, end):
+            attrs, tile_post, tile_media, media_id, extension = match.groups()
+            if attrs is not None:
+                fullname = FULLNAME_RE.search(attrs)
+                score = SCORE_RE.search(attrs)
+                if fullname and score:
+                    self.scores[fullname.group(1).decode()] = int(score.group(1))
+                for ref_id, ref_extension in MEDIA_REF_RE.findall(attrs):
+                    self.extensions.setdefault(ref_id, ref_extension)
+            elif tile_post is not None:
+                self.tiles.append((tile_post, tile_media))
+            else:
+                self.extensions.setdefault(media_id, extension)
+
+    def gallery_urls(self, post_id):
+        """i.redd.it originals of one post's gallery tiles, in order, deduplicated."""
+        post_id = post_id.encode()
+        urls = []
+        seen = set()
+        for tile_post, media_id in self.tiles:
+            if tile_post != post_id or media_id in seen:
+                continue
+            seen.add(media_id)
+            extension = self.extensions.get(media_id, b"jpg")
+            urls.append(f"https://i.redd.it/{media_id.decode()}.{extension.decode()}")
+        return urls
+
+
+def scan_page(chunks):
+    scanner = PageScanner()
+    for chunk in chunks:
+        scanner.feed(chunk)
+    return scanner.close()
+
+
 def gallery_image_urls(permalink, post_id, retries=4, pause=35):
     """Return every image of a gallery post, in order, at full resolution.
 
@@ -159,21 +574,16 @@ def gallery_image_urls(permalink, post_id, retries=4, pause=35):
     """
     old_permalink = permalink.replace("://reddit.com", "://old.reddit.com")
     old_permalink = old_permalink.replace("://www.reddit.com", "://old.reddit.com")
-    response = get_with_backoff(old_permalink, retries, pause, timeout=20)
+    response = get_with_backoff(old_permalink, retries, pause, timeout=20, stream=True)
     if response is None or response.status_code != 200:
         logger.warning(
             "gallery page %s not readable (HTTP %s)", old_permalink,
             response.status_code if response is not None else "n/a")
+        if response is not None:
+            response.close()
         return []
-    page = response.text
-    urls = []
-    seen = set()
-    for tile_post, media_id in MEDIA_TILE_RE.findall(page):
-        if tile_post != post_id or media_id in seen:
-            continue
-        seen.add(media_id)
-        extension = re.search(re.escape(media_id) + r"\.(jpg|jpeg|png|gif)", page)
-        urls.append(f"https://i.redd.it/{media_id}.{extension.group(1) if extension else 'jpg'}")
+    with response:
+        urls = scan_page(response.iter_content(SCAN_CHUNK)).gallery_urls(post_id)
     if not urls:
         logger.warning(
             "gallery page for post %s parsed to zero images — markup change?", post_id)
@@ -1,7 +1,9 @@
 """Utility functions for the Reddit sync.
 """
+import codecs
 import logging
 import re
+import time
 import uuid
 from typing import Optional
 from urllib.parse import urlparse
@@ -10,10 +12,45 @@ from tenacity import retry, stop_after_attempt, wait_exponential
 
 logger = logging.getLogger(__name__)
 
+# (maximum post age, refresh interval) in seconds: young posts move fast and
+# feed trend decisions, old ones barely change and stop being refreshed
+METRICS_REFRESH_SCHEDULE = (
+    (6 * 3600, 15 * 60),
+    (24 * 3600, 3600),
+    (3 * 86400, 6 * 3600),
+    (7 * 86400, 86400),
+)
+
+# Back-off of failed media download jobs: doubling from 5 minutes, capped
+# at a day
+MEDIA_RETRY_BASE = 5 * 60
+MEDIA_RETRY_MAX = 24 * 3600
+
 def generate_uid() -> str:
     """Generate a unique identifier."""
     return uuid.uuid4().hex
 
+# File extensions of the mime types we store; anything else is saved as .bin
+MIME_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'video/mp4': 'mp4',
+    'video/webm': 'webm',
+    'image/webp': 'webp',
+    'video/quicktime': 'mov',
+    'application/pdf': 'pdf',
+    'image/heic': 'heic',
+    'image/heif': 'heif',
+    'image/avif': 'avif',
+}
+
+def extension_for_type(content_type: Optional[str]) -> str:
+    """File extension for a mime type, 'bin' when unknown."""
+    if not content_type:
+        return 'bin'
+    return MIME_EXTENSIONS.get(content_type.split(';')[0].strip().lower(), 'bin')
+
 def extract_file_extension(url: str, content_type: Optional[str] = None) -> str:
     """Extract file extension from URL or content type."""
     # Try to get extension from URL first
@@ -23,18 +60,94 @@ def extract_file_extension(url: str, content_type: Optional[str] = None) -> str:
         return ext.group(1).lower()
     
     # Fallback to content type mapping
-    if content_type:
-        mime_map = {
-            'image/jpeg': 'jpg',
-            'image/png': 'png',
-            'image/gif': 'gif',
-            'video/mp4': 'mp4',
-            'video/webm': 'webm',
-            'image/webp': 'webp'
-        }
-        return mime_map.get(content_type.lower(), 'bin')
-    
-    return 'bin'
+    return extension_for_type(content_type)
+
+# Leading bytes sniff_media_type() looks at
+SNIFF_BYTES = 512
+
+# (offset, signature, mime type) of the formats Reddit and imgur serve
+MEDIA_SIGNATURES = (
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (8, b'WEBP', 'image/webp'),  # after RIFF and the chunk size
+    (0, b'\x1a\x45\xdf\xa3', 'video/webm'),
+    (0, b'%PDF-', 'application/pdf'),
+)
+# ISO base media files (MP4, QuickTime, HEIF, AVIF) all open with an ftyp
+# box; its major brand tells stills from video. Unknown brands are MP4.
+FTYP_BRANDS = {
+    b'qt  ': 'video/quicktime',
+    b'heic': 'image/heic',
+    b'heix': 'image/heic',
+    b'mif1': 'image/heif',
+    b'avif': 'image/avif',
+}
+HTML_MARKERS = (b'<!doctype html', b'<html', b'<head', b'<body')
+# <meta charset="..."> or the http-equiv form's content="...; charset=..."
+HTML_CHARSET_RE = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:-]+)', re.I)
+
+
+def sniff_media_type(head: bytes, declared: Optional[str] = None) -> str:
+    """Mime type of a file from its first bytes, else the declared type.
+
+    Only the leading SNIFF_BYTES of head are looked at, so the downloader can
+    call this on what it already streamed instead of libmagic re-reading files.
+    """
+    head = head[:SNIFF_BYTES]
+    if head[4:8] == b'ftyp':
+        return FTYP_BRANDS.get(head[8:12], 'video/mp4')
+    for offset, signature, mime in MEDIA_SIGNATURES:
+        if head[offset:offset + len(signature)] == signature:
+            return mime
+    lowered = head.lstrip().lower()
+    if any(marker in lowered for marker in HTML_MARKERS):
+        return f'text/html; charset={html_charset(head, declared)}'
+    if declared:
+        return declared.split(';')[0].strip().lower()
+    return 'application/octet-stream'
+
+
+def html_charset(head: bytes, declared: Optional[str] = None) -> str:
+    """Charset of a saved HTML page so it is served back the way it was written.
+
+    A <meta charset> in the page wins, then the charset of the declared
+    Content-Type; otherwise the page is UTF-8 if its head decodes as such
+    and Latin-1 if not.
+    """
+    match = HTML_CHARSET_RE.search(head)
+    if match:
+        charset = match.group(1).decode('ascii')
+    else:
+        charset = re.search(r'charset\s*=\s*["\']?([^;"\'\s]+)', declared or '', re.I)
+        charset = charset and charset.group(1)
+    if charset:
+        try:
+            codecs.lookup(charset)
+            return charset.lower()
+        except LookupError:
+            pass
+    try:
+        # final=False: the head may end in the middle of a multi-byte character
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'iso-8859-1'
+
+
+def media_kind(mime: Optional[str]) -> str:
+    """Coarse kind the web UI branches on: image, video, html, pdf or other."""
+    mime = (mime or '').split(';')[0].strip().lower()
+    if mime.startswith('image/'):
+        return 'image'
+    if mime.startswith('video/'):
+        return 'video'
+    if mime == 'text/html':
+        return 'html'
+    if mime == 'application/pdf':
+        return 'pdf'
+    return 'other'
 
 def normalize_media_url(url: str) -> str:
     """Normalize media URLs (handle imgur, reddit, chats, etc)."""
@@ -86,6 +199,24 @@ def normalize_media_url(url: str) -> str:
     
     return url
 
+def next_metrics_refresh(created_utc: Optional[int], now: Optional[int] = None) -> Optional[int]:
+    """Return when a post's score and comment count are next due for a refresh.
+
+    The interval grows with the post's age per METRICS_REFRESH_SCHEDULE;
+    None means the post is old enough to never be refreshed again.
+    """
+    now = int(time.time()) if now is None else now
+    age = now - (created_utc or now)
+    for max_age, interval in METRICS_REFRESH_SCHEDULE:
+        if age < max_age:
+            return now + interval
+    return None
+
+def media_retry_at(attempts: int, now: Optional[int] = None) -> int:
+    """When a media job that has failed attempts times is due again."""
+    now = int(time.time()) if now is None else now
+    return now + min(MEDIA_RETRY_BASE * 2 ** max(attempts - 1, 0), MEDIA_RETRY_MAX)
+
 @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
 async def retry_async(coroutine):
     """Retry coroutine with exponential backoff."""
@@ -17,13 +17,27 @@ if str(APP_DIR) not in sys.path:
 
 
 class FakeResponse:
-    """Stand-in for requests.Response: canned status, text, and content."""
+    """Stand-in for requests.Response: canned status, headers, text, and content."""
 
-    def __init__(self, body, status_code=200):
+    def __init__(self, body, status_code=200, headers=None):
         self.status_code = status_code
+        self.headers = headers or {}
         self.text = body if isinstance(body, str) else body.decode("utf-8")
         self.content = body if isinstance(body, bytes) else body.encode("utf-8")
 
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def raise_for_status(self):
         if self.status_code >= 400:
             raise RuntimeError(f"HTTP {self.status_code}")
@@ -60,9 +74,18 @@ def forbid_network(monkeypatch):
     """Fail loudly if any test reaches for the real network.
 
     Tests that need HTTP re-monkeypatch requests.get / requests.post on the
-    module under test after this fixture has run.
+    module under test (trend_watcher.session.get for the trend fetcher)
+    after this fixture has run.
     """
     def refuse(*args, **kwargs):
         raise AssertionError(f"network access attempted: {args} {kwargs}")
 
     monkeypatch.setattr("requests.sessions.Session.request", refuse)
+
+
+@pytest.fixture(autouse=True)
+def trend_cache_dir(tmp_path, monkeypatch):
+    """Keep the trend fetcher's listing cache per test, out of data/."""
+    path = tmp_path / "trend-cache"
+    monkeypatch.setenv("TREND_CACHE_DIR", str(path))
+    return path
@@ -0,0 +1,320 @@
+"""Sync-engine storage tests against a temporary SQLite database."""
+import asyncio
+import sqlite3
+
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.sqlite import dialect as sqlite_dialect
+
+import config
+import db
+import migrations
+import utils
+from models import NewsMetric
+
+
+def make_post(external_id, score=10, comment_count=1, created_utc=1700000000):
+    return {
+        "external_id": external_id,
+        "thread_id": "ProgrammerHumor",
+        "author": "someone",
+        "created_utc": created_utc,
+        "title": f"Post {external_id}",
+        "body": "",
+        "media_url": None,
+        "score": score,
+        "comment_count": comment_count,
+        "raw_json": external_id,
+    }
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setenv("DEFAULT_SUBSCRIPTIONS", "ProgrammerHumor")
+    asyncio.run(db.init_db(str(tmp_path / "news.db")))
+    yield
+    asyncio.run(db.close_db())
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_upsert_batch_counts_inserted_and_updated(database):
+    first = [make_post("a1"), make_post("b2")]
+    assert run(db.upsert_news_batch(first)) == (2, 0)
+
+    second = [make_post("b2", score=99, comment_count=7), make_post("c3")]
+    assert run(db.upsert_news_batch(second)) == (1, 1)
+
+    news = run(db.get_news_by_thread("ProgrammerHumor"))
+    by_id = {item["external_id"]: item for item in news}
+    assert set(by_id) == {"a1", "b2", "c3"}
+    assert (by_id["b2"]["score"], by_id["b2"]["comment_count"]) == (99, 7)
+    assert by_id["a1"]["added_at"] is not None
+
+
+def test_upsert_batch_keeps_last_duplicate(database):
+    batch = [make_post("a1", score=1), make_post("a1", score=5)]
+    assert run(db.upsert_news_batch(batch)) == (1, 0)
+    news = run(db.get_news_by_thread("ProgrammerHumor"))
+    assert [item["score"] for item in news] == [5]
+
+
+def test_upsert_empty_batch_is_a_no_op(database):
+    assert run(db.upsert_news_batch([])) == (0, 0)
+
+
+def test_sync_cursor_round_trip(database):
+    assert run(db.get_sync_cursor("ProgrammerHumor")) is None
+    run(db.update_sync_cursor("ProgrammerHumor", "t3_a1", 1700000000))
+    assert run(db.get_sync_cursor("ProgrammerHumor")) == {
+        "fullname": "t3_a1", "created_utc": 1700000000, "gap_after": None}
+
+    run(db.set_sync_gap("ProgrammerHumor", "t3_z9"))
+    assert run(db.get_sync_cursor("ProgrammerHumor"))["gap_after"] == "t3_z9"
+    run(db.update_sync_cursor("ProgrammerHumor", "t3_b2", 1700000100))
+    assert run(db.get_sync_cursor("ProgrammerHumor")) == {
+        "fullname": "t3_b2", "created_utc": 1700000100, "gap_after": None}
+
+
+def test_migration_versions_are_consecutive():
+    versions = [version for version, _, _ in migrations.MIGRATIONS]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_migrations_upgrade_an_older_database(tmp_path):
+    path = tmp_path / "legacy.db"
+    legacy = sqlite3.connect(path)
+    legacy.execute(
+        "CREATE TABLE subscriptions (id INTEGER PRIMARY KEY, "
+        "thread_id VARCHAR(255) NOT NULL UNIQUE, title VARCHAR(512), added_at DATETIME)")
+    legacy.execute(
+        "CREATE TABLE news (id INTEGER PRIMARY KEY, external_id VARCHAR(255) NOT NULL UNIQUE, "
+        "thread_id VARCHAR(255), author VARCHAR(255), created_utc INTEGER, title TEXT, "
+        "body TEXT, media_url TEXT, media_uid VARCHAR(255), raw_json TEXT, score INTEGER, "
+        "comment_count INTEGER, added_at DATETIME)")
+    legacy.execute("INSERT INTO subscriptions (thread_id) VALUES ('linuxmemes')")
+    legacy.commit()
+    legacy.close()
+
+    run(db.init_db(str(path)))
+    try:
+        assert run(db.get_sync_cursor("linuxmemes")) is None
+        run(db.update_sync_cursor("linuxmemes", "t3_z9", 1700000001))
+        assert run(db.get_sync_cursor("linuxmemes"))["fullname"] == "t3_z9"
+    finally:
+        run(db.close_db())
+
+    upgraded = sqlite3.connect(path)
+    try:
+        indexes = {row[1] for row in upgraded.execute("PRAGMA index_list(news)")}
+        version = upgraded.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        upgraded.close()
+    assert {"ix_news_thread_created", "ix_news_added_at",
+            "ix_news_pending_media", "ix_news_metrics_due"} <= indexes
+    assert version == migrations.MIGRATIONS[-1][0]
+
+
+def test_migrations_are_idempotent_on_a_fresh_database(database):
+    async def rerun():
+        async with db.engine.begin() as conn:
+            return await conn.run_sync(migrations.run_migrations)
+    assert run(rerun()) == migrations.MIGRATIONS[-1][0]
+
+
+def test_interrupted_migrations_rerun_cleanly(database):
+    # A crash after a step's DDL but before user_version was bumped: every
+    # step runs again over a schema that already has its changes
+    async def rerun_from_scratch():
+        async with db.engine.begin() as conn:
+            await conn.exec_driver_sql("PRAGMA user_version = 0")
+            return await conn.run_sync(migrations.run_migrations)
+    assert run(rerun_from_scratch()) == migrations.MIGRATIONS[-1][0]
+
+
+@pytest.mark.parametrize("age, interval", [
+    (60, 15 * 60),
+    (12 * 3600, 3600),
+    (2 * 86400, 6 * 3600),
+    (5 * 86400, 86400),
+])
+def test_metrics_refresh_interval_grows_with_age(age, interval):
+    now = 1700000000
+    assert utils.next_metrics_refresh(now - age, now) == now + interval
+
+
+def test_old_posts_are_no_longer_refreshed():
+    now = 1700000000
+    assert utils.next_metrics_refresh(now - 8 * 86400, now) is None
+
+
+def add_snapshots(snapshots):
+    async def add():
+        async with db.get_session() as session:
+            await db.add_metric_snapshots(session, snapshots)
+            await session.commit()
+    run(add())
+
+
+def count_snapshots():
+    async def count():
+        async with db.get_session() as session:
+            return (await session.execute(select(func.count()).select_from(NewsMetric))).scalar()
+    return run(count())
+
+
+def test_upsert_writes_one_snapshot_per_post(database):
+    run(db.upsert_news_batch([make_post("a1"), make_post("b2")]))
+    assert count_snapshots() == 2
+
+
+def test_velocity_ranks_by_score_per_hour(database):
+    for external_id in ("slow", "fast", "single"):
+        run(db.add_news(make_post(external_id)))  # no automatic snapshot
+    ids = {item["external_id"]: item["id"]
+           for item in run(db.get_news_by_thread("ProgrammerHumor"))}
+    start = 1700000000
+    add_snapshots([
+        {"news_id": ids["slow"], "observed_at": start, "score": 10, "comment_count": 0},
+        {"news_id": ids["slow"], "observed_at": start + 7200, "score": 30, "comment_count": 4},
+        {"news_id": ids["fast"], "observed_at": start, "score": 10, "comment_count": 0},
+        {"news_id": ids["fast"], "observed_at": start + 1800, "score": 60, "comment_count": 1},
+        {"news_id": ids["fast"], "observed_at": start + 3600, "score": 110, "comment_count": 2},
+        {"news_id": ids["single"], "observed_at": start, "score": 999, "comment_count": 0},
+    ])
+    velocity = run(db.get_news_velocity(since=start))
+    assert [(row["external_id"], row["score_per_hour"]) for row in velocity] == [
+        ("fast", 100.0), ("slow", 10.0)]
+    assert velocity[1]["comment_delta"] == 4
+    assert velocity[1]["hours"] == 2.0
+
+
+def test_velocity_reads_only_the_window_through_its_index(database):
+    async def query_plan():
+        compiled = db.news_velocity_query(since=1700000000).compile(
+            dialect=sqlite_dialect(), compile_kwargs={"literal_binds": True})
+        async with db.get_session() as session:
+            rows = await session.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+            return [row[-1] for row in rows]
+
+    plan = run(query_plan())
+    assert any("news_metrics USING INDEX ix_news_metrics_observed_at" in step
+               for step in plan), plan
+    assert not any(step.startswith("SCAN news_metrics") for step in plan), plan
+
+
+def test_compaction_thins_old_snapshots_and_expires_ancient_ones(database):
+    run(db.add_news(make_post("a1")))
+    news_id = run(db.get_news_by_thread("ProgrammerHumor"))[0]["id"]
+    now = 1800000000
+    hour_start = (now - 3 * 86400) // 3600 * 3600
+    add_snapshots([
+        # three snapshots in one old hour collapse to the first one
+        {"news_id": news_id, "observed_at": hour_start + 60, "score": 1, "comment_count": 0},
+        {"news_id": news_id, "observed_at": hour_start + 900, "score": 2, "comment_count": 0},
+        {"news_id": news_id, "observed_at": hour_start + 1800, "score": 3, "comment_count": 0},
+        # recent snapshots stay raw
+        {"news_id": news_id, "observed_at": now - 600, "score": 4, "comment_count": 0},
+        {"news_id": news_id, "observed_at": now - 300, "score": 5, "comment_count": 0},
+        # past retention
+        {"news_id": news_id, "observed_at": now - 40 * 86400, "score": 0, "comment_count": 0},
+    ])
+    before = count_snapshots()
+    assert run(db.compact_news_metrics(now=now)) == 3
+    assert count_snapshots() == before - 3
+
+
+def test_performance_profile_applied_to_connections(database):
+    applied = run(db.effective_pragmas(["journal_mode", "synchronous", "temp_store",
+                                        "busy_timeout", "cache_size"]))
+    assert applied == {"journal_mode": "wal", "synchronous": 1, "temp_store": 2,
+                       "busy_timeout": 5000, "cache_size": -65536}
+
+
+def test_pragma_overrides_and_validation(monkeypatch):
+    monkeypatch.setenv("SQLITE_PROFILE", "performance")
+    monkeypatch.setenv("SQLITE_CACHE_SIZE", "-131072")
+    assert config.sqlite_pragmas()["cache_size"] == "-131072"
+    monkeypatch.setenv("SQLITE_BUSY_TIMEOUT", "1; DROP TABLE news")
+    with pytest.raises(ValueError):
+        config.sqlite_pragmas()
+    monkeypatch.delenv("SQLITE_BUSY_TIMEOUT")
+    monkeypatch.delenv("SQLITE_CACHE_SIZE")
+    monkeypatch.setenv("SQLITE_PROFILE", "default")
+    assert config.sqlite_pragmas() == {}
+
+
+def walk_pages(fetch):
+    pages, cursor = [], None
+    while True:
+        items, cursor = run(fetch(cursor))
+        pages.append([item["external_id"] for item in items])
+        if cursor is None:
+            return pages
+
+
+def test_news_pages_walk_the_archive_without_gaps(database):
+    # several posts per added_at batch exercise the id tiebreak
+    for batch in range(3):
+        run(db.upsert_news_batch([make_post(f"b{batch}p{post}") for post in range(3)]))
+    pages = walk_pages(lambda cursor: db.get_news_page(before=cursor, limit=4))
+    flat = [external_id for page in pages for external_id in page]
+    assert [len(page) for page in pages] == [4, 4, 1]
+    assert sorted(flat) == sorted(f"b{batch}p{post}" for batch in range(3) for post in range(3))
+    assert flat[0] == "b2p2"  # newest added first
+    assert "body" not in run(db.get_news_page(limit=1))[0][0]
+
+
+def test_thread_pages_order_by_creation_time(database):
+    run(db.upsert_news_batch([
+        make_post(f"p{number}", created_utc=1700000000 + number % 3) for number in range(7)]))
+    pages = walk_pages(
+        lambda cursor: db.get_thread_news_page("ProgrammerHumor", before=cursor, limit=3))
+    assert pages == [["p5", "p2", "p4"], ["p1", "p6", "p3"], ["p0"]]
+    older = run(db.get_news_by_thread("ProgrammerHumor", before=(1700000001, 10**9)))
+    assert [item["external_id"] for item in older] == ["p4", "p1", "p6", "p3", "p0"]
+
+
+def test_thread_pages_reach_posts_without_creation_time(database):
+    run(db.upsert_news_batch(
+        [make_post(f"p{number}", created_utc=1700000000 + number) for number in range(3)]
+        + [make_post(f"n{number}", created_utc=None) for number in range(4)]))
+    pages = walk_pages(
+        lambda cursor: db.get_thread_news_page("ProgrammerHumor", before=cursor, limit=2))
+    # NULL keys sort last; a cursor inside the NULL tail keeps paging by id
+    assert pages == [["p2", "p1"], ["p0", "n3"], ["n2", "n1"], ["n0"]]
+
+
+def media_info(uid_filename, sha256, url):
+    return {"uid_filename": uid_filename, "original_url": url, "content_type": "image/png",
+            "kind": "image", "size_bytes": 10, "sha256": sha256}
+
+
+def test_reposted_media_shares_one_row(database):
+    run(db.upsert_news_batch([make_post("a1"), make_post("b2"), make_post("c3")]))
+    stored = run(db.add_media(news_external_id="a1",
+                              **media_info("f00.png", "f00", "https://i.redd.it/x.png")))
+    again = run(db.add_media(news_external_id="b2",
+                             **media_info("f00.png", "f00", "https://i.imgur.com/y.png")))
+    assert stored == again == "f00.png"
+    run(db.reuse_media("c3", "f00.png"))
+
+    assert run(db.get_media_info("f00.png"))["refcount"] == 3
+    assert run(db.get_media_by_url("https://i.redd.it/x.png"))["uid_filename"] == "f00.png"
+    assert run(db.get_media_by_url("https://i.imgur.com/y.png")) is None  # second row deduped
+    news = run(db.get_news_by_thread("ProgrammerHumor"))
+    assert {item["media_uid"] for item in news} == {"f00.png"}
+
+
+def test_media_insert_conflict_links_the_existing_row(database):
+    run(db.upsert_news_batch([make_post("a1")]))
+    # a file recorded before content addressing: same name, no sha256
+    run(db.add_media(**media_info("f00.png", None, "https://i.redd.it/x.png")))
+    stored = run(db.add_media(news_external_id="a1",
+                              **media_info("f00.png", "f00", "https://i.redd.it/x.png")))
+    assert stored == "f00.png"
+    assert run(db.get_news_by_thread("ProgrammerHumor"))[0]["media_uid"] == "f00.png"
+    assert run(db.get_media_info("f00.png"))["refcount"] == 1
+    assert run(db.get_pending_media()) == []
@@ -0,0 +1,238 @@
+"""Media downloader tests against an in-process httpx transport."""
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+
+import media_downloader
+import utils
+
+PNG_HEAD = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+WEBP_HEAD = b"RIFF\x24\x00\x00\x00WEBPVP8 " + b"\x00" * 32
+
+
+@pytest.mark.parametrize("head, declared, mime", [
+    (PNG_HEAD, "image/jpeg", "image/png"),
+    (WEBP_HEAD, "image/jpeg", "image/webp"),
+    (b"\x00\x00\x00\x18ftypmp42" + b"\x00" * 16, None, "video/mp4"),
+    (b"\x00\x00\x00\x14ftypqt  " + b"\x00" * 16, None, "video/quicktime"),
+    (b"\x00\x00\x00\x18ftypheic" + b"\x00" * 16, "video/mp4", "image/heic"),
+    (b"\x00\x00\x00\x18ftypmif1" + b"\x00" * 16, None, "image/heif"),
+    (b"\x00\x00\x00\x1cftypavif" + b"\x00" * 16, None, "image/avif"),
+    (b"%PDF-1.7\n", "application/octet-stream", "application/pdf"),
+    (b"  \n<!DOCTYPE HTML><html>", "application/octet-stream", "text/html; charset=utf-8"),
+    (b"plain bytes", "Text/Plain; charset=utf-8", "text/plain"),
+    (b"plain bytes", None, "application/octet-stream"),
+])
+def test_sniff_media_type_prefers_bytes_over_header(head, declared, mime):
+    assert utils.sniff_media_type(head, declared) == mime
+
+
+@pytest.mark.parametrize("head, declared, charset", [
+    (b'<html><head><meta charset="Windows-1251">\xcf\xf0\xe8', None, "windows-1251"),
+    (b'<html><meta http-equiv="Content-Type" content="text/html; charset=koi8-r">',
+     "text/html; charset=utf-8", "koi8-r"),
+    (b"<html><p>\xd0\x9f\xd1", "text/html; charset=Shift_JIS", "shift_jis"),
+    (b"<html><p>caf\xc3\xa9 \xd0", None, "utf-8"),  # cut mid-character
+    (b"<html><p>caf\xe9</p>", None, "iso-8859-1"),
+    (b'<html><meta charset="no-such-charset">caf\xe9!', None, "iso-8859-1"),
+])
+def test_html_charset_is_kept_for_saved_pages(head, declared, charset):
+    assert utils.sniff_media_type(head, declared) == f"text/html; charset={charset}"
+
+
+def test_media_kind():
+    assert [utils.media_kind(mime) for mime in (
+        "image/gif", "video/webm", "text/html; charset=cp1251", "application/pdf",
+        "text/plain", "image/avif", None,
+    )] == ["image", "video", "html", "pdf", "other", "image", "other"]
+
+
+def download(handler, url, tmp_path):
+    async def fetch():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await media_downloader.download_file(client, url, tmp_path, 10**6)
+    return asyncio.run(fetch())
+
+
+def test_download_records_sniffed_type_and_kind(tmp_path):
+    body = WEBP_HEAD + b"\x01" * 2000
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "image/jpeg"}, content=body)
+
+    info = download(handler, "https://i.redd.it/abc.jpg", tmp_path)
+    assert (info["content_type"], info["kind"]) == ("image/webp", "image")
+    assert (tmp_path / info["uid_filename"]).read_bytes() == body
+    assert info["size_bytes"] == len(body)
+
+
+def test_pool_stats_count_reused_connections():
+    stats = media_downloader.PoolStats()
+
+    async def replay():
+        for event in ("connection.connect_tcp.complete", "connection.start_tls.complete",
+                      "http11.send_request_headers.started",
+                      "http11.send_request_headers.started",
+                      "http2.send_request_headers.started"):
+            await stats.trace(event, {})
+    asyncio.run(replay())
+    assert (stats.requests, stats.connections, stats.reused, stats.tls_handshakes) == (3, 1, 2, 1)
+
+
+def test_shared_client_still_blocks_redirects_off_the_allowlist(tmp_path):
+    def handler(request):
+        if request.url.host == "i.redd.it":
+            return httpx.Response(302, headers={"location": "http://169.254.169.254/"})
+        return httpx.Response(200, content=PNG_HEAD)
+
+    async def fetch():
+        transport = httpx.MockTransport(handler)
+        async with media_downloader.http_client(transport=transport) as (client, _):
+            with pytest.raises(ValueError, match="allowlist"):
+                await client.get("https://i.redd.it/abc.png")
+    asyncio.run(fetch())
+
+
+def test_http_client_counts_requests_and_reused_connections():
+    open_hosts = set()
+
+    async def handler(request):
+        # Report what httpcore would: one TLS connection per host, then reuse
+        trace = request.extensions["trace"]
+        if request.url.host not in open_hosts:
+            open_hosts.add(request.url.host)
+            await trace("connection.connect_tcp.complete", {})
+            await trace("connection.start_tls.complete", {})
+        await trace("http11.send_request_headers.started", {})
+        if request.url.path == "/moved.png":
+            return httpx.Response(301, headers={"location": "https://i.imgur.com/abc.png"})
+        if request.url.host == "i.imgur.com" and request.url.path == "/evil.png":
+            return httpx.Response(302, headers={"location": "http://169.254.169.254/"})
+        return httpx.Response(200, content=PNG_HEAD)
+
+    async def fetch():
+        transport = httpx.MockTransport(handler)
+        async with media_downloader.http_client(transport=transport) as (client, stats):
+            await client.get("https://i.redd.it/a.png")
+            await client.get("https://i.redd.it/b.png")
+            await client.get("https://i.redd.it/moved.png")  # + a hop to i.imgur.com
+            with pytest.raises(ValueError, match="allowlist"):
+                await client.get("https://i.imgur.com/evil.png")  # hop never sent
+        return stats
+    stats = asyncio.run(fetch())
+    assert (stats.requests, stats.connections, stats.reused, stats.tls_handshakes) == (5, 2, 3, 2)
+    assert str(stats) == "5 requests over 2 connections (3 reused, 2 TLS handshakes)"
+
+
+def test_identical_bytes_share_one_content_addressed_file(tmp_path):
+    body = PNG_HEAD + b"\x02" * 500
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "image/png"}, content=body)
+
+    first = download(handler, "https://i.redd.it/original.png", tmp_path)
+    repost = download(handler, "https://i.imgur.com/repost.jpg", tmp_path)
+    assert first["uid_filename"] == repost["uid_filename"] == f"{first['sha256']}.png"
+    assert [path.name for path in tmp_path.iterdir()] == [first["uid_filename"]]
+
+
+BIG_BODY = PNG_HEAD + bytes(range(256)) * 40
+
+
+def download_once(handler, url, tmp_path):
+    """One download_file attempt, without tenacity's retry and back-off."""
+    async def fetch():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await media_downloader.download_file.__wrapped__(client, url, tmp_path, 10**6)
+    return asyncio.run(fetch())
+
+
+def interrupted_then(second_response, first_headers=None):
+    requests = []
+
+    async def cut_off():
+        yield BIG_BODY[:3000]
+        raise httpx.ReadError("connection reset")
+
+    def handler(request):
+        requests.append(request.headers.get("range"))
+        if len(requests) == 1:
+            headers = {"content-length": str(len(BIG_BODY)), "etag": '"v1"'}
+            if first_headers is not None:
+                headers = first_headers
+            return httpx.Response(200, headers=headers, content=cut_off())
+        return second_response(request)
+    return handler, requests
+
+
+def partial(request):
+    start = int(request.headers["range"][len("bytes="):-1])
+    return httpx.Response(206, content=BIG_BODY[start:], headers={
+        "content-range": f"bytes {start}-{len(BIG_BODY) - 1}/{len(BIG_BODY)}"})
+
+
+def test_interrupted_download_resumes_with_range(tmp_path):
+    resumed = []
+
+    def checked_partial(request):
+        resumed.append((request.headers["if-range"], request.headers["accept-encoding"]))
+        return partial(request)
+
+    handler, requests = interrupted_then(checked_partial)
+    with pytest.raises(httpx.ReadError):
+        download_once(handler, "https://v.redd.it/big.mp4", tmp_path)
+    [part] = tmp_path.glob("*.part")
+    assert part.stat().st_size == 3000
+
+    info = download_once(handler, "https://v.redd.it/big.mp4", tmp_path)
+    assert requests == [None, "bytes=3000-"]
+    assert resumed == [('"v1"', "identity")]
+    assert (tmp_path / info["uid_filename"]).read_bytes() == BIG_BODY
+    assert info["sha256"] == hashlib.sha256(BIG_BODY).hexdigest()
+    assert sorted(path.name for path in tmp_path.iterdir()) == [info["uid_filename"]]
+
+
+def test_changed_file_comes_back_whole_on_if_range_mismatch(tmp_path):
+    new_body = PNG_HEAD + bytes(range(255, -1, -1)) * 40
+
+    def changed(request):
+        assert request.headers["if-range"] == '"v1"'
+        return httpx.Response(200, content=new_body, headers={"etag": '"v2"'})
+
+    handler, requests = interrupted_then(changed)
+    with pytest.raises(httpx.ReadError):
+        download_once(handler, "https://v.redd.it/big.mp4", tmp_path)
+    info = download_once(handler, "https://v.redd.it/big.mp4", tmp_path)
+    assert (tmp_path / info["uid_filename"]).read_bytes() == new_body
+
+
+def test_part_without_validator_is_not_resumed(tmp_path):
+    handler, requests = interrupted_then(
+        lambda request: httpx.Response(200, content=BIG_BODY),
+        first_headers={"content-length": str(len(BIG_BODY)), "etag": 'W/"weak"'})
+    with pytest.raises(httpx.ReadError):
+        download_once(handler, "https://v.redd.it/big.mp4", tmp_path)
+    assert not list(tmp_path.glob("*.validator"))
+    info = download_once(handler, "https://v.redd.it/big.mp4", tmp_path)
+    assert requests == [None, None]  # a Range without If-Range could splice two files
+    assert (tmp_path / info["uid_filename"]).read_bytes() == BIG_BODY
+
+
+def test_server_ignoring_range_restarts_from_zero(tmp_path):
+    handler, requests = interrupted_then(lambda request: httpx.Response(200, content=BIG_BODY))
+    with pytest.raises(httpx.ReadError):
+        download_once(handler, "https://i.imgur.com/big.png", tmp_path)
+    info = download_once(handler, "https://i.imgur.com/big.png", tmp_path)
+    assert (tmp_path / info["uid_filename"]).read_bytes() == BIG_BODY
+
+
+def test_short_body_is_kept_as_part_for_the_retry(tmp_path):
+    def handler(request):
+        return httpx.Response(200, content=BIG_BODY[:100],
+                              headers={"content-length": str(len(BIG_BODY))})
+
+    with pytest.raises((ValueError, httpx.HTTPError)):
+        download_once(handler, "https://i.redd.it/short.png", tmp_path)
+    assert [path.suffix for path in tmp_path.iterdir()] == [".part"]
@@ -1,5 +1,9 @@
 """Selection/threshold tests for publish_trends.pick_unsent and env parsing."""
+import sqlite3
+import threading
+
 import pytest
+import requests
 
 import publish_trends
 import published_store
@@ -18,6 +22,13 @@ def make_candidate(reddit_id, title="A meme", image_url="https://i.redd.it/x.jpg
     }
 
 
+@pytest.fixture(autouse=True)
+def shared_store_closed():
+    """publish_once opens the process-wide store; close it between tests."""
+    yield
+    published_store.close_store()
+
+
 @pytest.fixture
 def store(tmp_path, monkeypatch):
     monkeypatch.setenv("PUBLISHED_DB", str(tmp_path / "published.sqlite"))
@@ -115,7 +126,7 @@ def listing_stubs(monkeypatch):
     feeds = {}
     scores = {}
 
-    def fake_fetch_listing(subreddit, listing="rising", retries=4, pause=35):
+    def fake_fetch_listing(subreddit, listing="rising", retries=4, pause=35, lazy=False):
         fetched.append(listing)
         return feeds.get(listing, [])
 
@@ -124,7 +135,6 @@ def listing_stubs(monkeypatch):
 
     monkeypatch.setattr(trend_watcher, "fetch_listing", fake_fetch_listing)
     monkeypatch.setattr(trend_watcher, "listing_scores", fake_listing_scores)
-    monkeypatch.setattr(publish_trends.time, "sleep", lambda seconds: None)
     return {"fetched": fetched, "feeds": feeds, "scores": scores}
 
 
@@ -179,6 +189,37 @@ def test_select_candidate_skips_published_in_fallback(store, listing_stubs):
     assert choice["reddit_id"] == "1new77"
 
 
+def test_select_candidate_skips_unreadable_listing(store, listing_stubs, monkeypatch):
+    import trend_watcher
+
+    def broken_feed(subreddit, listing="rising", retries=4, pause=35, lazy=False):
+        listing_stubs["fetched"].append(listing)
+        if listing == "rising":
+            raise requests.HTTPError("503 Service Unavailable")
+        return [make_candidate("1top99")]
+
+    monkeypatch.setattr(trend_watcher, "fetch_listing", broken_feed)
+    listing_stubs["scores"]["top:week"] = {"1top99": 4200}
+
+    choice, scores = publish_trends.select_candidate(store, "ProgrammerHumor", 500)
+
+    assert choice["reddit_id"] == "1top99"
+    assert listing_stubs["fetched"] == ["rising", "top:week"]
+
+
+def test_select_candidate_store_errors_are_not_fetch_errors(listing_stubs, monkeypatch):
+    listing_stubs["feeds"]["rising"] = [make_candidate("1hot42")]
+    listing_stubs["scores"]["rising"] = {"1hot42": 900}
+
+    def broken_store(connection, reddit_ids):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(published_store, "published_subset", broken_store)
+    with pytest.raises(sqlite3.OperationalError):
+        publish_trends.select_candidate(None, "ProgrammerHumor", 500)
+    assert listing_stubs["fetched"] == ["rising"]  # not skipped as "could not fetch"
+
+
 def test_publish_once_limits_to_given_subreddits(monkeypatch, tmp_path):
     monkeypatch.setenv("PUBLISHED_DB", str(tmp_path / "published.sqlite"))
     monkeypatch.setenv("TELEGRAM_TOKEN", "token")
@@ -186,7 +227,7 @@ def test_publish_once_limits_to_given_subreddits(monkeypatch, tmp_path):
     monkeypatch.setenv("TREND_SUBREDDITS", "ProgrammerHumor,funnyAnimals,linuxmemes")
     asked = []
 
-    def fake_select(connection, subreddit, threshold):
+    def fake_select(connection, subreddit, threshold, published=None):
         asked.append(subreddit)
         return None, {}
 
@@ -202,11 +243,43 @@ def test_publish_once_defaults_to_tracked_subreddits(monkeypatch, tmp_path):
     monkeypatch.setenv("TREND_SUBREDDITS", "a,b")
     asked = []
 
-    def fake_select(connection, subreddit, threshold):
+    def fake_select(connection, subreddit, threshold, published=None):
         asked.append(subreddit)
         return None, {}
 
     monkeypatch.setattr(publish_trends, "select_candidate", fake_select)
-    monkeypatch.setattr(publish_trends.time, "sleep", lambda seconds: None)
     publish_trends.publish_once(dry_run=True)
-    assert asked == ["a", "b"]
+    assert sorted(asked) == ["a", "b"]  # prefetched concurrently
+
+
+def test_known_ids_are_checked_without_the_store():
+    candidates = iter([make_candidate("1abc23"), make_candidate("1def45"),
+                       make_candidate("1ghi78")])
+    scores = {"1abc23": 900, "1def45": 800, "1ghi78": 700}
+    choice = publish_trends.pick_unsent(None, candidates, scores, 500, {"1abc23"})
+    assert choice["reddit_id"] == "1def45"
+    assert next(candidates)["reddit_id"] == "1ghi78"  # not read past the pick
+
+
+def test_publish_once_prefetches_in_parallel_and_sends_in_one_lane(monkeypatch, tmp_path):
+    monkeypatch.setenv("PUBLISHED_DB", str(tmp_path / "published.sqlite"))
+    monkeypatch.setenv("TELEGRAM_TOKEN", "token")
+    monkeypatch.setenv("TELEGRAM_CHANNEL_ID", "-100")
+    all_started = threading.Barrier(3, timeout=5)
+    sent = []
+
+    def fake_select(connection, subreddit, threshold, published=None):
+        all_started.wait()  # times out unless the three run side by side
+        return make_candidate(f"1{subreddit}"), {f"1{subreddit}": 900}
+
+    def fake_send_photo(token, chat_id, image_url, caption):
+        sent.append(threading.current_thread().name)
+        return {"message_id": len(sent)}
+
+    monkeypatch.setattr(publish_trends, "select_candidate", fake_select)
+    monkeypatch.setattr(publish_trends.telegram_publisher, "send_photo", fake_send_photo)
+    published = publish_trends.publish_once(subreddits=["a", "b", "c"])
+
+    assert sorted(message_id for _, _, message_id in published) == [1, 2, 3]
+    assert set(sent) == {threading.current_thread().name}  # one send lane
+    assert published_store.get_store().published_ids() == {"1a", "1b", "1c"}
@@ -54,7 +54,7 @@ def test_remark_replaces_existing_row(store):
     rows = store.execute(
         "SELECT telegram_message_id FROM published WHERE reddit_id = ?",
         ("1ghi78",)).fetchall()
-    assert rows == [(2,)]  # INSERT OR REPLACE keeps a single row
+    assert rows == [(2,)]  # the upsert keeps a single row
 
 
 def test_dedup_survives_reopen(tmp_path, monkeypatch):
@@ -68,3 +68,51 @@ def test_dedup_survives_reopen(tmp_path, monkeypatch):
         assert published_store.is_published(second, "1jkl90") is True
     finally:
         second.close()
+
+
+def test_published_subset_in_batches(store, monkeypatch):
+    monkeypatch.setattr(published_store, "LOOKUP_BATCH", 2)
+    for reddit_id in ("1aaa", "1ccc", "1eee"):
+        published_store.mark_published(store, reddit_id, "linuxmemes", "t", "https://p", 1)
+    asked = ["1aaa", "1bbb", "1ccc", "1ddd", "1eee", "1aaa"]
+    assert published_store.published_subset(store, asked) == {"1aaa", "1ccc", "1eee"}
+    assert published_store.published_subset(store, []) == set()
+    assert published_store.published_ids(store) == {"1aaa", "1ccc", "1eee"}
+
+
+def test_store_uses_wal_and_history_index(tmp_path):
+    store = published_store.PublishedStore(tmp_path / "published.sqlite")
+    try:
+        with store.connection() as connection:
+            assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+            indexes = {row[1] for row in connection.execute("PRAGMA index_list(published)")}
+        assert "ix_published_subreddit_time" in indexes
+        store.mark_published("1mno12", "linuxmemes", "t", "https://p", 5)
+        assert store.published_ids() == {"1mno12"}
+    finally:
+        store.close()
+
+
+def test_pool_hands_overlapping_jobs_their_own_connection(tmp_path):
+    store = published_store.PublishedStore(tmp_path / "published.sqlite", pool_size=2)
+    try:
+        with store.connection() as first, store.connection() as second:
+            assert first is not second
+            first.execute("BEGIN IMMEDIATE")  # a writer holds the lock ...
+            assert second.execute("SELECT COUNT(*) FROM published").fetchone() == (0,)
+            first.rollback()  # ... while WAL lets the other job read
+        with store.connection() as again:
+            assert again in (first, second)  # returned to the pool, reused
+    finally:
+        store.close()
+
+
+def test_shared_store_follows_the_configured_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("PUBLISHED_DB", str(tmp_path / "a.sqlite"))
+    try:
+        store = published_store.get_store()
+        assert published_store.get_store() is store
+        monkeypatch.setenv("PUBLISHED_DB", str(tmp_path / "b.sqlite"))
+        assert published_store.get_store().path == (tmp_path / "b.sqlite").resolve()
+    finally:
+        published_store.close_store()
@@ -0,0 +1,23 @@
+"""Pacing tests for rate_limit.HostRateLimiter with a frozen clock."""
+import pytest
+
+import rate_limit
+
+
+def test_burst_then_paced_per_host(monkeypatch):
+    slept = []
+    monkeypatch.setattr(rate_limit.time, "sleep", slept.append)
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: 1000.0)
+    limiter = rate_limit.HostRateLimiter(per_minute=6, burst=2)  # 10 s apart
+    waits = [limiter.acquire("https://old.reddit.com/r/a/rising.rss")
+             for _ in range(4)]
+    assert waits == [0.0, 0.0, 10.0, 20.0]
+    assert slept == [10.0, 20.0]
+    # another host has its own bucket
+    assert limiter.acquire("https://i.redd.it/x.png") == 0.0
+
+
+@pytest.mark.parametrize("per_minute", [0, -5])
+def test_rejects_non_positive_rate(per_minute):
+    with pytest.raises(ValueError):
+        rate_limit.HostRateLimiter(per_minute=per_minute)
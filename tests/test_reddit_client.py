@@ -0,0 +1,202 @@
+"""Submission-source tests for reddit_client against a fake PRAW client."""
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from tenacity import wait_none
+
+import reddit_client
+
+
+def make_submission(number):
+    return SimpleNamespace(
+        id=f"p{number}",
+        author="someone",
+        created_utc=1700000000 - number,
+        title=f"Post {number}",
+        selftext="",
+        score=number,
+        num_comments=0,
+        is_video=False,
+        url=f"https://i.redd.it/p{number}.jpg",
+    )
+
+
+class FakeSubreddit:
+
+    def __init__(self, submissions, calls):
+        self.submissions = submissions
+        self.calls = calls
+
+    def new(self, limit, params=None):
+        after = (params or {}).get("after")
+        self.calls.append((limit, after))
+        start = 0
+        if after:
+            ids = [f"t3_{submission.id}" for submission in self.submissions]
+            start = ids.index(after) + 1
+        return iter(self.submissions[start:start + limit])
+
+
+class FakeReddit:
+
+    def __init__(self, total, limits=None):
+        self.calls = []
+        self.submissions = [make_submission(number) for number in range(total)]
+        self.auth = SimpleNamespace(limits=limits or {})
+
+    def subreddit(self, thread_id):
+        return FakeSubreddit(self.submissions, self.calls)
+
+
+def collect_pages(reddit, limit, cursor=None):
+    async def collect():
+        return [page async for page in reddit_client.iter_submission_pages(
+            reddit, "ProgrammerHumor", limit, cursor=cursor)]
+    return asyncio.run(collect())
+
+
+def test_pages_follow_after_cursor():
+    reddit = FakeReddit(250)
+    pages = collect_pages(reddit, 1000)
+    assert [len(page) for page in pages] == [100, 100, 50]
+    assert reddit.calls == [(100, None), (100, "t3_p99"), (100, "t3_p199")]
+    assert pages[0][0]["external_id"] == "p0"
+    assert pages[0][0]["thread_id"] == "ProgrammerHumor"
+
+
+def test_limit_caps_last_page_request():
+    reddit = FakeReddit(250)
+    pages = collect_pages(reddit, 130)
+    assert [len(page) for page in pages] == [100, 30]
+    assert reddit.calls == [(100, None), (30, "t3_p99")]
+
+
+def test_quiet_subreddit_costs_one_probe_request():
+    reddit = FakeReddit(250)
+    cursor = {"fullname": "t3_p0", "created_utc": 1700000000}
+    assert collect_pages(reddit, 100, cursor) == []
+    assert reddit.calls == [(reddit_client.PROBE_PAGE_SIZE, None)]
+
+
+def test_walk_stops_at_cursor_after_probe():
+    reddit = FakeReddit(250)
+    cursor = {"fullname": "t3_p42", "created_utc": 1700000000 - 42}
+    pages = collect_pages(reddit, 1000, cursor)
+    assert [len(page) for page in pages] == [10, 32]
+    assert pages[-1][-1]["external_id"] == "p41"
+    assert reddit.calls == [(10, None), (100, "t3_p9")]
+
+
+def test_deleted_cursor_post_still_stops_the_walk():
+    reddit = FakeReddit(250)
+    del reddit.submissions[5]  # the cursor post p5 is gone from the listing
+    cursor = {"fullname": "t3_p5", "created_utc": 1700000000 - 5}
+    pages = collect_pages(reddit, 1000, cursor)
+    assert [post["external_id"] for post in pages[0]] == ["p0", "p1", "p2", "p3", "p4"]
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(reddit_client.budgeted_request.retry, "wait", wait_none())
+
+
+def test_fetch_errors_reach_the_consumer(no_backoff):
+    reddit = FakeReddit(10)
+    attempts = []
+
+    def broken_subreddit(thread_id):
+        attempts.append(thread_id)
+        raise RuntimeError("boom")
+
+    reddit.subreddit = broken_subreddit
+    with pytest.raises(RuntimeError, match="boom"):
+        collect_pages(reddit, 10)
+    assert len(attempts) == 3  # retried before giving up
+
+
+def test_transient_page_error_is_retried(no_backoff):
+    reddit = FakeReddit(250)
+    subreddit = reddit.subreddit
+    failures = [RuntimeError("503 Service Unavailable")]
+
+    def flaky_subreddit(thread_id):
+        if failures:
+            raise failures.pop()
+        return subreddit(thread_id)
+
+    reddit.subreddit = flaky_subreddit
+    pages = collect_pages(reddit, 130)
+    assert [len(page) for page in pages] == [100, 30]
+
+
+def test_rate_limit_delay_spreads_remaining_budget():
+    limits = {"remaining": 50.0, "reset_timestamp": 1100.0, "used": 550}
+    assert reddit_client.rate_limit_delay(limits, now=1000.0) == 2.0
+
+
+def test_rate_limit_delay_waits_for_reset_when_exhausted():
+    limits = {"remaining": 0.0, "reset_timestamp": 1030.0}
+    assert reddit_client.rate_limit_delay(limits, now=1000.0) == 30.0
+
+
+def test_rate_limit_delay_unknown_before_first_response():
+    assert reddit_client.rate_limit_delay(
+        {"remaining": None, "reset_timestamp": None}) == 0.0
+
+
+def test_budget_narrows_to_reported_pace():
+    budget = reddit_client.RateBudget(requests_per_window=600, window=600.0, burst=10)
+    budget.observe({"remaining": 5.0, "reset_timestamp": None})
+    assert budget.rate == 1.0  # reset unknown: allowance pace, tokens capped
+    assert budget.tokens <= 5.0
+    budget.observe({"remaining": 0.0, "reset_timestamp": 10**12})
+    assert budget.rate < 1e-6  # exhausted: wait for the reset
+    assert budget.tokens <= 0.0
+
+
+def test_budget_burst_then_waits():
+    budget = reddit_client.RateBudget(requests_per_window=6000, window=60.0, burst=2)
+
+    async def take(count):
+        for _ in range(count):
+            await budget.acquire()
+
+    asyncio.run(take(3))  # third token refills after ~10 ms at 100 req/s
+    assert budget.tokens < 1
+
+
+def test_client_contexts_own_their_pools(monkeypatch):
+    monkeypatch.setattr(reddit_client.praw, "Reddit", lambda **kwargs: SimpleNamespace())
+
+    async def overlapping_jobs():
+        async with reddit_client.reddit_client("id", "secret", "agent") as sync_client:
+            async with reddit_client.reddit_client(
+                "id", "secret", "agent", fetch_threads=1
+            ) as metrics_client:
+                assert metrics_client.executor is not sync_client.executor
+            # the metrics job finishing must not take the sync job's pool down
+            return await asyncio.get_running_loop().run_in_executor(
+                sync_client.executor, lambda: "still running")
+
+    assert asyncio.run(overlapping_jobs()) == "still running"
+
+
+def test_budget_shared_across_event_loops():
+    budget = reddit_client.RateBudget(requests_per_window=600, window=60.0, burst=2)
+    errors = []
+
+    def job():
+        try:
+            asyncio.run(budget.acquire())
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=job) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert budget.tokens < 0.5  # four tokens came out of a burst of two
@@ -0,0 +1,54 @@
+"""Rendition cache tests: render once, LRU eviction, thumbnail sizing."""
+import os
+
+from PIL import Image
+
+from web import renditions
+
+
+def solid(width=400, height=300):
+    return Image.new("RGB", (width, height), (200, 30, 30))
+
+
+def test_rendition_rendered_once_then_served_from_disk(tmp_path):
+    cache = renditions.RenditionCache(tmp_path / "renditions", max_bytes=10**7)
+    calls = []
+
+    def render():
+        calls.append(1)
+        return solid()
+
+    first = cache.get("abc.jpg", "w160", "jpeg", render)
+    second = cache.get("abc.jpg", "w160", "jpeg", render)
+    assert first == second == (tmp_path / "renditions" / "abc.jpg.w160.jpg", "image/jpeg")
+    assert len(calls) == 1
+    assert not list((tmp_path / "renditions").glob("*.tmp"))
+
+
+def test_unrenderable_source_is_not_cached(tmp_path):
+    cache = renditions.RenditionCache(tmp_path, max_bytes=10**7)
+    assert cache.get("empty.pdf", "preview", "png", lambda: None) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = renditions.RenditionCache(tmp_path, max_bytes=10**7)
+    for name in ("old", "used", "new"):
+        cache.get(name, "preview", "png", solid)
+    entry_size = os.path.getsize(cache.path_for("old", "preview", "png"))
+    os.utime(cache.path_for("old", "preview", "png"), (1000, 1000))
+    os.utime(cache.path_for("used", "preview", "png"), (2000, 1000))
+    cache.get("used", "preview", "png", solid)  # hit: now the most recent
+
+    cache.max_bytes = entry_size * 3
+    cache.get("newest", "preview", "png", solid)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "new.preview.png", "newest.preview.png", "used.preview.png"]
+
+
+def test_thumb_widths_snap_up_and_never_upscale():
+    assert renditions.thumb_width(None) == renditions.DEFAULT_THUMB_WIDTH
+    assert renditions.thumb_width(100) == 160
+    assert renditions.thumb_width(5000) == renditions.THUMB_WIDTHS[-1]
+    assert renditions.shrink_to_width(solid(800, 600), 160).size == (160, 120)
+    assert renditions.shrink_to_width(solid(100, 50), 160).size == (100, 50)
@@ -0,0 +1,328 @@
+"""Fan-out tests for sync_worker.sync_all with a stubbed sync_thread."""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from sqlalchemy import select, update
+
+import db
+import sync_worker
+from models import MediaJob, News
+
+
+@pytest.fixture
+def subscriptions(tmp_path, monkeypatch):
+    names = ["a", "b", "broken", "c", "d"]
+    monkeypatch.setenv("DEFAULT_SUBSCRIPTIONS", ",".join(names))
+    asyncio.run(db.init_db(str(tmp_path / "news.db")))
+    yield names
+    asyncio.run(db.close_db())
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_failed_thread_does_not_stop_the_others(subscriptions, monkeypatch, workers):
+    synced = []
+    budgets = set()
+    reddits = []
+
+    async def fake_sync_thread(reddit, thread_id, limit=100, budget=None, executor=None):
+        await asyncio.sleep(0)
+        if all(reddit is not seen for seen in reddits):
+            reddits.append(reddit)
+        if thread_id == "broken":
+            raise RuntimeError("subreddit is private")
+        synced.append(thread_id)
+        budgets.add(id(budget))
+        return 1
+
+    monkeypatch.setattr(sync_worker, "sync_thread", fake_sync_thread)
+    asyncio.run(sync_worker.sync_all(object(), workers=workers, connect=object))
+    assert sorted(synced) == ["a", "b", "c", "d"]
+    assert len(budgets) == 1  # every worker draws from the same budget
+    assert len(reddits) == workers  # PRAW is not thread-safe: one instance each
+
+
+def test_max_posts_stops_starting_new_threads(subscriptions, monkeypatch):
+    synced = []
+
+    async def fake_sync_thread(reddit, thread_id, limit=100, budget=None, executor=None):
+        synced.append((thread_id, limit))
+        return 2
+
+    monkeypatch.setattr(sync_worker, "sync_thread", fake_sync_thread)
+    asyncio.run(sync_worker.sync_all(None, max_posts=3))
+    assert synced == [("a", 3), ("b", 1)]
+
+
+def test_max_posts_bounds_concurrent_workers(subscriptions, monkeypatch):
+    in_flight, peaks, processed = {}, [], []
+
+    async def fake_sync_thread(reddit, thread_id, limit=100, budget=None, executor=None):
+        in_flight[thread_id] = limit
+        peaks.append((len(in_flight), sum(in_flight.values())))
+        await asyncio.sleep(0.01)
+        del in_flight[thread_id]
+        processed.append(limit - 1 if thread_id == "a" else limit)  # "a" had one known post
+        return processed[-1]
+
+    monkeypatch.setattr(sync_worker, "sync_thread", fake_sync_thread)
+    asyncio.run(sync_worker.sync_all(None, max_posts=5, workers=4, connect=object))
+    # main.py's sync_news_task(5): threads sync side by side on a share each,
+    # and the shares in flight never add up to more than max_posts
+    assert max(threads for threads, _ in peaks) > 1
+    assert max(limits for _, limits in peaks) <= 5
+    assert sum(processed) == 5
+class FakeListingReddit:
+    """Serves a /new listing of `total` posts, newest first."""
+
+    def __init__(self, total):
+        self.posts = [
+            SimpleNamespace(id=f"n{number}", author="someone", created_utc=1700000000 - number,
+                            title=f"Post {number}", selftext="", score=1, num_comments=0,
+                            is_video=False, url=f"https://example.com/{number}")
+            for number in range(total)
+        ]
+        self.requests = []
+        self.auth = SimpleNamespace(limits={})
+
+    def subreddit(self, thread_id):
+        return self
+
+    def new(self, limit, params=None):
+        after = (params or {}).get("after")
+        self.requests.append(limit)
+        ids = [f"t3_{post.id}" for post in self.posts]
+        start = ids.index(after) + 1 if after else 0
+        return iter(self.posts[start:start + limit])
+
+
+def test_first_walk_at_scheduler_limit_seeds_the_cursor(subscriptions):
+    reddit = FakeListingReddit(50)
+    limit = 5  # main.py runs sync_news_task(5)
+    assert asyncio.run(sync_worker.sync_thread(reddit, "a", limit=limit)) == 5
+    assert asyncio.run(db.get_sync_cursor("a")) == {
+        "fullname": "t3_n0", "created_utc": 1700000000, "gap_after": None}
+
+    # two new posts: the next run probes, stops at the cursor and moves it
+    for number in (1, 2):
+        reddit.posts.insert(0, SimpleNamespace(
+            id=f"new{number}", author="someone", created_utc=1700000000 + number,
+            title="New", selftext="", score=1, num_comments=0, is_video=False,
+            url="https://example.com/new"))
+    reddit.requests.clear()
+    assert asyncio.run(sync_worker.sync_thread(reddit, "a", limit=limit)) == 2
+    assert reddit.requests == [5]
+    assert asyncio.run(db.get_sync_cursor("a"))["fullname"] == "t3_new2"
+
+
+def add_new_posts(reddit, numbers):
+    for number in numbers:
+        reddit.posts.insert(0, SimpleNamespace(
+            id=f"new{number}", author="someone", created_utc=1700000000 + number,
+            title="New", selftext="", score=1, num_comments=0, is_video=False,
+            url="https://example.com/new"))
+
+
+def test_cursor_held_back_when_the_walk_stops_short_of_it(subscriptions):
+    reddit = FakeListingReddit(50)
+    asyncio.run(sync_worker.sync_thread(reddit, "a", limit=5))
+    add_new_posts(reddit, range(1, 8))  # more new posts than the limit
+    asyncio.run(sync_worker.sync_thread(reddit, "a", limit=5))
+    assert asyncio.run(db.get_sync_cursor("a")) == {
+        "fullname": "t3_n0", "created_utc": 1700000000, "gap_after": "t3_new3"}
+
+
+def test_capped_walks_close_the_gap_and_advance_the_cursor(subscriptions):
+    reddit = FakeListingReddit(50)
+    limit = 5
+    asyncio.run(sync_worker.sync_thread(reddit, "a", limit=limit))
+    add_new_posts(reddit, range(1, 13))  # a burst of 12, more than two walks' worth
+
+    reddit.requests.clear()
+    inserted = [asyncio.run(sync_worker.sync_thread(reddit, "a", limit=limit))
+                for _ in range(4)]
+    # new12..new8, then new7..new3 below the gap, then new2, new1 and the
+    # cursor; nothing is fetched twice and the last run is a lone probe
+    assert inserted == [5, 5, 2, 0]
+    assert reddit.requests == [5, 5, 5, 5]
+    assert asyncio.run(db.get_sync_cursor("a")) == {
+        "fullname": "t3_new12", "created_utc": 1700000012, "gap_after": None}
+    stored = asyncio.run(db.get_news_by_thread("a", limit=100))
+    assert {f"new{number}" for number in range(1, 13)} <= {
+        item["external_id"] for item in stored}
+
+    add_new_posts(reddit, [13])
+    assert asyncio.run(sync_worker.sync_thread(reddit, "a", limit=limit)) == 1
+    assert asyncio.run(db.get_sync_cursor("a"))["fullname"] == "t3_new13"
+
+
+class FakeInfoReddit:
+    """Answers /api/info with fresh metrics; 'gone' posts are not returned."""
+
+    def __init__(self, gone=()):
+        self.gone = set(gone)
+        self.requests = []
+        self.auth = SimpleNamespace(limits={})
+
+    def info(self, fullnames):
+        self.requests.append(list(fullnames))
+        for fullname in fullnames:
+            post_id = fullname[3:]
+            if post_id not in self.gone:
+                yield SimpleNamespace(id=post_id, score=1000, num_comments=50)
+
+
+def test_refresh_metrics_updates_due_posts_in_batches(subscriptions):
+    now = int(time.time())
+    posts = [
+        {"external_id": f"p{number}", "thread_id": "a", "created_utc": now - 60,
+         "score": 1, "comment_count": 0}
+        for number in range(150)
+    ]
+    posts.append({"external_id": "old", "thread_id": "a",
+                  "created_utc": now - 30 * 86400, "score": 1, "comment_count": 0})
+    asyncio.run(db.upsert_news_batch(posts))
+
+    async def make_all_due():
+        async with db.get_session() as session:
+            await session.execute(
+                update(News).where(News.metrics_due_at.isnot(None)).values(metrics_due_at=0))
+            await session.commit()
+
+    asyncio.run(make_all_due())
+    reddit = FakeInfoReddit(gone={"p3"})
+    refreshed = asyncio.run(sync_worker.refresh_metrics(reddit))
+
+    assert refreshed == 149
+    assert [len(batch) for batch in reddit.requests] == [100, 50]
+    assert all(name != "t3_old" for batch in reddit.requests for name in batch)
+    news = {item["external_id"]: item for item in asyncio.run(db.get_news_by_thread("a", 200))}
+    assert news["p0"]["score"] == 1000
+    assert news["p3"]["score"] == 1  # deleted post keeps its last metrics
+    assert news["old"]["score"] == 1
+    # every refreshed post moved to its next slot, so nothing is due now
+    assert asyncio.run(db.get_news_due_for_refresh(now)) == []
+
+
+def test_known_media_url_is_not_downloaded_again(subscriptions, tmp_path, monkeypatch):
+    url = "https://i.redd.it/same.png"
+    (tmp_path / "abc.png").write_bytes(b"png")
+    asyncio.run(db.upsert_news_batch([
+        {"external_id": "x1", "thread_id": "a", "created_utc": 1700000000, "media_url": url},
+    ]))
+    asyncio.run(db.add_media(uid_filename="abc.png", original_url=url, content_type="image/png",
+                             size_bytes=3, sha256="abc", kind="image"))
+
+    fetched = []
+
+    async def fake_fetch(url, *args, **kwargs):
+        fetched.append(url)
+        raise sync_worker.md.PermanentDownloadError("known URL fetched again")
+
+    monkeypatch.setattr(sync_worker.md, "fetch_media", fake_fetch)
+    asyncio.run(sync_worker.sync_pending_media(str(tmp_path)))
+    assert fetched == []
+    assert asyncio.run(db.get_pending_media()) == []
+    assert asyncio.run(db.get_media_info("abc.png"))["refcount"] == 1
+
+
+def queue_posts(urls):
+    asyncio.run(db.upsert_news_batch([
+        {"external_id": f"m{number}", "thread_id": "a", "created_utc": 1700000000 + number,
+         "media_url": url}
+        for number, url in enumerate(urls)
+    ]))
+
+
+def media_jobs():
+    async def load():
+        async with db.get_session() as session:
+            rows = await session.execute(select(MediaJob).order_by(MediaJob.id))
+            return {job.news_external_id: job for job in rows.scalars()}
+    return asyncio.run(load())
+
+
+def test_media_queue_backs_off_transient_and_drops_permanent_failures(
+        subscriptions, tmp_path, monkeypatch):
+    queue_posts(["https://i.redd.it/ok.png", "https://i.redd.it/flaky.png",
+                 "https://i.redd.it/gone.png"])
+    calls = []
+
+    async def fake_fetch(url, media_dir, client=None):
+        calls.append(url)
+        if "flaky" in url:
+            raise httpx.ConnectError("connection reset")
+        if "gone" in url:
+            request = httpx.Request("GET", url)
+            raise httpx.HTTPStatusError(
+                "404", request=request, response=httpx.Response(404, request=request))
+        return {"uid_filename": "ok.png", "original_url": url, "content_type": "image/png",
+                "kind": "image", "size_bytes": 1, "sha256": "ok"}
+
+    monkeypatch.setattr(sync_worker.md, "fetch_media", fake_fetch)
+    asyncio.run(sync_worker.sync_pending_media(str(tmp_path)))
+    jobs = media_jobs()
+    assert set(jobs) == {"m1", "m2"}  # the finished job is gone
+    assert (jobs["m1"].status, jobs["m1"].attempts) == ("pending", 1)
+    assert jobs["m1"].next_attempt_at > time.time() + 60
+    assert "ConnectError" in jobs["m1"].last_error
+    assert jobs["m2"].status == "failed"
+
+    # neither job is due again within this cycle
+    asyncio.run(sync_worker.sync_pending_media(str(tmp_path)))
+    assert len(calls) == 3
+
+
+def test_duplicate_download_relinks_post_and_drops_the_file(
+        subscriptions, tmp_path, monkeypatch):
+    queue_posts(["https://i.redd.it/moved.png"])
+    (tmp_path / "old.png").write_bytes(b"old")
+    asyncio.run(db.add_media(uid_filename="old.png", original_url="https://i.redd.it/old.png",
+                             content_type="image/png", size_bytes=3, sha256="old",
+                             kind="image", news_external_id="m0"))
+
+    async def unlink_post():
+        async with db.get_session() as session:
+            await session.execute(
+                update(News).where(News.external_id == "m0").values(media_uid=None))
+            await session.commit()
+
+    asyncio.run(unlink_post())  # the post lost its link but its row is still there
+
+    async def fake_fetch(url, media_dir, client=None):
+        (tmp_path / "new.png").write_bytes(b"new")
+        return {"uid_filename": "new.png", "original_url": url, "content_type": "image/png",
+                "kind": "image", "size_bytes": 3, "sha256": "new"}
+
+    monkeypatch.setattr(sync_worker.md, "fetch_media", fake_fetch)
+    asyncio.run(sync_worker.sync_pending_media(str(tmp_path)))
+    assert asyncio.run(db.get_pending_media()) == []
+    news = asyncio.run(db.get_news_by_thread("a"))
+    assert news[0]["media_uid"] == "old.png"
+    assert not (tmp_path / "new.png").exists()
+    assert media_jobs() == {}
+
+
+def test_media_queue_claims_batches_under_per_host_caps(subscriptions, tmp_path, monkeypatch):
+    queue_posts([f"https://v.redd.it/clip{number}/DASH_720.mp4" for number in range(7)])
+    running, peak, seen = 0, 0, []
+
+    async def fake_fetch(url, media_dir, client=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        seen.append(url)
+        name = url.split("/")[3]
+        return {"uid_filename": f"{name}.mp4", "original_url": url, "content_type": "video/mp4",
+                "kind": "video", "size_bytes": 1, "sha256": name}
+
+    monkeypatch.setattr(sync_worker.md, "fetch_media", fake_fetch)
+    asyncio.run(sync_worker.sync_pending_media(str(tmp_path), max_concurrent=5, batch_size=3))
+    assert len(seen) == 7
+    assert peak == sync_worker.md.HOST_CONCURRENCY["v.redd.it"]
+    assert media_jobs() == {}
+    assert asyncio.run(db.get_pending_media()) == []
@@ -43,3 +43,12 @@ def test_subreddit_link_text_format():
     link_line = caption.split("\n")[1]
     assert link_line.endswith(">r/funnyAnimals</a>")
     assert link_line.startswith('<a href="https://reddit.com/')
+
+
+def test_send_limiter_built_from_env_on_first_call(monkeypatch):
+    # the entry point loads .env after this module was imported
+    monkeypatch.setattr(telegram_publisher, "send_limiter", None)
+    monkeypatch.setenv("TELEGRAM_SENDS_PER_MINUTE", "12")
+    limiter = telegram_publisher.get_send_limiter()
+    assert limiter.interval == 5.0
+    assert telegram_publisher.get_send_limiter() is limiter
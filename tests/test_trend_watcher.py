@@ -1,11 +1,22 @@
 """Parser tests for trend_watcher against saved Atom / old.reddit HTML fixtures."""
+import threading
+
 import pytest
+import requests
 
+import rate_limit
 import trend_watcher
 
 from conftest import FakeResponse
 
 
+@pytest.fixture(autouse=True)
+def unthrottled(monkeypatch):
+    """A fresh, effectively unlimited rate limiter per test."""
+    monkeypatch.setattr(trend_watcher, "rate_limiter",
+                        rate_limit.HostRateLimiter(per_minute=60000, burst=100))
+
+
 class TestParseFeed:
 
     @pytest.fixture
@@ -63,11 +74,11 @@ class TestParseFeed:
 class TestRisingScores:
 
     def test_scores_parsed_from_html(self, monkeypatch, rising_html_text):
-        def fake_get(url, headers=None, timeout=None):
+        def fake_get(url, **kwargs):
             assert url == "https://old.reddit.com/r/ProgrammerHumor/rising/"
             return FakeResponse(rising_html_text)
 
-        monkeypatch.setattr(trend_watcher.requests, "get", fake_get)
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
         scores = trend_watcher.rising_scores("ProgrammerHumor")
         assert scores == {
             "1abc23": 1543,
@@ -78,10 +89,10 @@ class TestRisingScores:
         }
 
     def test_non_200_yields_empty_mapping(self, monkeypatch):
-        def fake_get(url, headers=None, timeout=None):
+        def fake_get(url, **kwargs):
             return FakeResponse("Forbidden", status_code=403)
 
-        monkeypatch.setattr(trend_watcher.requests, "get", fake_get)
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
         assert trend_watcher.rising_scores("ProgrammerHumor") == {}
 
 
@@ -91,11 +102,11 @@ class TestGalleryImageUrls:
             self, monkeypatch, gallery_html_text):
         requested = []
 
-        def fake_get(url, headers=None, timeout=None):
+        def fake_get(url, **kwargs):
             requested.append(url)
             return FakeResponse(gallery_html_text)
 
-        monkeypatch.setattr(trend_watcher.requests, "get", fake_get)
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
         urls = trend_watcher.gallery_image_urls(
             "https://reddit.com/r/ProgrammerHumor/comments/1ghi78/"
             "my_debugging_journey_a_saga/",
@@ -115,10 +126,10 @@ class TestGalleryImageUrls:
         ]
 
     def test_unreachable_page_yields_empty_list(self, monkeypatch):
-        def fake_get(url, headers=None, timeout=None):
+        def fake_get(url, **kwargs):
             return FakeResponse("gone", status_code=404)
 
-        monkeypatch.setattr(trend_watcher.requests, "get", fake_get)
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
         assert trend_watcher.gallery_image_urls(
             "https://reddit.com/r/x/comments/abc/x/", "abc") == []
 
@@ -146,11 +157,11 @@ class TestFetchListing:
     def test_fetch_listing_requests_listing_rss(self, monkeypatch, rising_atom_bytes):
         requested = []
 
-        def fake_get(url, headers=None, timeout=None):
+        def fake_get(url, **kwargs):
             requested.append(url)
             return FakeResponse(rising_atom_bytes)
 
-        monkeypatch.setattr(trend_watcher.requests, "get", fake_get)
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
         candidates = trend_watcher.fetch_listing("ProgrammerHumor", "top:week")
         assert requested == [
             "https://old.reddit.com/r/ProgrammerHumor/top.rss?t=week"]
@@ -159,12 +170,198 @@ class TestFetchListing:
     def test_listing_scores_requests_listing_html(self, monkeypatch, rising_html_text):
         requested = []
 
-        def fake_get(url, headers=None, timeout=None):
+        def fake_get(url, **kwargs):
             requested.append(url)
             return FakeResponse(rising_html_text)
 
-        monkeypatch.setattr(trend_watcher.requests, "get", fake_get)
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
         scores = trend_watcher.listing_scores("ProgrammerHumor", "top:week")
         assert requested == [
             "https://old.reddit.com/r/ProgrammerHumor/top/?t=week"]
         assert scores  # fixture yields a non-empty score map
+
+
+class TestRateLimiter:
+
+    def test_built_from_env_on_first_use(self, monkeypatch):
+        # the entry point loads .env after this module was imported
+        monkeypatch.setattr(trend_watcher, "rate_limiter", None)
+        monkeypatch.setenv("TREND_REQUESTS_PER_MINUTE", "30")
+        limiter = trend_watcher.get_rate_limiter()
+        assert limiter.interval == 2.0
+        assert trend_watcher.get_rate_limiter() is limiter
+
+
+class TestFetchListingWithScores:
+
+    def test_feed_and_scores_fetched_concurrently(
+            self, monkeypatch, rising_atom_bytes, rising_html_text):
+        both_started = threading.Barrier(2, timeout=5)
+
+        def fake_get(url, **kwargs):
+            both_started.wait()  # deadlocks (then fails) if fetched in sequence
+            if url.endswith(".rss"):
+                return FakeResponse(rising_atom_bytes)
+            return FakeResponse(rising_html_text)
+
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
+        candidates, scores = trend_watcher.fetch_listing_with_scores("ProgrammerHumor")
+        assert len(candidates) == 4
+        assert scores["1abc23"] == 1543
+
+    def test_feed_error_still_raises(self, monkeypatch, rising_html_text):
+        def fake_get(url, **kwargs):
+            if url.endswith(".rss"):
+                return FakeResponse("down", status_code=503)
+            return FakeResponse(rising_html_text)
+
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
+        with pytest.raises(RuntimeError, match="503"):
+            trend_watcher.fetch_listing_with_scores("ProgrammerHumor")
+
+
+    def test_score_failure_closes_the_unread_feed(self, monkeypatch, rising_atom_bytes):
+        closed = []
+
+        class TrackedResponse(FakeResponse):
+            def close(self):
+                closed.append(True)
+
+        def fake_get(url, **kwargs):
+            if url.endswith(".rss"):
+                return TrackedResponse(rising_atom_bytes)
+            raise requests.ConnectionError("connection reset")
+
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
+        with pytest.raises(requests.ConnectionError):
+            trend_watcher.fetch_listing_with_scores("ProgrammerHumor", lazy=True)
+        assert closed  # the stream=True feed response is not left open
+
+
+class TestListingCache:
+
+    FEED_URL = "https://old.reddit.com/r/ProgrammerHumor/rising.rss"
+
+    def test_fresh_entry_skips_the_request(self, monkeypatch, rising_atom_bytes):
+        requested = []
+
+        def fake_get(url, **kwargs):
+            requested.append(url)
+            return FakeResponse(rising_atom_bytes)
+
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
+        first = trend_watcher.fetch_listing("ProgrammerHumor")
+        assert trend_watcher.fetch_listing("ProgrammerHumor") == first
+        assert requested == [self.FEED_URL]
+
+    def test_expired_entry_revalidates_and_reuses_parse_on_304(
+            self, monkeypatch, rising_atom_bytes):
+        monkeypatch.setenv("TREND_CACHE_TTL", "0")
+        sent_headers = []
+
+        def fake_get(url, **kwargs):
+            sent_headers.append(kwargs["headers"])
+            if kwargs["headers"]:
+                return FakeResponse(b"", status_code=304)
+            return FakeResponse(rising_atom_bytes, headers={
+                "ETag": '"v1"', "Last-Modified": "Sat, 17 Oct 2026 10:00:00 GMT"})
+
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
+        first = trend_watcher.fetch_listing("ProgrammerHumor")
+        monkeypatch.setattr(trend_watcher, "entry_candidate",
+                            lambda *args: pytest.fail("304 must not re-parse"))
+        assert trend_watcher.fetch_listing("ProgrammerHumor") == first
+        assert sent_headers == [{}, {
+            "If-None-Match": '"v1"',
+            "If-Modified-Since": "Sat, 17 Oct 2026 10:00:00 GMT"}]
+
+    def test_failed_fetch_is_not_cached(self, monkeypatch, trend_cache_dir):
+        def fake_get(url, **kwargs):
+            return FakeResponse("Forbidden", status_code=403)
+
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
+        assert trend_watcher.rising_scores("ProgrammerHumor") == {}
+        assert not trend_cache_dir.exists()
+
+    def test_page_without_scores_is_not_cached(
+            self, monkeypatch, trend_cache_dir, rising_html_text):
+        pages = [b"<html><body>Please wait while we verify you</body></html>",
+                 rising_html_text.encode("utf-8")]
+        requested = []
+
+        def fake_get(url, **kwargs):
+            requested.append(kwargs["headers"])
+            return FakeResponse(pages[len(requested) - 1], headers={"ETag": '"v1"'})
+
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
+        assert trend_watcher.rising_scores("ProgrammerHumor") == {}
+        assert not list(trend_cache_dir.iterdir())
+        assert trend_watcher.rising_scores("ProgrammerHumor")
+        assert requested == [{}, {}]  # refetched unconditionally, not served {}
+
+    def test_empty_streamed_feed_is_not_cached(self, monkeypatch, trend_cache_dir):
+        empty_feed = b'<feed xmlns="http://www.w3.org/2005/Atom"></feed>'
+
+        def fake_get(url, **kwargs):
+            return FakeResponse(empty_feed)
+
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
+        assert list(trend_watcher.fetch_listing("ProgrammerHumor", lazy=True)) == []
+        assert not list(trend_cache_dir.iterdir())
+
+
+class TestPageScanner:
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 16])
+    def test_results_do_not_depend_on_chunking(
+            self, chunk_size, rising_html_text, gallery_html_text):
+        for page in (rising_html_text, gallery_html_text):
+            body = page.encode("utf-8")
+            whole = trend_watcher.scan_page([body])
+            chunked = trend_watcher.scan_page(
+                FakeResponse(body).iter_content(chunk_size))
+            assert chunked.scores == whole.scores
+            assert chunked.tiles == whole.tiles
+            assert chunked.extensions == whole.extensions
+
+    def test_extension_found_after_the_tile(self):
+        scanner = trend_watcher.scan_page([
+            b'<div id="media-tile-1abc-late77"></div>',
+            b'<img src="https://preview.redd.it/late77.pn', b'g?width=640">',
+        ])
+        assert scanner.gallery_urls("1abc") == ["https://i.redd.it/late77.png"]
+
+
+class TestStreamingFeed:
+
+    def test_chunked_feed_parses_like_whole_bytes(self, rising_atom_bytes):
+        chunks = FakeResponse(rising_atom_bytes).iter_content(5)
+        assert trend_watcher.parse_feed("ProgrammerHumor", chunks) == (
+            trend_watcher.parse_feed("ProgrammerHumor", rising_atom_bytes))
+
+    def test_early_exit_stops_parsing_but_caches_the_whole_body(
+            self, monkeypatch, rising_atom_bytes):
+        monkeypatch.setenv("TREND_CACHE_TTL", "0")
+        built = []
+        entry_candidate = trend_watcher.entry_candidate
+
+        def counting(subreddit, entry):
+            built.append(1)
+            return entry_candidate(subreddit, entry)
+
+        def fake_get(url, **kwargs):
+            if kwargs["headers"]:
+                return FakeResponse(b"", status_code=304)
+            return FakeResponse(rising_atom_bytes, headers={"ETag": '"v1"'})
+
+        monkeypatch.setattr(trend_watcher, "entry_candidate", counting)
+        monkeypatch.setattr(trend_watcher.session, "get", fake_get)
+        candidates = trend_watcher.fetch_listing("ProgrammerHumor", lazy=True)
+        first = next(iter(candidates))
+        candidates.close()
+        assert len(built) == 1
+
+        # the unparsed rest was still stored: a 304 re-parses it from disk
+        again = trend_watcher.fetch_listing("ProgrammerHumor", lazy=True)
+        assert [candidate["title"] for candidate in again][0] == first["title"]
+        assert len(built) == 5
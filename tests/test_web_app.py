@@ -0,0 +1,132 @@
+"""Route tests for the web UI through Flask's test client on a temporary database."""
+import re
+from pathlib import Path
+
+import pytest
+
+from web import app as web_app
+
+
+def make_post(external_id, created_utc=1700000000):
+    return {
+        "external_id": external_id,
+        "thread_id": "ProgrammerHumor",
+        "author": "someone",
+        "created_utc": created_utc,
+        "title": f"Post {external_id}",
+        "body": "",
+        "media_url": None,
+        "score": 10,
+        "comment_count": 1,
+        "raw_json": external_id,
+    }
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("DEFAULT_SUBSCRIPTIONS", "ProgrammerHumor,linuxmemes")
+    monkeypatch.setattr(web_app, "DB_PATH", str(tmp_path / "news.db"))
+    media_dir = tmp_path / "media"
+    media_dir.mkdir()
+    monkeypatch.setattr(web_app, "MEDIA_DIR", str(media_dir))
+    web_app.app.config["TESTING"] = True
+    yield web_app.app.test_client()
+    web_app.stop_database()
+
+
+def seed(posts):
+    web_app.run_async(web_app.db.upsert_news_batch(posts))
+
+
+def older_link(page):
+    match = re.search(r'href="([^"]*before=[^"]*)">Older', page)
+    return match.group(1).replace("&amp;", "&") if match else None
+
+
+def test_database_starts_on_first_request_not_at_import(client):
+    assert web_app.db_loop is None
+    assert client.get("/").status_code == 200
+    assert web_app.db_loop is not None
+
+
+def test_index_lists_posts_and_pages_by_cursor(client, monkeypatch):
+    monkeypatch.setattr(web_app, "PAGE_SIZE", 2)
+    seed([make_post(f"p{number}") for number in range(3)])
+
+    first = client.get("/").get_data(as_text=True)
+    assert first.count('class="news-item"') == 2
+    second = client.get(older_link(first)).get_data(as_text=True)
+    assert second.count('class="news-item"') == 1
+    assert older_link(second) is None
+
+
+def test_thread_listing_pages_past_posts_without_creation_time(client, monkeypatch):
+    monkeypatch.setattr(web_app, "PAGE_SIZE", 1)
+    seed([make_post("dated"), make_post("undated1", None), make_post("undated2", None)])
+
+    seen, url = [], "/subscriptions/ProgrammerHumor"
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_data(as_text=True)
+        seen += re.findall(r"Post (\w+)", page)
+        url = older_link(page)
+    assert seen == ["dated", "undated2", "undated1"]
+
+
+def test_garbage_cursor_is_a_bad_request(client):
+    assert client.get("/?before=yesterday").status_code == 400
+    assert client.get("/subscriptions/ProgrammerHumor?before=12_x").status_code == 400
+
+
+def test_subscriptions_page_lists_every_subscription(client):
+    page = client.get("/subscriptions").get_data(as_text=True)
+    assert "ProgrammerHumor" in page and "linuxmemes" in page
+
+
+def test_missing_news_item_is_not_found(client):
+    assert client.get("/news/999999").status_code == 404
+
+
+MP4_BYTES = b"\x00\x00\x00\x18ftypmp42" + bytes(range(256)) * 4
+
+
+def save_media(name, body):
+    (Path(web_app.MEDIA_DIR) / name).write_bytes(body)
+
+
+def test_media_range_request_gets_partial_content(client, monkeypatch):
+    monkeypatch.setattr(web_app, "MEDIA_OFFLOAD", "")
+    save_media("clip.mp4", MP4_BYTES)
+
+    response = client.get("/media/clip.mp4", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == f"bytes 100-199/{len(MP4_BYTES)}"
+    assert response.data == MP4_BYTES[100:200]
+    assert response.mimetype == "video/mp4"
+    assert client.get("/media/clip.mp4").data == MP4_BYTES
+
+
+def test_media_offload_to_nginx(client, monkeypatch):
+    monkeypatch.setattr(web_app, "MEDIA_OFFLOAD", "x-accel")
+    monkeypatch.setattr(web_app, "MEDIA_ACCEL_PREFIX", "/protected-media/")
+    save_media("clip one.mp4", MP4_BYTES)
+
+    response = client.get("/media/clip one.mp4")
+    assert response.status_code == 200
+    assert response.headers["X-Accel-Redirect"] == "/protected-media/clip%20one.mp4"
+    assert "X-Sendfile" not in response.headers
+    assert response.mimetype == "video/mp4"
+    assert response.data == b""
+
+
+def test_media_offload_to_sendfile(client, monkeypatch):
+    monkeypatch.setattr(web_app, "MEDIA_OFFLOAD", "x-sendfile")
+    save_media("clip.mp4", MP4_BYTES)
+
+    response = client.get("/media/clip.mp4")
+    assert response.status_code == 200
+    assert response.headers["X-Sendfile"] == str(Path(web_app.MEDIA_DIR) / "clip.mp4")
+    assert "X-Accel-Redirect" not in response.headers
+    assert response.data == b""
+
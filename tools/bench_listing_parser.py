@@ -0,0 +1,120 @@
+"""Compare the streaming page scanner with the old regex-over-text parsing.
+
+Runs both on the saved old.reddit fixtures and on synthetic pages scaled up
+to a 100-post listing and a large gallery, checks they agree, and prints
+the time per page.
+
+Example:
+    python tools/bench_listing_parser.py --gallery-tiles 400 --repeat 20
+"""
+import argparse
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+import trend_watcher
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / "tests" / "fixtures"
+
+# The parsing listing_scores and gallery_image_urls did before the scanner
+LEGACY_THING_RE = re.compile(r'<div\b([^>]*\bdata-fullname="t3_[a-z0-9]+"[^>]*)>')
+LEGACY_FULLNAME_RE = re.compile(r'data-fullname="t3_([a-z0-9]+)"')
+LEGACY_SCORE_RE = re.compile(r'data-score="(-?\d+)"')
+LEGACY_MEDIA_TILE_RE = re.compile(r'id="media-tile-([a-z0-9]+)-([A-Za-z0-9]+)"')
+
+
+def legacy_scores(body):
+    page = body.decode("utf-8", "replace")
+    scores = {}
+    for attrs in LEGACY_THING_RE.findall(page):
+        fullname = LEGACY_FULLNAME_RE.search(attrs)
+        score = LEGACY_SCORE_RE.search(attrs)
+        if fullname and score:
+            scores[fullname.group(1)] = int(score.group(1))
+    return scores
+
+
+def legacy_gallery_urls(body, post_id):
+    page = body.decode("utf-8", "replace")
+    urls = []
+    seen = set()
+    for tile_post, media_id in LEGACY_MEDIA_TILE_RE.findall(page):
+        if tile_post != post_id or media_id in seen:
+            continue
+        seen.add(media_id)
+        extension = re.search(re.escape(media_id) + r"\.(jpg|jpeg|png|gif)", page)
+        urls.append(f"https://i.redd.it/{media_id}.{extension.group(1) if extension else 'jpg'}")
+    return urls
+
+
+def chunks(body):
+    return [body[start:start + trend_watcher.SCAN_CHUNK]
+            for start in range(0, len(body), trend_watcher.SCAN_CHUNK)]
+
+
+def big_listing(posts):
+    """A listing page with the fixture's first thing repeated `posts` times."""
+    page = (FIXTURES_DIR / "rising.html").read_text(encoding="utf-8")
+    start = page.index('<div class="thing')
+    end = page.index('<div class="thing', start + 1)
+    thing = page[start:end]
+    things = "".join(thing.replace("1abc23", f"p{number:05d}") for number in range(posts))
+    return (page[:start] + things + page[end:]).encode("utf-8")
+
+
+def big_gallery(tiles):
+    """A gallery page with `tiles` tiles, each image referenced by a preview URL."""
+    page = (FIXTURES_DIR / "gallery.html").read_text(encoding="utf-8")
+    marker = '<div class="gallery-tiles">'
+    tile_markup = "".join(
+        f'<div class="media-preview gallery-tile" id="media-tile-1ghi78-m{number:05d}">'
+        f'<a href="https://preview.redd.it/m{number:05d}.png?width=1080&amp;s=ab12">'
+        f'<img src="https://preview.redd.it/m{number:05d}.png?width=640&amp;s=cd34"/></a>'
+        f'</div>\n' for number in range(tiles))
+    return page.replace(marker, marker + tile_markup).encode("utf-8")
+
+
+def best_of(function, repeat):
+    return min(timeit.repeat(function, number=1, repeat=repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--gallery-tiles", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    listings = {
+        "rising.html": (FIXTURES_DIR / "rising.html").read_bytes(),
+        f"listing x{args.posts}": big_listing(args.posts),
+    }
+    galleries = {
+        "gallery.html": (FIXTURES_DIR / "gallery.html").read_bytes(),
+        f"gallery x{args.gallery_tiles}": big_gallery(args.gallery_tiles),
+    }
+
+    print(f"{'page':<20} {'bytes':>9} {'legacy ms':>10} {'scanner ms':>11} {'speedup':>8}")
+    for name, body in listings.items():
+        parts = chunks(body)
+        assert legacy_scores(body) == trend_watcher.parse_scores(parts), name
+        legacy = best_of(lambda: legacy_scores(body), args.repeat)
+        scanner = best_of(lambda: trend_watcher.parse_scores(parts), args.repeat)
+        print(f"{name:<20} {len(body):>9} {legacy * 1000:>10.3f} "
+              f"{scanner * 1000:>11.3f} {legacy / scanner:>7.1f}x")
+    for name, body in galleries.items():
+        parts = chunks(body)
+        expected = legacy_gallery_urls(body, "1ghi78")
+        assert trend_watcher.scan_page(parts).gallery_urls("1ghi78") == expected, name
+        legacy = best_of(lambda: legacy_gallery_urls(body, "1ghi78"), args.repeat)
+        scanner = best_of(
+            lambda: trend_watcher.scan_page(parts).gallery_urls("1ghi78"), args.repeat)
+        print(f"{name:<20} {len(body):>9} {legacy * 1000:>10.3f} "
+              f"{scanner * 1000:>11.3f} {legacy / scanner:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,116 +4,228 @@ This module provides a web interface for browsing downloaded Reddit content.
 Uses SQLAlchemy ORM for database operations and supports various media types.
 """
 import asyncio
-import io
+import atexit
+import concurrent.futures
+import contextvars
 import logging
 import os
+import threading
+from datetime import datetime
 from pathlib import Path
 import sys
+from urllib.parse import quote
 
-from flask import Flask, render_template, send_from_directory, url_for, redirect, send_file, abort
-from PIL import Image, ImageDraw, ImageFont
+from flask import (
+    Flask, render_template, send_from_directory, url_for, redirect, send_file, abort, request,
+)
+from PIL import Image
 from sqlalchemy import select
-import magic
-import fitz  # PyMuPDF for PDF processing
 
 # Add the app directory to Python path for ORM imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
 
 from app import db
-from app.config import database_path, media_dir_path
-from app.models import News, Subscription
+from app.config import (
+    DEFAULT_RENDITIONS_MAX_BYTES, database_path, media_dir_path, renditions_dir_path,
+)
+from app.models import News
+from app.utils import SNIFF_BYTES, media_kind, sniff_media_type
+from web import renditions
 
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-
 # Configuration — same env-driven paths as the sync engine (DB_PATH,
 # MEDIA_DIR), so both parts always open the same files
 MEDIA_DIR = str(media_dir_path())
 DB_PATH = str(database_path())
 
-# Global variable to track if database is initialized
-db_initialized = False
+# Items per listing page
+PAGE_SIZE = 50
+
+# Previews and thumbnails rendered from media files, cached on disk and
+# evicted least-recently-used past RENDITIONS_MAX_BYTES
+rendition_cache = renditions.RenditionCache(
+    renditions_dir_path(),
+    int(os.getenv('RENDITIONS_MAX_BYTES', DEFAULT_RENDITIONS_MAX_BYTES)),
+)
+# Media uid filenames are never reused, so originals are immutable too
+MEDIA_MAX_AGE = 7 * 86400
+
+# MEDIA_OFFLOAD hands original media files to a front proxy instead of
+# streaming them from Python workers: "x-accel" for nginx (X-Accel-Redirect to
+# an internal location MEDIA_ACCEL_PREFIX aliased to MEDIA_DIR), "x-sendfile"
+# for Apache mod_xsendfile / lighttpd. The proxy then answers Range and
+# conditional requests itself with sendfile. Empty serves from Python, with
+# Range (206) support.
+MEDIA_OFFLOAD_MODES = ('', 'x-accel', 'x-sendfile')
+MEDIA_OFFLOAD = os.getenv('MEDIA_OFFLOAD', '').strip().lower()
+if MEDIA_OFFLOAD not in MEDIA_OFFLOAD_MODES:
+    raise ValueError(f"MEDIA_OFFLOAD must be one of {MEDIA_OFFLOAD_MODES}, got {MEDIA_OFFLOAD!r}")
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/protected-media/')
+
+# Renditions never change for a media file, so browsers may reuse them for a
+# day before revalidating with If-None-Match / If-Modified-Since
+RENDITION_MAX_AGE = 86400
+
+# One event loop thread per process owns the async engine and its connection
+# pool; request threads hand their database coroutines over to it. aiosqlite
+# connections are bound to the loop that opened them, so a shared long-lived
+# pool needs a single long-lived loop. Started by the first run_async.
+db_loop = None
+db_start_lock = threading.Lock()
+
+
+def submit(coro):
+    """Schedule a coroutine on the database loop; returns a concurrent Future.
+
+    The coroutine runs in a copy of the calling thread's context, so Flask's
+    request and app contexts stay visible inside it.
+    """
+    context = contextvars.copy_context()
+    done = concurrent.futures.Future()
+
+    def copy_outcome(task):
+        if task.cancelled():
+            done.cancel()
+        elif task.exception() is not None:
+            done.set_exception(task.exception())
+        else:
+            done.set_result(task.result())
 
+    def start():
+        db_loop.create_task(coro, context=context).add_done_callback(copy_outcome)
 
-async def ensure_db_initialized():
-    """Ensure database is initialized for web interface."""
-    global db_initialized
-    if not db_initialized:
-        await db.init_db(DB_PATH)
-        db_initialized = True
+    db_loop.call_soon_threadsafe(start)
+    return done
 
 
 def run_async(coro):
-    """Helper to run async functions in Flask routes."""
-    loop = None
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
+    """Run a database coroutine on the database loop and wait for its result.
+
+    Views call this for their queries only and render templates in their own
+    request thread, so the loop never spends time on anything but I/O.
+    """
+    if db_loop is None:
+        start_database()
+    return submit(coro).result()
+
+
+app = Flask(__name__)
+
+
+def start_database():
+    """Start the database loop and open the engine once for the process lifetime.
+
+    Runs on the first database access, i.e. in every WSGI worker process
+    after the fork, so the loop thread also survives gunicorn --preload.
+    """
+    global db_loop
+    with db_start_lock:
+        if db_loop is not None:
+            return
         loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    
-    return loop.run_until_complete(coro)
+        threading.Thread(target=loop.run_forever, name='db-loop', daemon=True).start()
+        db_loop = loop
+        try:
+            submit(db.init_db(DB_PATH)).result()
+        except BaseException:
+            db_loop = None
+            loop.call_soon_threadsafe(loop.stop)
+            raise
+
+
+def stop_database():
+    """Dispose the engine and stop the database loop (at interpreter exit)."""
+    global db_loop
+    with db_start_lock:
+        if db_loop is None:
+            return
+        try:
+            submit(db.close_db()).result()
+        except Exception:
+            logger.exception("Error closing database connections")
+        db_loop.call_soon_threadsafe(db_loop.stop)
+        db_loop = None
+
+
+atexit.register(stop_database)
+
+
+def encode_cursor(cursor):
+    """Turn a (sort key, id) keyset cursor into a URL parameter.
+
+    A NULL sort key (a post without created_utc) encodes as an empty key.
+    """
+    if cursor is None:
+        return None
+    key, news_id = cursor
+    if key is None:
+        key = ''
+    elif isinstance(key, datetime):
+        key = key.isoformat()
+    return f'{key}_{news_id}'
+
+
+def decode_cursor(value, parse_key):
+    """Parse the ?before= parameter back into a cursor; 400 on garbage."""
+    if not value:
+        return None
+    key, sep, news_id = value.rpartition('_')
+    if not sep:
+        abort(400)
+    try:
+        return (parse_key(key) if key else None), int(news_id)
+    except ValueError:
+        abort(400)
 
 
 @app.route('/')
 def index():
-    """Main page showing list of news items."""
-    async def get_news_data():
-        await ensure_db_initialized()
-        # Get all news items ordered by newest first
-        async with db.get_session() as session:
-            stmt = select(News).order_by(News.added_at.desc()).limit(100)
-            result = await session.execute(stmt)
-            news_items = result.scalars().all()
-            
-            return [
-                {
-                    'id': item.id,
-                    'title': item.title or 'No title',
-                    'external_id': item.external_id,
-                    'media_uid': item.media_uid,
-                    'author': item.author,
-                    'added_at': item.added_at,
-                    'thread_id': item.thread_id
-                }
-                for item in news_items
-            ]
-    
-    news = run_async(get_news_data())
-    return render_template('index.html', news=news)
+    """Main page showing list of news items, one keyset page at a time."""
+    before = decode_cursor(request.args.get('before'), datetime.fromisoformat)
+    news, next_cursor = run_async(db.get_news_page(before=before, limit=PAGE_SIZE))
+    return render_template('index.html', news=news, next_cursor=encode_cursor(next_cursor))
+
+
+@app.route('/subscriptions/<thread_id>')
+def thread_news(thread_id):
+    """News of one subscription, newest post first, one keyset page at a time."""
+    before = decode_cursor(request.args.get('before'), int)
+    news, next_cursor = run_async(
+        db.get_thread_news_page(thread_id, before=before, limit=PAGE_SIZE))
+    return render_template('index.html', news=news, next_cursor=encode_cursor(next_cursor),
+                           thread_id=thread_id)
+
+
+async def load_news(news_id):
+    async with db.get_session() as session:
+        stmt = select(News).where(News.id == news_id)
+        result = await session.execute(stmt)
+        return result.scalar_one_or_none()
 
 
 @app.route('/news/<int:news_id>')
 def news_detail(news_id):
     """Detail page for a specific news item."""
-    async def get_news_detail():
-        await ensure_db_initialized()
-        async with db.get_session() as session:
-            stmt = select(News).where(News.id == news_id)
-            result = await session.execute(stmt)
-            item = result.scalar_one_or_none()
-            
-            if item:
-                return {
-                    'id': item.id,
-                    'title': item.title,
-                    'body': item.body,
-                    'author': item.author,
-                    'external_id': item.external_id,
-                    'media_uid': item.media_uid,
-                    'media_url': item.media_url,
-                    'created_utc': item.created_utc,
-                    'added_at': item.added_at,
-                    'thread_id': item.thread_id,
-                    'raw_json': item.raw_json
-                }
-            return None
-    
-    item = run_async(get_news_detail())
+    item = run_async(load_news(news_id))
+
     if not item:
         abort(404)
-    
+
+    item = {
+        'id': item.id,
+        'title': item.title,
+        'body': item.body,
+        'author': item.author,
+        'external_id': item.external_id,
+        'media_uid': item.media_uid,
+        'media_url': item.media_url,
+        'created_utc': item.created_utc,
+        'added_at': item.added_at,
+        'thread_id': item.thread_id,
+        'raw_json': item.raw_json
+    }
+
     media_url = None
     if item['media_uid']:
         media_url = url_for('media_file', filename=item['media_uid'])
@@ -124,30 +236,13 @@ def news_detail(news_id):
 @app.route('/subscriptions')
 def subscriptions():
     """Page showing all subscriptions."""
-    async def get_subscriptions_data():
-        await ensure_db_initialized()
-        async with db.get_session() as session:
-            stmt = select(Subscription).order_by(Subscription.added_at.desc())
-            result = await session.execute(stmt)
-            subs = result.scalars().all()
-            
-            return [
-                {
-                    'id': sub.id,
-                    'thread_id': sub.thread_id,
-                    'title': sub.title,
-                    'added_at': sub.added_at
-                }
-                for sub in subs
-            ]
-    
-    subs = run_async(get_subscriptions_data())
+    subs = run_async(db.get_subscriptions())
+    subs.sort(key=lambda sub: sub['added_at'], reverse=True)
     return render_template('subscriptions.html', subscriptions=subs)
 
 
-@app.route('/media/<path:filename>')
-def media_file(filename):
-    """Serve media files with appropriate processing."""
+def media_path(filename):
+    """Absolute path of a media file; 404 unless it exists inside MEDIA_DIR."""
     file_path = os.path.join(MEDIA_DIR, filename)
 
     # <path:> accepts "../" sequences and the fallbacks below open the raw
@@ -157,63 +252,99 @@ def media_file(filename):
 
     if not os.path.exists(file_path):
         abort(404)
-    
-    # Check file mime-type
-    mime = magic.Magic(mime=True).from_file(file_path)
-    
-    # For images and videos return as is
-    if mime and (mime.startswith('image/') or mime.startswith('video/')):
-        return send_from_directory(MEDIA_DIR, filename)
-    
-    # For HTML and .bin files with HTML content
-    if mime == 'text/html' or filename.endswith('.bin'):
-        # List of encodings to check
-        encodings = ['utf-8', 'latin1', 'cp1251', 'iso-8859-1']
-        html_markers = ['<!DOCTYPE html>', '<html', '<head>', '<body>', '<div', '<p>']
-        
-        for encoding in encodings:
-            try:
-                with open(file_path, 'r', encoding=encoding) as f:
-                    content = f.read()
-                    # Check various HTML content markers
-                    if any(marker in content.lower() for marker in html_markers):
-                        return content, {'Content-Type': f'text/html; charset={encoding}'}
-            except UnicodeDecodeError:
-                continue  # Try next encoding
-    
-    # For PDF files generate preview of first page
+    return file_path
+
+
+def send_media(filename, file_path, mime):
+    """Serve an original media file, or tell the front proxy to serve it."""
+    if MEDIA_OFFLOAD:
+        response = app.response_class(mimetype=mime)
+        if MEDIA_OFFLOAD == 'x-accel':
+            response.headers['X-Accel-Redirect'] = (
+                MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + quote(filename))
+        else:
+            response.headers['X-Sendfile'] = os.path.abspath(file_path)
+        response.cache_control.public = True
+        response.cache_control.max_age = MEDIA_MAX_AGE
+        return response
+    # conditional: If-None-Match / If-Modified-Since and Range -> 206, so
+    # browsers can seek in videos without fetching the whole file
+    return send_from_directory(MEDIA_DIR, filename, mimetype=mime, conditional=True,
+                               max_age=MEDIA_MAX_AGE)
+
+
+def send_rendition(rendition):
+    """Serve a cached rendition with validators for conditional GET."""
+    path, mimetype = rendition
+    return send_file(path, mimetype=mimetype, conditional=True, etag=True,
+                     max_age=RENDITION_MAX_AGE)
+
+
+def render_preview(file_path, filename, mime):
+    """Full-size still for media the browser cannot show as is."""
     if mime == 'application/pdf':
         try:
-            pdf_document = fitz.open(file_path)
-            if pdf_document.page_count > 0:
-                page = pdf_document[0]
-                pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x scale for quality
-                img_data = Image.frombytes('RGB', [pix.width, pix.height], pix.samples)
-                buf = io.BytesIO()
-                img_data.save(buf, format='PNG')
-                buf.seek(0)
-                return send_file(buf, mimetype='image/png')
+            img = renditions.render_pdf_page(file_path)
+            if img is not None:
+                return img
         except Exception:
             logger.exception("PDF preview failed for %s", file_path)
-    
     try:
-        # Try to open as image
         with Image.open(file_path) as img:
-            buf = io.BytesIO()
-            img.save(buf, format='PNG')
-            buf.seek(0)
-            return send_file(buf, mimetype='image/png')
+            img.load()
+            return img
     except (OSError, ValueError):
-        # If nothing worked, generate preview with file information
-        img = Image.new('RGB', (400, 200), color=(200, 200, 200))
-        d = ImageDraw.Draw(img)
-        font = ImageFont.load_default()
-        text = f'File: {filename}\nType: {mime}'
-        d.multiline_text((10, 80), text, fill=(0, 0, 0), font=font, align='center')
-        buf = io.BytesIO()
-        img.save(buf, format='PNG')
-        buf.seek(0)
-        return send_file(buf, mimetype='image/png')
+        # If nothing worked, show the file information instead
+        return renditions.render_placeholder(filename, mime)
+
+
+def media_type(filename, file_path):
+    """(content type, kind) of a media file as detected at download time.
+
+    Files downloaded before the media table tracked kinds are sniffed from
+    their first bytes once and the result stored back.
+    """
+    info = run_async(db.get_media_info(filename))
+    if info and info['kind']:
+        return info['content_type'], info['kind']
+    with open(file_path, 'rb') as f:
+        mime = sniff_media_type(f.read(SNIFF_BYTES), info and info['content_type'])
+    kind = media_kind(mime)
+    if info:
+        run_async(db.set_media_type(filename, mime, kind))
+    return mime, kind
+
+
+@app.route('/media/<path:filename>')
+def media_file(filename):
+    """Serve media files with appropriate processing."""
+    file_path = media_path(filename)
+    mime, kind = media_type(filename, file_path)
+
+    # Images, videos and saved HTML pages go out as they are
+    if kind in ('image', 'video', 'html'):
+        return send_media(filename, file_path, mime)
+
+    # PDF first page, PNG re-encode or placeholder card, rendered once
+    return send_rendition(rendition_cache.get(
+        filename, 'preview', 'png', lambda: render_preview(file_path, filename, mime)))
+
+
+@app.route('/thumb/<path:filename>')
+def thumb(filename):
+    """Small JPEG thumbnail of a media file for listings (?w= width in px)."""
+    file_path = media_path(filename)
+    width = renditions.thumb_width(request.args.get('w', type=int))
+
+    def render():
+        mime, kind = media_type(filename, file_path)
+        if kind in ('video', 'html'):
+            img = renditions.render_placeholder(filename, mime)
+        else:
+            img = render_preview(file_path, filename, mime)
+        return renditions.shrink_to_width(img, width)
+
+    return send_rendition(rendition_cache.get(filename, f'w{width}', 'jpeg', render))
 
 
 @app.route('/back')
@@ -222,16 +353,6 @@ def go_back():
     return redirect(url_for('index'))
 
 
-@app.teardown_appcontext
-def close_db_connections(error):
-    """Clean up database connections."""
-    if db_initialized:
-        try:
-            run_async(db.close_db())
-        except Exception:
-            logger.exception("Error closing database connections")
-
-
 if __name__ == '__main__':
     # The Werkzeug debugger allows remote code execution if the port is
     # reachable, so debug stays off unless FLASK_DEBUG opts in explicitly.
@@ -0,0 +1,164 @@
+"""Derived image renditions of media files, rendered once and cached on disk.
+
+PDF first-page previews, PNG re-encodes of odd image formats, placeholder
+cards and listing thumbnails are all expensive to produce and never change
+for a given media file (uid filenames are never reused). Each rendition is
+written once into a directory next to MEDIA_DIR, keyed by the media filename
+plus the rendition spec, and evicted least-recently-used once the directory
+grows past its size bound.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from PIL import Image, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+# Widths /thumb/ renders; requested widths snap up to the next one so the
+# cache holds at most this many thumbnails per media file
+THUMB_WIDTHS = (160, 320, 640)
+DEFAULT_THUMB_WIDTH = 320
+
+# Scale for PDF first-page previews (2x for readable text)
+PDF_PREVIEW_ZOOM = 2
+
+# (Pillow format, file extension, mimetype) per output format
+FORMATS = {
+    'png': ('PNG', 'png', 'image/png'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+
+
+def thumb_width(requested):
+    """Snap a requested thumbnail width to one of THUMB_WIDTHS."""
+    if requested is None:
+        return DEFAULT_THUMB_WIDTH
+    for width in THUMB_WIDTHS:
+        if requested <= width:
+            return width
+    return THUMB_WIDTHS[-1]
+
+
+def render_pdf_page(file_path):
+    """Render the first page of a PDF as an RGB image, or None if it has none."""
+    import fitz  # PyMuPDF, only needed on a cache miss
+
+    with fitz.open(file_path) as pdf_document:
+        if pdf_document.page_count == 0:
+            return None
+        zoom = fitz.Matrix(PDF_PREVIEW_ZOOM, PDF_PREVIEW_ZOOM)
+        pix = pdf_document[0].get_pixmap(matrix=zoom)
+        return Image.frombytes('RGB', [pix.width, pix.height], pix.samples)
+
+
+def render_placeholder(filename, mime, size=(400, 200)):
+    """Grey card naming the file and its type, for media we cannot picture."""
+    img = Image.new('RGB', size, color=(200, 200, 200))
+    d = ImageDraw.Draw(img)
+    font = ImageFont.load_default()
+    text = f'File: {filename}\nType: {mime}'
+    d.multiline_text((10, size[1] // 2 - 20), text, fill=(0, 0, 0), font=font, align='center')
+    return img
+
+
+def shrink_to_width(img, width):
+    """Scale an image down (never up) to the given width, keeping its aspect."""
+    if img.width > width:
+        height = max(1, round(img.height * width / img.width))
+        img = img.resize((width, height), Image.Resampling.LANCZOS)
+    return img
+
+
+class RenditionCache:
+    """Size-bounded, least-recently-used store of rendered images.
+
+    Entries are plain files named ``<media filename>.<spec>.<ext>``. A hit
+    stamps the file's access time, and eviction removes the entries with
+    the oldest access time first; the modification time is left alone so
+    Last-Modified and ETag stay stable for conditional GETs. Files are
+    written under a temporary name and renamed into place, so concurrent
+    requests and worker processes never serve a half-written rendition.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.size = None  # bytes on disk, counted on first write
+
+    def path_for(self, filename, spec, fmt):
+        return self.directory / f'{filename}.{spec}.{FORMATS[fmt][1]}'
+
+    def get(self, filename, spec, fmt, render):
+        """Return (path, mimetype) of a rendition, rendering it on a miss.
+
+        render() returns a PIL image, or None when the source cannot be
+        rendered, in which case get() returns None and caches nothing.
+        """
+        path = self.path_for(filename, spec, fmt)
+        mimetype = FORMATS[fmt][2]
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            pass
+        else:
+            os.utime(path, (time.time(), mtime))
+            return path, mimetype
+
+        img = render()
+        if img is None:
+            return None
+        self.store(path, img, fmt)
+        return path, mimetype
+
+    def store(self, path, img, fmt):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if fmt == 'jpeg' and img.mode != 'RGB':
+            img = img.convert('RGB')
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                img.save(f, format=FORMATS[fmt][0])
+            os.replace(tmp_name, path)
+        except BaseException:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+        with self.lock:
+            if self.size is None:
+                self.size = self.disk_usage()
+            else:
+                self.size += path.stat().st_size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def disk_usage(self):
+        return sum(entry.stat().st_size for entry in self.directory.iterdir()
+                   if entry.is_file())
+
+    def evict(self):
+        """Delete least recently used renditions until under max_bytes.
+
+        Recounts from disk first: other worker processes share the directory.
+        Caller holds self.lock.
+        """
+        entries = []
+        for entry in self.directory.iterdir():
+            if entry.suffix == '.tmp':
+                continue  # still being written
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, entry))
+        entries.sort()
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if self.size <= self.max_bytes:
+                break
+            entry.unlink(missing_ok=True)
+            self.size -= size
+            logger.debug("Evicted rendition %s", entry.name)